@@ -1,14 +1,32 @@
 from .client import MarbleClient
-from .exceptions import JupyterEnvironmentError, MarbleBaseError, ServiceNotAvailableError, UnknownNodeError
+from .exceptions import (
+    JupyterEnvironmentError,
+    MarbleBaseError,
+    RegistryConflictError,
+    ServiceNotAvailableError,
+    UnknownNodeError,
+)
+from .metrics import InMemoryCollector, OpenTelemetryCollector, RequestRecord, StatsCollector
 from .node import MarbleNode
+from .nodeview import NodeView
+from .prefetch import load_ipython_extension
+from .ratelimit import RateLimit
 from .services import MarbleService
 
 __all__ = [
     "MarbleClient",
     "JupyterEnvironmentError",
     "MarbleBaseError",
+    "RegistryConflictError",
     "ServiceNotAvailableError",
     "UnknownNodeError",
     "MarbleNode",
+    "NodeView",
     "MarbleService",
+    "InMemoryCollector",
+    "OpenTelemetryCollector",
+    "RequestRecord",
+    "StatsCollector",
+    "RateLimit",
+    "load_ipython_extension",
 ]
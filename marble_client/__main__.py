@@ -0,0 +1,5 @@
+import sys
+
+from marble_client.cli import main
+
+sys.exit(main())
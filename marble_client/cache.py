@@ -0,0 +1,545 @@
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Iterator, Optional
+from urllib.parse import quote
+
+from marble_client import constants
+from marble_client.utils import compress, decompress
+
+__all__ = [
+    "CacheBackend",
+    "CacheWriter",
+    "CachedRegistry",
+    "FileCacheBackend",
+    "MemoryCacheBackend",
+    "KeyValueCacheBackend",
+    "ShardedFileCacheBackend",
+    "ShardedRegistry",
+    "get_cache_backend",
+]
+
+# keys of the registry cache format (see _serialize_registry_cache)
+REGISTRY_CACHE_KEY = "marble_client_python:cached_registry"
+REGISTRY_CACHE_LAST_UPDATED_KEY = "marble_client_python:last_updated"
+
+
+def _serialize_registry_cache(
+    registry: dict[str, Any], last_updated: Optional[str] = None, compression: Optional[str] = None
+) -> bytes:
+    """Return the registry in the registry cache format, compressed with CACHE_COMPRESSION by default."""
+    if last_updated is None:
+        last_updated = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+    data = {REGISTRY_CACHE_KEY: registry, REGISTRY_CACHE_LAST_UPDATED_KEY: last_updated}
+    return compress(json.dumps(data).encode(), constants.CACHE_COMPRESSION if compression is None else compression)
+
+
+def _parse_registry_cache(data: bytes) -> tuple[dict[str, Any], Optional[str]]:
+    """
+    Parse a (decompressed) value in the registry cache format or a copy of the registry itself.
+
+    Return the registry and the date that it was cached (or None if the value is a copy of the registry).
+
+    :raises ValueError: If the value is not valid JSON
+    """
+    cached_registry = json.loads(data)
+    if REGISTRY_CACHE_KEY in cached_registry:
+        return cached_registry[REGISTRY_CACHE_KEY], cached_registry[REGISTRY_CACHE_LAST_UPDATED_KEY]
+    return cached_registry, None
+
+
+class CachedRegistry:
+    """
+    Registry entries read from a registry cache (see CacheBackend.get_registry).
+
+    This is an iterator of (node id, registry entry) pairs in registry order, and `get` returns the entry of a single
+    node. Backends that store the entries separately only read them when they are needed.
+    """
+
+    def __init__(self, entries: dict[str, Any], last_updated: Optional[str] = None) -> None:
+        """
+        Initialize a cached registry.
+
+        :param entries: Mapping of node ids to registry entries
+        :type entries: dict[str, Any]
+        :param last_updated: Date that the registry was cached (None if it is unknown)
+        :type last_updated: str | None
+        """
+        self._entries = entries
+        self.last_updated = last_updated
+        self.node_ids: list[str] = list(entries)
+        self._iter = iter(self.node_ids)
+
+    def get(self, node_id: str) -> Optional[dict[str, Any]]:
+        """
+        Return the registry entry of the node or None if the node is not in the registry.
+
+        :raise RuntimeError: If the entry cannot be read
+        """
+        return self._entries.get(node_id)
+
+    def __iter__(self) -> Iterator[tuple[str, dict[str, Any]]]:
+        """Return self."""
+        return self
+
+    def __next__(self) -> tuple[str, dict[str, Any]]:
+        """Return the next node id and its registry entry."""
+        node_id = next(self._iter)
+        return node_id, self.get(node_id)
+
+
+class CacheWriter:
+    """
+    Write a value to a cache backend incrementally.
+
+    The value is only stored when `commit` is called. Closing the writer without committing discards the value.
+    """
+
+    def __init__(self, backend: "CacheBackend", key: str) -> None:
+        self._backend = backend
+        self._key = key
+        self._chunks: list[bytes] = []
+        self._closed = False
+
+    def write(self, data: bytes) -> int:
+        """Add data to the value."""
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        """Do nothing (the value is written when it is committed)."""
+
+    def commit(self) -> None:
+        """Store the value in the cache backend."""
+        if not self._closed:
+            self._backend.set(self._key, b"".join(self._chunks))
+            self.close()
+
+    def close(self) -> None:
+        """Discard the value if it has not been committed."""
+        self._chunks.clear()
+        self._closed = True
+
+
+class CacheBackend(ABC):
+    """
+    Storage for registry caches.
+
+    Keys are registry URLs and values are the serialized (and possibly compressed) registry caches.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Return the value stored for key or None if there is none.
+
+        :raises OSError: If the cache cannot be read
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """
+        Store the value for key, replacing the current value atomically.
+
+        :raises OSError: If the cache cannot be written
+        """
+
+    @abstractmethod
+    def uri(self, key: str) -> str:
+        """Return a URI describing where the value for key is stored."""
+
+    def writer(self, key: str) -> CacheWriter:
+        """
+        Return a writer that stores a value for key once it is committed.
+
+        Backends that can write values incrementally (without keeping the whole value in memory) should override this.
+
+        :raises OSError: If the cache cannot be written
+        """
+        return CacheWriter(self, key)
+
+    def get_registry(self, key: str) -> Optional[CachedRegistry]:
+        """
+        Return the registry stored for key or None if there is none.
+
+        By default, the value returned by `get` is parsed. Backends that can read the entry of a single node without
+        reading the whole registry should override this (and `set_registry`).
+
+        :raises OSError: If the cache cannot be read or parsed
+        """
+        data = self.get(key)
+        if data is None:
+            return None
+        try:
+            registry, last_updated = _parse_registry_cache(decompress(data))
+        except ValueError as err:
+            raise OSError(f"Could not parse the registry cache at {self.uri(key)}: {err}") from err
+        return CachedRegistry(registry, last_updated)
+
+    def set_registry(self, key: str, registry: dict[str, Any], last_updated: Optional[str] = None) -> None:
+        """
+        Store the registry for key, replacing the current value atomically.
+
+        By default, the registry is stored with `set` in the registry cache format, compressed with
+        CACHE_COMPRESSION (set by the MARBLE_CACHE_COMPRESSION environment variable).
+
+        :param last_updated: Date that the registry was cached, defaults to now
+        :type last_updated: str | None
+        :raises OSError: If the cache cannot be written
+        """
+        self.set(key, _serialize_registry_cache(registry, last_updated))
+
+
+class _FileCacheWriter(CacheWriter):
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._committed = False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(
+            "wb", dir=os.path.dirname(path), prefix=os.path.basename(path), suffix=".partial", delete=False
+        )
+
+    def write(self, data: bytes) -> int:
+        """Write data to the temporary file."""
+        return self._file.write(data)
+
+    def commit(self) -> None:
+        """Replace the cache file with the temporary file."""
+        if not self._committed:
+            self._file.close()
+            os.replace(self._file.name, self._path)
+            self._committed = True
+
+    def close(self) -> None:
+        """Remove the temporary file if it has not been committed."""
+        self._file.close()
+        if not self._committed and os.path.isfile(self._file.name):
+            os.remove(self._file.name)
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Store registry caches as files in a directory.
+
+    The default registry (NODE_REGISTRY_URL) is cached in the file named by CACHE_FNAME, other registries are cached in
+    the same directory in files named after a hash of their URL. Files are replaced atomically so that multiple
+    processes can share the same cache directory.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        """
+        Initialize a file cache backend.
+
+        :param directory: Directory that the cache files are written to, defaults to the directory of CACHE_FNAME
+            (set by the MARBLE_CACHE_DIR environment variable)
+        :type directory: str | None
+        """
+        self._directory = directory
+
+    def path(self, key: str) -> str:
+        """Return the path of the cache file for key."""
+        # constants are read here (not at import time) so that they reflect the current environment
+        directory = self._directory or os.path.dirname(constants.CACHE_FNAME)
+        if key == constants.NODE_REGISTRY_URL:
+            return os.path.join(directory, os.path.basename(constants.CACHE_FNAME))
+        url_hash = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return os.path.join(directory, f"registry.{url_hash}.cached.json")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the contents of the cache file for key or None if it does not exist."""
+        try:
+            with open(self.path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        """Write value to the cache file for key."""
+        writer = self.writer(key)
+        try:
+            writer.write(value)
+            writer.commit()
+        finally:
+            writer.close()
+
+    def uri(self, key: str) -> str:
+        """Return a file:// URI of the cache file for key."""
+        return f"file://{os.path.realpath(self.path(key))}"
+
+    def writer(self, key: str) -> CacheWriter:
+        """Return a writer that writes to a temporary file which replaces the cache file for key when committed."""
+        return _FileCacheWriter(self.path(key))
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Store registry caches in memory (they are shared by all clients that use this backend in the same process)."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored for key or None if there is none."""
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store the value for key."""
+        with self._lock:
+            self._values[key] = value
+
+    def uri(self, key: str) -> str:
+        """Return a memory:// URI for key."""
+        return f"memory://{key}"
+
+
+class KeyValueCacheBackend(CacheBackend):
+    """
+    Store registry caches in a key-value store such as Redis (or any server that is compatible with Redis).
+
+    This allows many machines (for example all user pods of a JupyterHub deployment) to share one registry cache.
+    """
+
+    def __init__(self, client: Any, prefix: str = "marble_client:registry:", ttl: Optional[int] = None) -> None:
+        """
+        Initialize a key-value cache backend.
+
+        :param client: A client for the key-value store. This must have `get(key)` and `set(key, value, ex=None)`
+            methods like the redis.Redis client.
+        :type client: Any
+        :param prefix: Prefix added to every key
+        :type prefix: str
+        :param ttl: Number of seconds after which the store may discard a value, defaults to never
+        :type ttl: int | None
+        """
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored for key or None if there is none."""
+        try:
+            return self.client.get(self.prefix + key)
+        except Exception as err:
+            # errors from the store (such as a connection error) are treated like an unreadable cache file
+            raise OSError(f"Could not read {self.uri(key)}: {err}") from err
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store the value for key."""
+        try:
+            self.client.set(self.prefix + key, value, ex=self.ttl)
+        except Exception as err:
+            raise OSError(f"Could not write {self.uri(key)}: {err}") from err
+
+    def uri(self, key: str) -> str:
+        """Return a kv:// URI for key."""
+        return f"kv://{self.prefix}{key}"
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write data to a temporary file that then replaces the file at path."""
+    writer = _FileCacheWriter(path)
+    try:
+        writer.write(data)
+        writer.commit()
+    finally:
+        writer.close()
+
+
+class ShardedRegistry(CachedRegistry):
+    """
+    Registry entries stored in a sharded registry cache (see ShardedFileCacheBackend).
+
+    Entries are only read from their shard when they are needed, and `get` reads the entry of a single node.
+    """
+
+    def __init__(self, directory: str, manifest: dict[str, Any]) -> None:
+        # the entries are the file names of the shards, which are only read by `get`
+        super().__init__({node["id"]: node["shard"] for node in manifest["nodes"]}, manifest["last_updated"])
+        self._directory = directory
+        self._shards: dict[str, str] = self._entries
+
+    def get(self, node_id: str) -> Optional[dict[str, Any]]:
+        """
+        Return the registry entry of the node or None if the node is not in the registry.
+
+        :raise RuntimeError: If the shard cannot be read
+        """
+        shard = self._shards.get(node_id)
+        if shard is None:
+            return None
+        path = os.path.join(self._directory, shard)
+        try:
+            with open(path, "rb") as f:
+                return json.load(f)
+        except (OSError, ValueError) as err:
+            raise RuntimeError(f"Could not read the cached registry at file://{os.path.realpath(path)}") from err
+
+
+class ShardedFileCacheBackend(FileCacheBackend):
+    """
+    Store each registry cache as a directory containing a manifest and one file (shard) per node.
+
+    Shards are named after the node id and a digest of the node's registry entry (which includes its last_updated
+    date), so saving a new version of a registry only writes the shards of the nodes that changed and then replaces
+    the manifest atomically. Reading a single node from the cache only reads the manifest and that node's shard.
+
+    Shards that are no longer referenced by the manifest are kept for `grace_period` seconds so that other processes
+    that read the previous manifest can still read its shards.
+    """
+
+    _MANIFEST = "manifest.json"
+
+    def __init__(self, directory: Optional[str] = None, grace_period: float = 3600) -> None:
+        """
+        Initialize a sharded file cache backend.
+
+        :param directory: Directory that the cache files are written to, defaults to the directory of CACHE_FNAME
+            (set by the MARBLE_CACHE_DIR environment variable)
+        :type directory: str | None
+        :param grace_period: Number of seconds that shards are kept after they are no longer referenced by the
+            manifest, defaults to one hour
+        :type grace_period: float
+        """
+        super().__init__(directory)
+        self.grace_period = grace_period
+
+    def shard_directory(self, key: str) -> str:
+        """Return the path of the directory that contains the manifest and shards for key."""
+        return os.path.splitext(self.path(key))[0] + ".shards"
+
+    def get_registry(self, key: str) -> Optional[ShardedRegistry]:
+        """
+        Return the registry stored for key (without reading the shards) or None if there is none.
+
+        :raises OSError: If the manifest cannot be read
+        """
+        directory = self.shard_directory(key)
+        try:
+            with open(os.path.join(directory, self._MANIFEST), "rb") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as err:
+            raise OSError(f"Could not parse {self.uri(key)}: {err}") from err
+        return ShardedRegistry(directory, manifest)
+
+    def set_registry(self, key: str, registry: dict[str, Any], last_updated: Optional[str] = None) -> None:
+        """
+        Store the registry for key, writing only the shards that changed.
+
+        :raises OSError: If the cache cannot be written
+        """
+        directory = self.shard_directory(key)
+        os.makedirs(directory, exist_ok=True)
+        existing = set(os.listdir(directory))
+        try:
+            previous = self.get_registry(key)
+        except OSError:
+            previous = None
+        nodes = []
+        for node_id, node_details in registry.items():
+            data = json.dumps(node_details, sort_keys=True).encode()
+            shard = f"{quote(node_id, safe='')}.{hashlib.sha256(data).hexdigest()[:16]}.json"
+            if shard not in existing:
+                _write_atomic(os.path.join(directory, shard), data)
+            nodes.append({"id": node_id, "last_updated": node_details.get("last_updated"), "shard": shard})
+        if last_updated is None:
+            last_updated = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+        _write_atomic(
+            os.path.join(directory, self._MANIFEST), json.dumps({"last_updated": last_updated, "nodes": nodes}).encode()
+        )
+        referenced = {node["shard"] for node in nodes}
+        if previous is not None:
+            # the grace period of the shards that the previous manifest referenced starts now
+            for shard in set(previous._shards.values()) - referenced:
+                try:
+                    os.utime(os.path.join(directory, shard))
+                except FileNotFoundError:
+                    pass
+        self._remove_stale_shards(directory, referenced)
+
+    def _remove_stale_shards(self, directory: str, referenced: set[str]) -> None:
+        """Remove the shards that are not referenced and have not been modified during the grace period."""
+        expired = time.time() - self.grace_period
+        for name in os.listdir(directory):
+            if name in referenced or name == self._MANIFEST or not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if os.stat(path).st_mtime <= expired:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the registry stored for key in the registry cache format or None if there is none."""
+        registry = self.get_registry(key)
+        if registry is None:
+            return None
+        try:
+            entries = dict(registry)
+        except RuntimeError as err:
+            raise OSError(str(err)) from err
+        return json.dumps(
+            {REGISTRY_CACHE_LAST_UPDATED_KEY: registry.last_updated, REGISTRY_CACHE_KEY: entries}
+        ).encode()
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store a value in the registry cache format (or a copy of the registry itself) for key."""
+        try:
+            data = json.loads(decompress(value))
+        except (ValueError, UnicodeDecodeError) as err:
+            raise OSError(f"Could not parse the registry cache to write to {self.uri(key)}: {err}") from err
+        if REGISTRY_CACHE_KEY in data:
+            self.set_registry(key, data[REGISTRY_CACHE_KEY], data.get(REGISTRY_CACHE_LAST_UPDATED_KEY))
+        else:
+            self.set_registry(key, data)
+
+    def uri(self, key: str) -> str:
+        """Return a file:// URI of the directory that contains the manifest and shards for key."""
+        return f"file://{os.path.realpath(self.shard_directory(key))}"
+
+    def writer(self, key: str) -> CacheWriter:
+        """Return a writer that stores the value when it is committed (the whole value is needed to shard it)."""
+        return CacheWriter(self, key)
+
+
+_MEMORY_CACHE = MemoryCacheBackend()
+
+
+def get_cache_backend(url: Optional[str] = None) -> CacheBackend:
+    """
+    Return the cache backend described by url.
+
+    - None or an empty string: a FileCacheBackend using the default cache directory
+    - "file:///path/to/directory": a FileCacheBackend using that directory
+    - "sharded://" or "sharded:///path/to/directory": a ShardedFileCacheBackend using the default cache directory or
+      that directory
+    - "memory://": a MemoryCacheBackend shared by the whole process
+    - "redis://...", "rediss://..." or "unix://...": a KeyValueCacheBackend connected to that Redis server
+      (this requires the redis package to be installed)
+
+    :raises ValueError: If the url scheme is not supported
+    """
+    if not url:
+        return FileCacheBackend()
+    scheme, _, rest = url.partition("://")
+    if scheme == "file":
+        return FileCacheBackend(rest or None)
+    if scheme == "sharded":
+        return ShardedFileCacheBackend(rest or None)
+    if scheme == "memory":
+        return _MEMORY_CACHE
+    if scheme in ("redis", "rediss", "unix"):
+        import redis  # type: ignore
+
+        return KeyValueCacheBackend(redis.Redis.from_url(url))
+    raise ValueError(
+        f"Unsupported cache URL '{url}'. Must start with file://, sharded://, memory://, redis://, rediss:// or unix://"
+    )
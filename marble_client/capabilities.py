@@ -0,0 +1,217 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from typing import TYPE_CHECKING, Any, Callable, Optional
+from urllib.parse import quote
+
+import requests
+
+from marble_client.constants import CAPABILITIES_TTL
+
+if TYPE_CHECKING:
+    from marble_client.services import MarbleService
+
+__all__ = ["CapabilitiesCache", "fetch_capabilities", "service_kind"]
+
+# names of services that are known to be WPS servers in Marble nodes
+_WPS_SERVICES = {"finch", "raven", "hummingbird", "flyingpigeon", "weaver"}
+
+
+def service_kind(service: "MarbleService") -> Optional[str]:
+    """Return the kind of capabilities document offered by the service ("stac", "thredds" or "wps") if known."""
+    keywords = {keyword.lower() for keyword in service.keywords or []}
+    name = service.name.lower()
+    if name == "stac" or "stac" in keywords:
+        return "stac"
+    if name == "thredds" or "thredds" in keywords:
+        return "thredds"
+    if name in _WPS_SERVICES or "wps" in keywords:
+        return "wps"
+    return None
+
+
+def _local_name(element: ET.Element) -> str:
+    return element.tag.rsplit("}", 1)[-1]
+
+
+def _find_text(element: ET.Element, name: str) -> Optional[str]:
+    """Return the text of the first direct child of element with the local name `name`."""
+    for child in element:
+        if _local_name(child) == name:
+            return child.text
+    return None
+
+
+def _parse_stac(response: requests.Response) -> dict[str, Any]:
+    root = response.json()
+    return {
+        "type": "stac",
+        "id": root.get("id"),
+        "title": root.get("title"),
+        "description": root.get("description"),
+        "stac_version": root.get("stac_version"),
+        "conforms_to": root.get("conformsTo", []),
+        "children": [link["href"] for link in root.get("links", []) if link.get("rel") in ("child", "data")],
+    }
+
+
+def _parse_thredds(response: requests.Response) -> dict[str, Any]:
+    root = ET.fromstring(response.content)
+    services = []
+    datasets = []
+    catalog_refs = []
+    for element in root.iter():
+        name = _local_name(element)
+        if name == "service" and element.get("serviceType", "").lower() != "compound":
+            services.append(
+                {"name": element.get("name"), "type": element.get("serviceType"), "base": element.get("base")}
+            )
+        elif name == "dataset":
+            datasets.append(element.get("name"))
+        elif name == "catalogRef":
+            catalog_refs.append(element.get("{http://www.w3.org/1999/xlink}title") or element.get("name"))
+    return {
+        "type": "thredds",
+        "name": root.get("name"),
+        "version": root.get("version"),
+        "services": services,
+        "datasets": datasets,
+        "catalog_refs": catalog_refs,
+    }
+
+
+def _parse_wps(response: requests.Response) -> dict[str, Any]:
+    root = ET.fromstring(response.content)
+    title = abstract = None
+    processes = []
+    for element in root.iter():
+        name = _local_name(element)
+        if name == "ServiceIdentification":
+            title = _find_text(element, "Title")
+            abstract = _find_text(element, "Abstract")
+        elif name in ("Process", "ProcessSummary"):
+            processes.append({"identifier": _find_text(element, "Identifier"), "title": _find_text(element, "Title")})
+    return {"type": "wps", "version": root.get("version"), "title": title, "abstract": abstract, "processes": processes}
+
+
+def _capabilities_request(service: "MarbleService", kind: str) -> tuple[str, dict[str, str], Callable]:
+    """Return the URL, query parameters and parser for the capabilities document of the service."""
+    if kind == "stac":
+        return service.url, {}, _parse_stac
+    if kind == "thredds":
+        return service.url.rstrip("/") + "/catalog/catalog.xml", {}, _parse_thredds
+    if kind == "wps":
+        return service.url, {"service": "WPS", "request": "GetCapabilities"}, _parse_wps
+    raise ValueError(f"Unknown service kind '{kind}'. Must be one of 'stac', 'thredds' or 'wps'.")
+
+
+class CapabilitiesCache:
+    """
+    Cache of parsed service capabilities.
+
+    Entries are kept in memory and, if a directory is given, written to that directory so that they can be
+    shared between processes.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self._directory = directory
+        self._entries: dict[tuple[str, str], dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _fname(self, key: tuple[str, str]) -> str:
+        return os.path.join(self._directory, f"{quote(key[0], safe='')}.{quote(key[1], safe='')}.json")
+
+    def get(self, key: tuple[str, str]) -> Optional[dict[str, Any]]:
+        """Return the cache entry for key (a node id and service name) or None if there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self._directory is not None:
+            try:
+                with open(self._fname(key)) as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                return None
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def set(self, key: tuple[str, str], entry: dict[str, Any]) -> None:
+        """Store the cache entry for key (a node id and service name)."""
+        with self._lock:
+            self._entries[key] = entry
+        if self._directory is not None:
+            try:
+                os.makedirs(self._directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile("w", dir=self._directory, delete=False, suffix=".tmp") as f:
+                    json.dump(entry, f)
+                os.replace(f.name, self._fname(key))
+            except OSError:
+                # the in-memory cache is still usable if the cache directory cannot be written to
+                pass
+
+
+def fetch_capabilities(
+    service: "MarbleService",
+    kind: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    ttl: Optional[float] = None,
+    refresh: bool = False,
+) -> dict[str, Any]:
+    """
+    Return the parsed capabilities of the service, using the client's capabilities cache.
+
+    Cached capabilities are used if they were fetched less than `ttl` seconds ago for the same node and service
+    version. Otherwise, the capabilities document is requested again, with the validators (ETag and Last-Modified)
+    from the cached response, and the cached capabilities are reused if the server reports that they are unchanged.
+
+    The cache is not used when a session is given, since the document may then depend on who is logged in.
+    """
+    kind = kind or service_kind(service)
+    if kind is None:
+        raise ValueError(f"Cannot determine the kind of service '{service.name}'. Please specify a kind.")
+    node = service._node
+    client = node._client
+    ttl = CAPABILITIES_TTL if ttl is None else ttl
+    key = (node.id, service.name)
+    version = [node.version, service._servicedata.get("version"), kind]
+    # the cache is shared by every caller (and process), so it only holds documents requested without a session
+    use_cache = session is None
+    entry = client._capabilities_cache.get(key) if use_cache else None
+    if entry is not None and entry.get("version") != version:
+        entry = None
+    if entry is not None and not refresh and time.time() - entry["fetched"] < ttl:
+        return entry["capabilities"]
+
+    url, params, parser = _capabilities_request(service, kind)
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    response = client._transport.request(
+        "GET", url, operation="capabilities", node_id=node.id, session=session, params=params, headers=headers
+    )
+    if response.status_code == 304 and entry is not None:
+        capabilities = entry["capabilities"]
+    else:
+        response.raise_for_status()
+        try:
+            capabilities = parser(response)
+        except (ValueError, ET.ParseError) as err:
+            raise RuntimeError(f"Could not parse the capabilities document returned from {response.url}") from err
+    if use_cache:
+        client._capabilities_cache.set(
+            key,
+            {
+                "version": version,
+                "fetched": time.time(),
+                "etag": response.headers.get("ETag", entry and entry.get("etag")),
+                "last_modified": response.headers.get("Last-Modified", entry and entry.get("last_modified")),
+                "capabilities": capabilities,
+            },
+        )
+    return capabilities
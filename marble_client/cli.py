@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import json
+import sys
+import warnings
+from typing import Any, Optional, Sequence
+
+from marble_client import constants
+from marble_client.cache import get_cache_backend
+from marble_client.client import MarbleClient
+from marble_client.exceptions import MarbleBaseError
+
+__all__ = ["main"]
+
+
+def _output(args: argparse.Namespace, data: Any, lines: Sequence[str]) -> None:
+    """Print data as JSON if requested, otherwise print the human readable lines."""
+    if args.json:
+        print(json.dumps(data, indent=2, default=str))
+    else:
+        for line in lines:
+            print(line)
+
+
+def _client(args: argparse.Namespace, update_cache: bool = False, **kwargs) -> MarbleClient:
+    # keep stdout for the command output only (so that it can be parsed when --json is used)
+    with contextlib.redirect_stdout(sys.stderr), warnings.catch_warnings():
+        if update_cache:
+            # the client only warns if the registry cannot be cached but these commands exist to update the cache
+            warnings.filterwarnings("error", message="Could not write the registry cache", category=UserWarning)
+        try:
+            return MarbleClient(registry_urls=args.registry_url, **kwargs)
+        except UserWarning as err:
+            raise RuntimeError(str(err)) from err
+
+
+def _registry_fetch(args: argparse.Namespace) -> int:
+    # this command downloads the registry even if offline mode is enabled by default
+    client = _client(args, update_cache=True, fallback=False, offline=False)
+    registry = {node_id: node._nodedata for node_id, node in client.nodes.items()}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(registry, f)
+    _output(
+        args,
+        {"registry_uris": client.registry_uris, "nodes": len(registry), "output": args.output},
+        [f"Fetched {len(registry)} nodes from {', '.join(client.registry_uris)}"]
+        + ([f"Registry written to {args.output}"] if args.output else []),
+    )
+    return 0
+
+
+def _registry_show(args: argparse.Namespace) -> int:
+    client = _client(args, offline=args.offline or None)
+    nodes = client.nodes.values()
+    _output(
+        args,
+        {node.id: node._nodedata for node in nodes},
+        [f"{node.id:<20} {node.name:<25} {node.version:<10} {node.url}" for node in nodes],
+    )
+    return 0
+
+
+def _nodes_check(args: argparse.Namespace) -> int:
+    client = _client(args, offline=args.offline or None)
+    online = client.check_nodes(args.nodes or None, max_workers=args.concurrency)
+    _output(
+        args,
+        online,
+        [f"{node_id:<20} {'online' if is_online else 'offline'}" for node_id, is_online in online.items()],
+    )
+    return 0 if all(online.values()) else 1
+
+
+def _cache_warm(args: argparse.Namespace) -> int:
+    client = _client(args, update_cache=True, fallback=False, offline=False)
+    caches = {registry_uri: client._cache.uri(registry_uri) for registry_uri in client.registry_uris}
+    _output(
+        args,
+        caches,
+        [f"Registry cache at {cache_uri} updated from {uri}" for uri, cache_uri in caches.items()],
+    )
+    return 0
+
+
+def _cache_seed(args: argparse.Namespace) -> int:
+    if not args.snapshot:
+        return _cache_warm(args)
+    registry, _ = MarbleClient._read_registry_file(args.snapshot)
+    registry_url = args.registry_url[0] if args.registry_url else constants.NODE_REGISTRY_URL
+    cache = get_cache_backend(constants.CACHE_URL)
+    try:
+        cache.set(registry_url, MarbleClient._serialize_registry_cache(registry))
+    except OSError as err:
+        raise RuntimeError(f"Could not write the registry cache to {cache.uri(registry_url)}: {err}") from err
+    cache_uri = cache.uri(registry_url)
+    _output(args, {args.snapshot: cache_uri}, [f"Registry cache at {cache_uri} seeded from {args.snapshot}"])
+    return 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    output_parser = argparse.ArgumentParser(add_help=False)
+    output_parser.add_argument("--json", action="store_true", help="Print the output as JSON.")
+
+    registry_parser = argparse.ArgumentParser(add_help=False)
+    registry_parser.add_argument(
+        "--registry-url",
+        action="append",
+        help="URL of a registry to use, can be repeated (defaults to all registries in MARBLE_NODE_REGISTRY_URLS).",
+    )
+
+    offline_parser = argparse.ArgumentParser(add_help=False)
+    offline_parser.add_argument(
+        "--offline", action="store_true", help="Load the registry from the cache without accessing the network."
+    )
+
+    parser = argparse.ArgumentParser(prog="marble", description="Access information about the Marble network.")
+    commands = parser.add_subparsers(title="commands", required=True)
+
+    registry = commands.add_parser("registry", help="Download and inspect the node registry.")
+    registry_commands = registry.add_subparsers(title="commands", required=True)
+
+    registry_fetch = registry_commands.add_parser(
+        "fetch",
+        parents=[output_parser, registry_parser],
+        help="Download the registry and update the local cache.",
+    )
+    registry_fetch.add_argument("--output", metavar="PATH", help="Also write the registry to this file.")
+    registry_fetch.set_defaults(func=_registry_fetch)
+
+    registry_show = registry_commands.add_parser(
+        "show", parents=[output_parser, registry_parser, offline_parser], help="Show the nodes in the registry."
+    )
+    registry_show.set_defaults(func=_registry_show)
+
+    nodes = commands.add_parser("nodes", help="Inspect the nodes in the Marble network.")
+    nodes_commands = nodes.add_subparsers(title="commands", required=True)
+
+    nodes_check = nodes_commands.add_parser(
+        "check",
+        parents=[output_parser, registry_parser, offline_parser],
+        help="Check which nodes are online.",
+        description="Check which nodes are online. Exits with a non-zero status if any node is offline.",
+    )
+    nodes_check.add_argument("nodes", nargs="*", metavar="NODE", help="IDs of the nodes to check (defaults to all).")
+    nodes_check.add_argument(
+        "--concurrency", type=int, default=8, metavar="N", help="Number of nodes to check at the same time."
+    )
+    nodes_check.set_defaults(func=_nodes_check)
+
+    cache = commands.add_parser("cache", help="Manage the local registry cache.")
+    cache_commands = cache.add_subparsers(title="commands", required=True)
+
+    cache_warm = cache_commands.add_parser(
+        "warm",
+        parents=[output_parser, registry_parser],
+        help="Download the registry to the local cache so that clients don't need to access the network.",
+    )
+    cache_warm.set_defaults(func=_cache_warm)
+
+    cache_seed = cache_commands.add_parser(
+        "seed",
+        parents=[output_parser, registry_parser],
+        help="Write the registry to the local cache so that clients can be created offline.",
+        description="Download the registry (or copy it from a snapshot file) and write it to the local cache.",
+    )
+    cache_seed.add_argument(
+        "--from",
+        dest="snapshot",
+        metavar="PATH",
+        help="Copy the registry from this snapshot file instead of downloading it.",
+    )
+    cache_seed.set_defaults(func=_cache_seed)
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Run the marble command line interface."""
+    args = _parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (MarbleBaseError, RuntimeError) as err:
+        print(f"Error: {err}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
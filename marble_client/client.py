@@ -1,19 +1,56 @@
 import datetime
 import json
 import os
-import shutil
+import threading
+import time
 import warnings
-from functools import cache
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, BinaryIO, Iterable, Iterator, Literal, Mapping, Optional, Union
 from urllib.parse import urlparse
 
 import dateutil.parser
 import requests
+import urllib3
 
-from marble_client.constants import CACHE_FNAME, NODE_REGISTRY_URL
-from marble_client.exceptions import JupyterEnvironmentError, UnknownNodeError
+from marble_client import prefetch
+from marble_client.cache import (
+    REGISTRY_CACHE_KEY,
+    REGISTRY_CACHE_LAST_UPDATED_KEY,
+    CacheBackend,
+    CachedRegistry,
+    _parse_registry_cache,
+    _serialize_registry_cache,
+    get_cache_backend,
+)
+from marble_client.capabilities import CapabilitiesCache
+from marble_client.constants import (
+    CACHE_COMPRESSION,
+    CACHE_FNAME,
+    CACHE_URL,
+    NODE_MAX_CONCURRENCY,
+    NODE_RATE_BURST,
+    NODE_RATE_LIMIT,
+    NODE_REGISTRY_URL,
+    NODE_REGISTRY_URLS,
+    OFFLINE,
+    REGISTRY_SNAPSHOT,
+)
+from marble_client.exceptions import JupyterEnvironmentError, RegistryConflictError, UnknownNodeError
+from marble_client.login import login_stdin, login_widget
+from marble_client.metrics import Collector, StatsCollector
 from marble_client.node import MarbleNode
-from marble_client.utils import check_jupyterlab
+from marble_client.nodeview import NodeView
+from marble_client.ratelimit import RateLimit
+from marble_client.replicas import NodeHealth, fetch
+from marble_client.snapshot import RegistrySnapshot
+from marble_client.transport import Transport
+from marble_client.utils import (
+    check_compression,
+    check_jupyterlab,
+    check_rich_output_shell,
+    compressed_writer,
+    decompress,
+)
 
 __all__ = ["MarbleClient"]
 
@@ -21,37 +58,135 @@ __all__ = ["MarbleClient"]
 class MarbleClient:
     """Client object representing the information in the Marble registry."""
 
-    _registry_cache_key = "marble_client_python:cached_registry"
-    _registry_cache_last_updated_key = "marble_client_python:last_updated"
+    _registry_cache_key = REGISTRY_CACHE_KEY
+    _registry_cache_last_updated_key = REGISTRY_CACHE_LAST_UPDATED_KEY
 
-    def __init__(self, fallback: bool = True) -> None:
+    def __init__(
+        self,
+        fallback: bool = True,
+        collectors: Optional[Iterable[Collector]] = None,
+        stream: bool = False,
+        registry_urls: Optional[Iterable[str]] = None,
+        conflict: Literal["first", "last", "newest", "error"] = "first",
+        offline: Optional[bool] = None,
+        rate_limit: Optional[RateLimit] = None,
+        node_rate_limits: Optional[Mapping[str, RateLimit]] = None,
+        cache: Optional[CacheBackend] = None,
+    ) -> None:
         """
         Initialize a MarbleClient instance.
 
         :param fallback: If True, then fall back to a cached version of the registry
             if the cloud registry cannot be accessed, defaults to True
         :type fallback: bool
+        :param collectors: Callables that are called with a RequestRecord for every network request
+            and registry cache access made by this client. If None (the default), requests are not
+            instrumented at all. Pass an empty list to only collect the statistics returned by `stats`.
+        :type collectors: Iterable[Callable[[RequestRecord], None]] | None
+        :param stream: If True, parse the registry incrementally as it is downloaded and only construct
+            nodes when they are needed. The downloaded registry is written directly to the cache file, which is
+            only updated (and the download is only closed) once every node has been read, for example when `nodes`
+            is used. If the download fails before that and `fallback` is True, the registry is loaded from the
+            cache instead. If the registry is loaded from a cache that stores each node separately (see
+            ShardedFileCacheBackend), only the entries of the nodes that are needed are read.
+            This requires the ijson package to be installed, defaults to False
+        :type stream: bool
+        :param registry_urls: URLs of the registries to load. If more than one is given, they are downloaded
+            concurrently and merged into a single set of nodes. When streaming multiple registries, each
+            registry is fully read before the client is returned. Defaults to NODE_REGISTRY_URLS
+        :type registry_urls: Iterable[str] | None
+        :param conflict: How to handle a node id that is defined in more than one registry. One of "first"
+            (use the node from the first registry in registry_urls that defines it), "last" (use the node
+            from the last registry), "newest" (use the node with the latest last_updated date) or "error"
+            (raise a RegistryConflictError), defaults to "first"
+        :type conflict: str
+        :param offline: If True, never access the network to load the registry. The registry is loaded from
+            the cache or, if there is no cache, from the registry snapshot (see REGISTRY_SNAPSHOT, this is only
+            used for NODE_REGISTRY_URL).
+            Defaults to the value of the OFFLINE constant (set by the MARBLE_OFFLINE environment variable)
+        :type offline: bool | None
+        :param rate_limit: Limits on the requests sent to each node. Defaults to the limits set by the
+            NODE_RATE_LIMIT, NODE_RATE_BURST and NODE_MAX_CONCURRENCY constants (set by the MARBLE_NODE_RATE_LIMIT,
+            MARBLE_NODE_RATE_BURST and MARBLE_NODE_MAX_CONCURRENCY environment variables)
+        :type rate_limit: RateLimit | None
+        :param node_rate_limits: Limits on the requests sent to specific nodes (keyed by node id), these override
+            `rate_limit` for those nodes
+        :type node_rate_limits: Mapping[str, RateLimit] | None
+        :param cache: Where the registry is cached. Defaults to the backend described by the CACHE_URL constant
+            (set by the MARBLE_CACHE_URL environment variable) or, if that is not set, to files in the cache
+            directory (see CACHE_FNAME)
+        :type cache: CacheBackend | None
         :raises requests.exceptions.RequestException: Raised when there is an issue
             connecting to the cloud registry and `fallback` is False
         :raises UserWarning: Raised when there is an issue connecting to the cloud registry
             and `fallback` is True
-        :raise RuntimeError: If cached registry needs to be read but there is no cache
+        :raise RuntimeError: If cached registry needs to be read but there is no cache or registry snapshot
+            (or if the registry cannot be read while streaming and `fallback` is False)
+        :raise RegistryConflictError: If the same node id is defined in multiple registries and `conflict` is "error"
+        :raise ValueError: If the CACHE_COMPRESSION constant (set by the MARBLE_CACHE_COMPRESSION environment
+            variable) is not "gzip", "zstd" or "none"
         """
+        # fail before anything is downloaded rather than when the registry is written to the cache
+        check_compression(CACHE_COMPRESSION)
+        self._stats: Optional[StatsCollector] = None
+        if collectors is not None:
+            self._stats = StatsCollector()
+            collectors = [self._stats, *collectors]
+        if rate_limit is None:
+            rate_limit = RateLimit(rate=NODE_RATE_LIMIT, burst=NODE_RATE_BURST, max_concurrency=NODE_MAX_CONCURRENCY)
+        self._transport = Transport(collectors, rate_limit=rate_limit, node_rate_limits=node_rate_limits)
+        self._cache = cache or get_cache_backend(CACHE_URL)
+        self._capabilities_cache = CapabilitiesCache(os.path.join(os.path.dirname(CACHE_FNAME), "capabilities"))
+        self._health = NodeHealth()
+        # the loaded registry, readers use it without locks and it is only ever replaced as a whole
+        self._snapshot: Optional[RegistrySnapshot] = None
+        # nodes constructed so far and registry entries not yet constructed (only used while streaming)
         self._nodes: dict[str, MarbleNode] = {}
-        self._registry_uri: str
-        self._registry: dict
-        self._registry_uri, self._registry = self._load_registry(fallback)
+        self._registry_uris: list[str]
+        self._pending_nodes: Optional[Iterator[tuple[str, dict[str, Any]]]]
+        # set if the registry could not be read while streaming, the partially loaded nodes are never published
+        self._load_error: Optional[RuntimeError] = None
+        self._load_lock = threading.Lock()
+        prefetched = None
+        if (
+            registry_urls is None
+            and cache is None
+            and fallback
+            and not stream
+            and offline is None
+            and conflict == "first"
+        ):
+            # a registry loaded in the background with these same options (see marble_client.prefetch)
+            prefetched = prefetch.take_registry()
+        if offline is None:
+            offline = OFFLINE
+        self._registry_urls = list(registry_urls or NODE_REGISTRY_URLS)
+        self._registry_options = {"fallback": fallback, "conflict": conflict, "offline": offline}
+        if prefetched is not None:
+            # the nodes were constructed for the client that loaded the registry in the background, which is discarded
+            for node in prefetched.nodes.values():
+                node._client = self
+            self._registry_uris, self._nodes, self._pending_nodes = list(prefetched.uris), dict(prefetched.nodes), None
+            self._snapshot = prefetched
+            return
+        self._registry_uris, self._pending_nodes = self._load_registries(
+            self._registry_urls, fallback, stream, conflict, offline
+        )
 
-        for node_id, node_details in self._registry.items():
-            self._nodes[node_id] = MarbleNode(node_id, node_details, client=self)
+        if not stream:
+            self._load_nodes()
 
     @property
-    def nodes(self) -> dict[str, MarbleNode]:
-        """Return nodes in the current registry."""
-        return self._nodes
+    def nodes(self) -> NodeView:
+        """
+        Return nodes in the current registry.
+
+        This is a read-only mapping of node ids to nodes that can be filtered with `client.nodes.filter(...)`
+        (see NodeView.filter).
+        """
+        return self._current_snapshot().view
 
     @property
-    @cache
     @check_jupyterlab
     def this_node(self) -> MarbleNode:
         """
@@ -61,10 +196,9 @@ class MarbleClient:
         """
         # PAVICS_HOST_URL is the deprecated variable used in older versions (<2.4.0) of birdhouse-deploy
         url_string = os.getenv("BIRDHOUSE_HOST_URL", os.getenv("PAVICS_HOST_URL"))
-        host_url = urlparse(url_string)
-        for node in self.nodes.values():
-            if urlparse(node.url).hostname == host_url.hostname:
-                return node
+        node = self._current_snapshot().node_by_hostname(urlparse(url_string).hostname)
+        if node is not None:
+            return node
         raise UnknownNodeError(f"No node found in the registry with the url '{url_string}'")
 
     @check_jupyterlab
@@ -79,27 +213,248 @@ class MarbleClient:
         """
         if session is None:
             session = requests.Session()
-        r = requests.get(
-            f"{os.getenv('JUPYTERHUB_API_URL')}/users/{os.getenv('JUPYTERHUB_USER')}",
-            headers={"Authorization": f"token {os.getenv('JUPYTERHUB_API_TOKEN')}"},
-        )
-        try:
-            r.raise_for_status()
-        except requests.HTTPError as err:
-            raise JupyterEnvironmentError("Cannot retrieve login cookies through the JupyterHub API.") from err
-        for name, value in r.json().get("auth_state", {}).get("magpie_cookies", {}).items():
+        cookies = prefetch.take_session_cookies()
+        if cookies is None:
+            cookies = _jupyterhub_session_cookies(self._transport)
+        for name, value in cookies.items():
             session.cookies.set(name, value)
         return session
 
+    def login(
+        self,
+        nodes: Iterable[str],
+        session: Optional[requests.Session] = None,
+        input_type: Literal["stdin", "widget"] | None = None,
+        max_workers: int = 8,
+    ) -> requests.Session:
+        """
+        Return a requests session containing login cookies for several nodes.
+
+        The same user name and password are used to log in to all nodes concurrently. With jupyter widgets,
+        a form lets the user choose which of the nodes to log in to and shows the progress of each login. The form
+        is returned immediately and the logins are performed in the background when the login button is clicked,
+        so the session contains the cookies of a node once its login has succeeded. Otherwise, the user is prompted
+        for their credentials on stdin.
+
+        If you want to force the function to use either stdin or widgets specify "stdin"
+        or "widget" as the input type. Otherwise, this function will make its best guess
+        which one to use.
+
+        :param nodes: IDs of the nodes to log in to. Accounts are specific to each node, so only list the nodes
+            where these credentials are valid: they are sent to every one of them.
+        :type nodes: Iterable[str]
+        :param session: Session that receives the login cookies, defaults to a new session
+        :type session: requests.Session | None
+        :param input_type: How to get the user's credentials ("stdin" or "widget")
+        :type input_type: Literal["stdin", "widget"] | None
+        :param max_workers: Maximum number of nodes to log in to at the same time, defaults to 8
+        :type max_workers: int
+        :raise RuntimeError: If the login to any node fails (when using stdin)
+        :raise UnknownNodeError: If a node id is not in the registry
+        :return: The session
+        :rtype: requests.Session
+        """
+        node_objects = [self[node_id] for node_id in nodes]
+        if session is None:
+            session = requests.Session()
+        if input_type is None:
+            input_type = "widget" if check_rich_output_shell() else "stdin"
+        if input_type == "widget":
+            login_widget(node_objects, session, selectable=len(node_objects) > 1, max_workers=max_workers)
+        elif input_type == "stdin":
+            login_stdin(node_objects, session, max_workers=max_workers)
+        else:
+            raise TypeError("input_type must be one of 'stdin', 'widget' or None.")
+        return session
+
+    def check_nodes(self, nodes: Optional[Iterable[str]] = None, max_workers: int = 8) -> dict[str, bool]:
+        """
+        Check whether nodes are online concurrently.
+
+        :param nodes: IDs of the nodes to check, defaults to all nodes in the registry
+        :type nodes: Iterable[str] | None
+        :param max_workers: Maximum number of nodes to check at the same time, defaults to 8
+        :type max_workers: int
+        :return: A dictionary mapping each node id to True if the node is online, False otherwise
+        :rtype: dict[str, bool]
+        """
+        node_objects = list(self.nodes.values()) if nodes is None else [self[node_id] for node_id in nodes]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip((node.id for node in node_objects), executor.map(MarbleNode.is_online, node_objects)))
+
+    def capabilities(
+        self,
+        service: str,
+        max_workers: int = 8,
+        session: Optional[requests.Session] = None,
+        ttl: Optional[float] = None,
+        refresh: bool = False,
+    ) -> dict[str, dict[str, Any]]:
+        """
+        Return the capabilities of a service for every node that offers it.
+
+        The capabilities are requested concurrently (see MarbleService.capabilities). If the capabilities for
+        a node cannot be retrieved, a warning is issued and that node is not included in the result.
+
+        :param service: Name of the Marble service
+        :type service: str
+        :param max_workers: Maximum number of nodes to request at the same time, defaults to 8
+        :type max_workers: int
+        :return: A dictionary mapping node ids to the capabilities of the service on that node
+        :rtype: dict[str, dict[str, Any]]
+        """
+        services = [node[service] for node in self.nodes.values() if service in node]
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                service_._node.id: executor.submit(service_.capabilities, session=session, ttl=ttl, refresh=refresh)
+                for service_ in services
+            }
+            for node_id, future in futures.items():
+                try:
+                    results[node_id] = future.result()
+                except (requests.exceptions.RequestException, RuntimeError, ValueError) as err:
+                    warnings.warn(f"Cannot retrieve the capabilities of '{service}' on node '{node_id}': {err}")
+        return results
+
+    def search(
+        self,
+        query: dict[str, Any],
+        service: str = "stac",
+        max_workers: int = 8,
+        timeout: Optional[float] = 30,
+        session: Optional[requests.Session] = None,
+    ) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Search a service on every node that offers it and yield the results as each node responds.
+
+        The query is sent to all nodes concurrently (see MarbleService.search) so results from fast nodes are
+        available as soon as they arrive, without waiting for slower nodes. If a node does not respond within
+        `timeout` seconds or its results cannot be retrieved, a warning is issued and that node is skipped.
+
+        E.g.::
+
+            for node_id, item in client.search({"collections": ["CMIP6"], "limit": 10}):
+                print(node_id, item["id"])
+
+        :param query: Search parameters according to the STAC API item search specification
+        :type query: dict[str, Any]
+        :param service: Name of the Marble service to search, defaults to "stac"
+        :type service: str
+        :param max_workers: Maximum number of nodes to search at the same time, defaults to 8
+        :type max_workers: int
+        :param timeout: Number of seconds to wait for each node to respond, defaults to 30
+        :type timeout: float | None
+        :param session: Session used to make the requests
+        :type session: requests.Session | None
+        :return: An iterator of (node id, item) tuples
+        :rtype: Iterator[tuple[str, dict[str, Any]]]
+        """
+        services = [node[service] for node in self.nodes.values() if service in node]
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                executor.submit(service_.search, query, session=session, timeout=timeout): service_._node.id
+                for service_ in services
+            }
+            for future in as_completed(futures):
+                node_id = futures[future]
+                try:
+                    items = future.result()
+                except (requests.exceptions.RequestException, RuntimeError, ValueError) as err:
+                    warnings.warn(f"Cannot search '{service}' on node '{node_id}': {err}")
+                    continue
+                for item in items:
+                    yield node_id, item
+        finally:
+            # don't wait for slow nodes if the caller stops iterating early
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def fetch(
+        self,
+        path: str,
+        service: str = "thredds",
+        destination: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        hedge_after: float = 1.0,
+        timeout: Optional[float] = 30,
+    ) -> str:
+        """
+        Download a file that is mirrored by several nodes from the node that is expected to respond first.
+
+        Nodes that offer the service are ranked by their estimated latency (measured by previous requests, including
+        `check_nodes`). Nodes that failed repeatedly are skipped for a while (their circuit breaker is open). If the
+        best node has not responded after `hedge_after` seconds, the same request is sent to the next best node and
+        the first successful response is used (the other request is cancelled). If a node returns an error, the next
+        best node is tried. The response is streamed to a temporary file that replaces `destination` once the
+        download is complete.
+
+        E.g.::
+
+            client.fetch("fileServer/birdhouse/testdata/ta_Amon_MRI-CGCM3.nc", destination="/tmp/ta.nc")
+
+        :param path: Path of the file relative to the URL of the service on each node
+        :type path: str
+        :param service: Name of the Marble service that serves the file, defaults to "thredds"
+        :type service: str
+        :param destination: Path that the file is written to, defaults to the basename of `path` in the current
+            directory
+        :type destination: str | None
+        :param session: Session used to make the requests (for example an authenticated session)
+        :type session: requests.Session | None
+        :param hedge_after: Number of seconds to wait for a node to respond before also requesting the file from
+            the next best node, defaults to 1
+        :type hedge_after: float
+        :param timeout: Number of seconds to wait for each node to respond, defaults to 30
+        :type timeout: float | None
+        :raise ServiceNotAvailableError: If no node offers the service
+        :raise RuntimeError: If the file cannot be downloaded from any node
+        :return: The path of the downloaded file
+        :rtype: str
+        """
+        return fetch(
+            self, path, service, destination=destination, session=session, hedge_after=hedge_after, timeout=timeout
+        )
+
+    @property
+    def collectors(self) -> list[Collector]:
+        """Return the collectors that receive a RequestRecord for every request made by this client."""
+        return self._transport.collectors
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """
+        Return a summary of the network requests and registry cache accesses made by this client.
+
+        The summary maps each operation (e.g. "registry", "is_online", "login") to the number of requests,
+        errors, cache hits and misses, bytes received and durations in seconds.
+
+        Statistics are only collected if this client was created with `collectors` (which may be an empty list).
+        """
+        if self._stats is None:
+            return {}
+        return self._stats.summary()
+
     @property
     def registry_uri(self) -> str:
-        """Return the URL of the currently used Marble registry."""
-        return self._registry_uri
+        """
+        Return the URL of the currently used Marble registry.
+
+        If multiple registries are used, this is the URL of the first one (see `registry_uris`).
+        """
+        return self.registry_uris[0]
+
+    @property
+    def registry_uris(self) -> list[str]:
+        """Return the URLs of all currently used Marble registries."""
+        snapshot = self._snapshot
+        return list(snapshot.uris if snapshot is not None else self._registry_uris)
 
     def __getitem__(self, node: str) -> MarbleNode:
         """Return the node with the given name."""
+        snapshot = self._snapshot
+        nodes = snapshot.nodes if snapshot is not None else self._load_nodes(until=node)
         try:
-            return self.nodes[node]
+            return nodes[node]
         except KeyError as err:
             raise UnknownNodeError(f"No node named '{node}' in the Marble network.") from err
 
@@ -112,72 +467,348 @@ class MarbleClient:
         :return: True if the node is present in the registry, False otherwise
         :rtype: bool
         """
-        return node in self.nodes
+        snapshot = self._snapshot
+        nodes = snapshot.nodes if snapshot is not None else self._load_nodes(until=node)
+        return node in nodes
 
-    def _load_registry(self, fallback: bool = True) -> tuple[str, dict[str, Any]]:
+    def refresh(self) -> None:
+        """
+        Load the registries again and replace the current nodes with the nodes in the new version of the registries.
+
+        The registries are loaded in the same way as when this client was created (with the same `registry_urls`,
+        `fallback`, `conflict` and `offline` options, but never streamed). The new nodes replace the current ones
+        atomically: other threads using this client see either all of the old nodes or all of the new nodes, and
+        nodes that were retrieved before the refresh keep referring to the old version of the registry.
+
+        :raises requests.exceptions.RequestException: If the registry cannot be retrieved and `fallback` is False
+        :raise RuntimeError: If cached registry needs to be read but there is no cache or registry snapshot
+        :raise RegistryConflictError: If the same node id is defined in multiple registries and `conflict` is "error"
+        """
+        options = self._registry_options
+        uris, registry = self._load_registries(
+            self._registry_urls, options["fallback"], False, options["conflict"], options["offline"]
+        )
+        nodes = {node_id: MarbleNode(node_id, node_details, client=self) for node_id, node_details in registry}
+        snapshot = RegistrySnapshot(uris, nodes)
+        with self._load_lock:
+            self._pending_nodes = None
+            self._load_error = None
+            self._nodes = nodes
+            self._registry_uris = list(uris)
+            self._snapshot = snapshot
+
+    def _current_snapshot(self) -> RegistrySnapshot:
+        """Return the current registry snapshot, constructing all remaining nodes first if streaming."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self._load_nodes()
+            snapshot = self._snapshot
+        return snapshot
+
+    def _load_nodes(self, until: Optional[str] = None) -> Mapping[str, MarbleNode]:
+        """
+        Construct nodes from the registry entries that have not been loaded yet and return the nodes loaded so far.
+
+        If `until` is given, stop as soon as the node with that id has been constructed. Once all nodes have been
+        constructed, they are published as the client's registry snapshot.
+        """
+        with self._load_lock:
+            if self._snapshot is not None:
+                return self._snapshot.nodes
+            if self._load_error is not None:
+                raise RuntimeError(str(self._load_error)) from self._load_error
+            if until is not None and until in self._nodes:
+                return self._nodes
+            try:
+                if until is not None and isinstance(self._pending_nodes, CachedRegistry):
+                    # only read the entry of the requested node (see CacheBackend.get_registry)
+                    node_details = self._pending_nodes.get(until)
+                    if node_details is not None:
+                        self._nodes[until] = MarbleNode(until, node_details, client=self)
+                    return self._nodes
+                for node_id, node_details in self._pending_nodes:
+                    if node_id not in self._nodes:
+                        self._nodes[node_id] = MarbleNode(node_id, node_details, client=self)
+                    if node_id == until:
+                        return self._nodes
+            except RuntimeError as err:
+                if isinstance(self._pending_nodes, CachedRegistry):
+                    # another process stored a newer version of the registry in the cache and the entries of this
+                    # version have been removed since, read the current version at once instead
+                    self._publish_registry(*self._load_registry_offline(self._registry_urls[0]))
+                    return self._snapshot.nodes
+                self._pending_nodes = None
+                if self._registry_options["fallback"]:
+                    warnings.warn(f"{err} Falling back to cached version")
+                    try:
+                        self._publish_registry(*self._load_registry_offline(self._registry_urls[0]))
+                    except RuntimeError as fallback_err:
+                        self._load_error = fallback_err
+                        raise
+                    return self._snapshot.nodes
+                # the remaining entries cannot be read, fail every later access instead of using a partial registry
+                self._load_error = err
+                raise
+            if isinstance(self._pending_nodes, CachedRegistry):
+                # nodes may have been constructed out of order by lookups
+                self._nodes = {node_id: self._nodes[node_id] for node_id in self._pending_nodes.node_ids}
+            self._pending_nodes = None
+            self._snapshot = RegistrySnapshot(self._registry_uris, self._nodes)
+            return self._snapshot.nodes
+
+    def _publish_registry(self, registry_uri: str, registry: Iterable[tuple[str, dict[str, Any]]]) -> None:
+        """
+        Publish all nodes of `registry` in place of the registry that was being loaded (hold `_load_lock`).
+
+        Nodes that were already constructed are kept if their registry entry is the same in `registry`.
+        """
+        nodes = {}
+        for node_id, node_details in registry:
+            node = self._nodes.get(node_id)
+            if node is None or node._nodedata != node_details:
+                node = MarbleNode(node_id, node_details, client=self)
+            nodes[node_id] = node
+        self._pending_nodes = None
+        self._nodes = nodes
+        self._registry_uris = [registry_uri]
+        self._snapshot = RegistrySnapshot(self._registry_uris, nodes)
+
+    def _load_registries(
+        self, registry_urls: list[str], fallback: bool, stream: bool, conflict: str, offline: bool = False
+    ) -> tuple[list[str], Iterator[tuple[str, dict[str, Any]]]]:
+        """
+        Load all registries concurrently and merge them according to the `conflict` rule.
+
+        If there is only a single registry, it is not merged so that its nodes can be loaded lazily when streaming.
+        """
+        if conflict not in ("first", "last", "newest", "error"):
+            raise ValueError("conflict must be one of 'first', 'last', 'newest' or 'error'.")
+        if len(registry_urls) == 1:
+            registry_uri, registry = self._load_registry(fallback, stream, registry_urls[0], offline)
+            return [registry_uri], registry
+
+        def load(url: str) -> tuple[str, list[tuple[str, dict[str, Any]]]]:
+            registry_uri, registry = self._load_registry(fallback, stream, url, offline)
+            try:
+                return registry_uri, list(registry)
+            except RuntimeError as err:
+                if not stream or not fallback or isinstance(registry, CachedRegistry):
+                    raise
+                # the streamed registry could not be read to the end
+                warnings.warn(f"{err} Falling back to cached version")
+                registry_uri, registry = self._load_registry_offline(url)
+                return registry_uri, list(registry)
+
+        with ThreadPoolExecutor(max_workers=len(registry_urls)) as executor:
+            loaded = list(executor.map(load, registry_urls))
+
+        merged: dict[str, dict[str, Any]] = {}
+        sources: dict[str, str] = {}
+        for registry_uri, registry in loaded:
+            for node_id, node_details in registry:
+                if node_id in merged:
+                    if conflict == "error":
+                        raise RegistryConflictError(
+                            f"Node '{node_id}' is defined in both {sources[node_id]} and {registry_uri}."
+                        )
+                    if conflict == "first" or (
+                        conflict == "newest" and _last_updated(node_details) <= _last_updated(merged[node_id])
+                    ):
+                        continue
+                merged[node_id] = node_details
+                sources[node_id] = registry_uri
+        return [registry_uri for registry_uri, _ in loaded], iter(merged.items())
+
+    def _load_registry(
+        self, fallback: bool = True, stream: bool = False, registry_url: Optional[str] = None, offline: bool = False
+    ) -> tuple[str, Iterator[tuple[str, dict[str, Any]]]]:
+        registry_url = registry_url or NODE_REGISTRY_URL
+        if offline:
+            return self._load_registry_offline(registry_url)
         try:
-            registry_response = requests.get(NODE_REGISTRY_URL)
+            registry_response = self._transport.request(
+                "GET",
+                registry_url,
+                operation="registry",
+                stream=stream,
+                headers={"Accept-Encoding": urllib3.util.request.ACCEPT_ENCODING},
+            )
             registry_response.raise_for_status()
+            if stream:
+                return registry_url, self._stream_registry(registry_response, registry_url)
             registry = registry_response.json()
         except (requests.exceptions.RequestException, requests.exceptions.ConnectionError) as err:
             error = err
-            error_msg = f"Cannot retrieve registry from {NODE_REGISTRY_URL}."
+            error_msg = f"Cannot retrieve registry from {registry_url}."
         except json.JSONDecodeError as err:
             error = err
-            error_msg = f"Could not parse JSON returned from the registry at {NODE_REGISTRY_URL}"
+            error_msg = f"Could not parse JSON returned from the registry at {registry_url}"
         else:
-            self._save_registry_as_cache(registry)
-            return NODE_REGISTRY_URL, registry
+            self._save_registry_as_cache(registry, registry_url)
+            return registry_url, iter(registry.items())
 
         if fallback:
             warnings.warn(f"{error_msg} Falling back to cached version")
-            return f"file://{os.path.realpath(CACHE_FNAME)}", self._load_registry_from_cache()
+            return self._load_registry_offline(registry_url)
         else:
             raise RuntimeError(error_msg) from error
 
-    def _load_registry_from_cache(self) -> dict[str, Any]:
+    def _load_registry_offline(self, registry_url: str) -> tuple[str, Iterator[tuple[str, dict[str, Any]]]]:
+        """
+        Load the registry from the cache or, if the cache cannot be read, from the registry snapshot.
+
+        The snapshot is a copy of the default registry (NODE_REGISTRY_URL) so it is not used for other registries.
+        """
+        cache_uri = self._cache.uri(registry_url)
+        start = time.perf_counter()
         try:
-            with open(CACHE_FNAME) as f:
-                cached_registry = json.load(f)
-        except FileNotFoundError as err:
-            raise RuntimeError(f"Local registry cache not found. No file named {CACHE_FNAME}.") from err
-        except json.JSONDecodeError as err:
-            raise RuntimeError(f"Could not parse JSON returned from the cached registry at {CACHE_FNAME}") from err
-        else:
-            if self._registry_cache_key in cached_registry:
-                registry = cached_registry[self._registry_cache_key]
-                date = dateutil.parser.isoparse(cached_registry[self._registry_cache_last_updated_key])
-            else:
-                # registry is cached in old format, re-cache it in the newer format
-                registry = cached_registry
-                self._save_registry_as_cache(registry)
-                date = "Unknown"
-            print(f"Registry loaded from cache dating: {date}")
-            return registry
-
-    def _save_registry_as_cache(self, registry: dict[str, Any]) -> None:
-        cache_backup = CACHE_FNAME + ".backup"
-
-        # Create cache parent directories if they don't exist
-        os.makedirs(os.path.dirname(CACHE_FNAME), exist_ok=True)
-        if os.path.isfile(CACHE_FNAME):
-            shutil.copy(CACHE_FNAME, cache_backup)
+            registry = self._load_registry_from_cache(registry_url)
+        except RuntimeError:
+            self._transport.record_cache("registry_cache", cache_uri, "miss", time.perf_counter() - start)
+            if registry_url != NODE_REGISTRY_URL or not os.path.isfile(REGISTRY_SNAPSHOT):
+                raise
+            registry, date = self._read_registry_file(REGISTRY_SNAPSHOT)
+            print(f"Registry loaded from snapshot dating: {date}")
+            return f"file://{os.path.realpath(REGISTRY_SNAPSHOT)}", iter(registry.items())
+        self._transport.record_cache("registry_cache", cache_uri, "hit", time.perf_counter() - start)
+        return cache_uri, registry
+
+    def _stream_registry(self, response: requests.Response, registry_url: str) -> Iterator[tuple[str, dict[str, Any]]]:
+        """
+        Yield (node id, node details) pairs while the registry is being downloaded.
+
+        The raw bytes are written to the cache as they are read (wrapped in the same format used by
+        `_save_registry_as_cache`). The cache is only updated once the whole registry has been read.
+        """
+        import ijson  # type: ignore
 
         try:
-            with open(CACHE_FNAME, "w") as f:
-                data = {
-                    self._registry_cache_key: registry,
-                    self._registry_cache_last_updated_key: datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
-                }
-                json.dump(data, f)
+            writer = self._cache.writer(registry_url)
         except OSError:
-            # If the cache file cannot be written, then restore from backup files
-            shutil.copy(cache_backup, CACHE_FNAME)
+            writer = None
+        try:
+            cache_file = None if writer is None else compressed_writer(writer, CACHE_COMPRESSION)
+        except OSError as err:
+            warnings.warn(f"Could not write the registry cache to {self._cache.uri(registry_url)}: {err}")
+            writer.close()
+            writer = cache_file = None
+        try:
+            if cache_file is not None:
+                last_updated = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+                cache_file.write(
+                    f'{{"{self._registry_cache_last_updated_key}": "{last_updated}", '
+                    f'"{self._registry_cache_key}": '.encode()
+                )
+            yield from ijson.kvitems(_TeeReader(response.raw, cache_file), "", use_float=True)
+            if cache_file is not None:
+                cache_file.write(b"}")
+                if cache_file is not writer:
+                    cache_file.close()
+                try:
+                    writer.commit()
+                except OSError as err:
+                    warnings.warn(f"Could not write the registry cache to {self._cache.uri(registry_url)}: {err}")
+        except ijson.JSONError as err:
+            raise RuntimeError(f"Could not parse JSON returned from the registry at {registry_url}.") from err
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as err:
+            raise RuntimeError(f"Cannot retrieve registry from {registry_url}.") from err
         finally:
-            if os.path.isfile(cache_backup):
-                os.remove(cache_backup)
+            response.close()
+            if writer is not None:
+                writer.close()
+
+    @classmethod
+    def _read_registry_file(cls, fname: str) -> tuple[dict[str, Any], Union[datetime.datetime, str]]:
+        """
+        Read a registry from a file that is either in the cache format or is a copy of the registry itself.
+
+        Return the registry and the date that it was cached (or "Unknown" if the file is a copy of the registry).
+        """
+        try:
+            with open(fname, "rb") as f:
+                data = decompress(f.read())
+        except FileNotFoundError as err:
+            raise RuntimeError(f"Local registry cache not found. No file named {fname}.") from err
+        except OSError as err:
+            # the file is truncated, or was compressed with an unsupported or corrupt compression format
+            raise RuntimeError(f"Could not read the cached registry at {fname}") from err
+        return cls._parse_registry_cache(data, fname)
+
+    @classmethod
+    def _parse_registry_cache(cls, data: bytes, uri: str) -> tuple[dict[str, Any], Union[datetime.datetime, str]]:
+        """Parse a (decompressed) registry cache, see `_read_registry_file`."""
+        try:
+            registry, last_updated = _parse_registry_cache(data)
+        except ValueError as err:
+            raise RuntimeError(f"Could not parse JSON returned from the cached registry at {uri}") from err
+        return registry, "Unknown" if last_updated is None else dateutil.parser.isoparse(last_updated)
+
+    def _load_registry_from_cache(self, registry_url: Optional[str] = None) -> CachedRegistry:
+        registry_url = registry_url or NODE_REGISTRY_URL
+        cache_uri = self._cache.uri(registry_url)
+        try:
+            registry = self._cache.get_registry(registry_url)
+        except OSError as err:
+            raise RuntimeError(f"Could not read the cached registry at {cache_uri}") from err
+        if registry is None:
+            raise RuntimeError(f"Local registry cache not found at {cache_uri}.")
+        if registry.last_updated is None:
+            # registry is cached in old format, re-cache it in the newer format
+            entries = dict(registry)
+            self._save_registry_as_cache(entries, registry_url)
+            registry = CachedRegistry(entries)
+            print("Registry loaded from cache dating: Unknown")
+        else:
+            print(f"Registry loaded from cache dating: {dateutil.parser.isoparse(registry.last_updated)}")
+        return registry
+
+    @classmethod
+    def _serialize_registry_cache(cls, registry: dict[str, Any]) -> bytes:
+        """Return the registry in the cache format, compressed with CACHE_COMPRESSION."""
+        return _serialize_registry_cache(registry, compression=CACHE_COMPRESSION)
+
+    def _save_registry_as_cache(self, registry: dict[str, Any], registry_url: Optional[str] = None) -> None:
+        registry_url = registry_url or NODE_REGISTRY_URL
+        try:
+            self._cache.set_registry(registry_url, registry)
+        except OSError as err:
+            # the current cache is kept since backends replace values atomically
+            warnings.warn(f"Could not write the registry cache to {self._cache.uri(registry_url)}: {err}")
+
+
+def _jupyterhub_session_cookies(transport: Transport) -> dict[str, str]:
+    """Return the login cookies of the current user, retrieved through the JupyterHub API."""
+    r = transport.request(
+        "GET",
+        f"{os.getenv('JUPYTERHUB_API_URL')}/users/{os.getenv('JUPYTERHUB_USER')}",
+        operation="this_session",
+        headers={"Authorization": f"token {os.getenv('JUPYTERHUB_API_TOKEN')}"},
+    )
+    try:
+        r.raise_for_status()
+    except requests.HTTPError as err:
+        raise JupyterEnvironmentError("Cannot retrieve login cookies through the JupyterHub API.") from err
+    return r.json().get("auth_state", {}).get("magpie_cookies", {})
+
+
+def _last_updated(node_details: dict[str, Any]) -> datetime.datetime:
+    """Return the last_updated date of a registry entry (or the earliest possible date if it is not set)."""
+    try:
+        return dateutil.parser.isoparse(node_details["last_updated"])
+    except (KeyError, TypeError, ValueError):
+        return datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+
+class _TeeReader:
+    """File-like object that reads decoded content from a raw response and copies everything read to `sink`."""
 
+    def __init__(self, raw: urllib3.BaseHTTPResponse, sink: Optional[BinaryIO]) -> None:
+        self._raw = raw
+        self._sink = sink
 
-if __name__ == "__main__":
-    d = MarbleClient()
-    print(d.nodes)
+    def read(self, size: int = -1) -> bytes:
+        """Read up to `size` bytes."""
+        data = self._raw.read(None if size < 0 else size, decode_content=True)
+        if self._sink is not None:
+            self._sink.write(data)
+        return data
@@ -1,8 +1,21 @@
 import os
+from typing import Optional
 
 from platformdirs import user_cache_dir
 
-__all__ = ("NODE_REGISTRY_URL", "CACHE_FNAME")
+__all__ = (
+    "NODE_REGISTRY_URL",
+    "NODE_REGISTRY_URLS",
+    "CACHE_FNAME",
+    "CACHE_COMPRESSION",
+    "CACHE_URL",
+    "OFFLINE",
+    "REGISTRY_SNAPSHOT",
+    "CAPABILITIES_TTL",
+    "NODE_RATE_LIMIT",
+    "NODE_RATE_BURST",
+    "NODE_MAX_CONCURRENCY",
+)
 
 # Marble node registry URL
 NODE_REGISTRY_URL: str = os.getenv(
@@ -10,7 +23,41 @@ NODE_REGISTRY_URL: str = os.getenv(
     "https://raw.githubusercontent.com/DACCS-Climate/DACCS-node-registry/current-registry/node_registry.json",
 )
 
+# All Marble node registry URLs (whitespace separated). Nodes from all registries are merged.
+NODE_REGISTRY_URLS: list[str] = os.getenv("MARBLE_NODE_REGISTRY_URLS", NODE_REGISTRY_URL).split()
+
 _CACHE_DIR: str = os.getenv("MARBLE_CACHE_DIR", user_cache_dir("marble_client_python"))
 
 # location to write registry cache
 CACHE_FNAME: str = os.path.join(_CACHE_DIR, "registry.cached.json")
+
+# where to cache the registry: file:///path/to/directory, memory:// or redis://host:port/db (defaults to files in
+# the cache directory)
+CACHE_URL: str = os.getenv("MARBLE_CACHE_URL", "")
+
+# compression used when writing the registry cache ("gzip", "zstd" or "none")
+CACHE_COMPRESSION: str = os.getenv("MARBLE_CACHE_COMPRESSION", "none").lower()
+
+# never access the network to load the registry (use the cache or the registry snapshot instead)
+OFFLINE: bool = os.getenv("MARBLE_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# registry snapshot to use if the cache cannot be read (defaults to the snapshot bundled with this package, if any)
+REGISTRY_SNAPSHOT: str = os.getenv(
+    "MARBLE_REGISTRY_SNAPSHOT", os.path.join(os.path.dirname(__file__), "data", "registry.snapshot.json")
+)
+
+# number of seconds that service capabilities are cached for before they are revalidated
+CAPABILITIES_TTL: float = float(os.getenv("MARBLE_CAPABILITIES_TTL", 3600))
+
+# maximum average number of requests per second sent to each node (unlimited if not set)
+NODE_RATE_LIMIT: Optional[float] = (
+    float(os.environ["MARBLE_NODE_RATE_LIMIT"]) if os.getenv("MARBLE_NODE_RATE_LIMIT") else None
+)
+
+# number of requests that can be sent to a node at once before NODE_RATE_LIMIT applies
+NODE_RATE_BURST: int = int(os.getenv("MARBLE_NODE_RATE_BURST", 1))
+
+# maximum number of requests in progress to each node at the same time (unlimited if not set)
+NODE_MAX_CONCURRENCY: Optional[int] = (
+    int(os.environ["MARBLE_NODE_MAX_CONCURRENCY"]) if os.getenv("MARBLE_NODE_MAX_CONCURRENCY") else None
+)
@@ -12,3 +12,7 @@ class UnknownNodeError(MarbleBaseError):
 
 class JupyterEnvironmentError(MarbleBaseError):
     """Indicates that there is an issue detecting features only available in Jupyterlab."""
+
+
+class RegistryConflictError(MarbleBaseError):
+    """Indicates that the same node is defined in multiple registries."""
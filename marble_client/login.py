@@ -0,0 +1,173 @@
+import getpass
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+import requests
+
+if TYPE_CHECKING:
+    from marble_client.node import MarbleNode
+
+__all__ = ["login_nodes", "login_widget", "login_stdin"]
+
+_FONT_FAMILY = "Helvetica Neue"
+_FONT_SIZE = "16px"
+_PRIMARY_COLOUR = "#304FFE"
+_LABEL_STYLE = {"font_family": _FONT_FAMILY, "font_size": _FONT_SIZE, "text_color": _PRIMARY_COLOUR}
+_INPUT_STYLE = {"description_width": "initial"}
+_BUTTON_STYLE = {
+    "font_family": _FONT_FAMILY,
+    "font_size": _FONT_SIZE,
+    "button_color": _PRIMARY_COLOUR,
+    "text_color": "white",
+}
+
+
+def login_nodes(
+    nodes: list["MarbleNode"],
+    session: requests.Session,
+    user_name: Optional[str],
+    password: Optional[str],
+    max_workers: int = 8,
+    on_result: Optional[Callable[[str, Union[str, Exception]], None]] = None,
+) -> dict[str, Union[str, Exception]]:
+    """
+    Log in to all nodes concurrently with the same credentials, adding the login cookies to session.
+
+    :param nodes: Nodes to log in to
+    :type nodes: list[MarbleNode]
+    :param session: Session that receives the login cookies of every node
+    :type session: requests.Session
+    :param user_name: Username or email
+    :type user_name: str | None
+    :param password: Password
+    :type password: str | None
+    :param max_workers: Maximum number of nodes to log in to at the same time, defaults to 8
+    :type max_workers: int
+    :param on_result: Function called with the node id and the result as soon as each login completes
+    :type on_result: Callable[[str, str | Exception], None] | None
+    :return: A dictionary mapping node ids to the success message or the error (a RuntimeError or a
+        requests.exceptions.RequestException) of each login
+    :rtype: dict[str, str | Exception]
+    """
+    results: dict[str, Union[str, Exception]] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(node._login, session, user_name, password): node.id for node in nodes}
+        for future in as_completed(futures):
+            node_id = futures[future]
+            try:
+                results[node_id] = future.result()
+            except (RuntimeError, requests.exceptions.RequestException) as err:
+                results[node_id] = err
+            if on_result is not None:
+                on_result(node_id, results[node_id])
+    return {node.id: results[node.id] for node in nodes}
+
+
+def login_stdin(nodes: list["MarbleNode"], session: requests.Session, max_workers: int = 8) -> None:
+    """
+    Prompt for credentials on stdin and log in to all nodes concurrently.
+
+    :raise RuntimeError: If the login to any node fails
+    """
+    results = login_nodes(
+        nodes, session, input("Username or email: "), getpass.getpass("Password: "), max_workers=max_workers
+    )
+    if len(nodes) == 1:
+        (result,) = results.values()
+        if isinstance(result, Exception):
+            raise result
+        print(result)
+        return
+    failed = {}
+    for node_id, result in results.items():
+        if isinstance(result, Exception):
+            failed[node_id] = result
+        else:
+            print(f"{node_id}: {result}")
+    if failed:
+        raise RuntimeError("Unable to log in to " + "; ".join(f"{node_id}: {err}" for node_id, err in failed.items()))
+
+
+def login_widget(
+    nodes: list["MarbleNode"], session: requests.Session, selectable: bool = False, max_workers: int = 8
+) -> Any:
+    """
+    Display a login form and return it (an ipywidgets.VBox).
+
+    Logins are performed on a background thread so that the kernel stays responsive while waiting for the nodes to
+    respond. The status of each login is shown as soon as it completes.
+
+    :param nodes: Nodes to log in to
+    :type nodes: list[MarbleNode]
+    :param session: Session that receives the login cookies of every node
+    :type session: requests.Session
+    :param selectable: If True, the form lets the user choose which of the nodes to log in to (none are selected
+        initially so that credentials are only sent to the nodes that the user chooses)
+    :type selectable: bool
+    :param max_workers: Maximum number of nodes to log in to at the same time, defaults to 8
+    :type max_workers: int
+    """
+    import ipywidgets  # type: ignore
+    from IPython.display import display  # type: ignore
+
+    nodes_by_id = {node.id: node for node in nodes}
+    node_select = ipywidgets.SelectMultiple(
+        options=list(nodes_by_id),
+        value=[] if selectable else list(nodes_by_id),
+        description="Nodes",
+        style=_INPUT_STYLE,
+    )
+    username_label = ipywidgets.Label(value="Username or email", style=_LABEL_STYLE)
+    username_input = ipywidgets.Text(style=_INPUT_STYLE)
+    password_label = ipywidgets.Label(value="Password", style=_LABEL_STYLE)
+    password_input = ipywidgets.Password(style=_INPUT_STYLE)
+    login_button = ipywidgets.Button(description="Login", tooltip="Login", style=_BUTTON_STYLE)
+    progress = ipywidgets.IntProgress(value=0, min=0, max=1, layout={"visibility": "hidden"})
+    status = ipywidgets.VBox([])
+    children = [username_label, username_input, password_label, password_input, login_button, progress, status]
+    widgets = ipywidgets.VBox(([node_select] if selectable else []) + children)
+
+    def _label(value: str, colour: str = _PRIMARY_COLOUR) -> Any:
+        return ipywidgets.Label(value=value, style={**_LABEL_STYLE, "text_color": colour})
+
+    def _on_login_click(*_) -> None:
+        selected = [nodes_by_id[node_id] for node_id in node_select.value]
+        if not selected:
+            status.children = [_label("Select at least one node", "red")]
+            return
+        labels = {
+            node.id: _label(f"Logging in to {node.id}..." if selectable else "Logging in...") for node in selected
+        }
+        status.children = list(labels.values())
+        progress.value = 0
+        progress.max = len(selected)
+        progress.layout.visibility = "visible"
+        login_button.disabled = True
+
+        def _show_result(node_id: str, result: Union[str, Exception]) -> None:
+            message = f"{node_id}: {result}" if selectable else str(result)
+            labels[node_id].value = message
+            labels[node_id].style.text_color = "red" if isinstance(result, Exception) else "green"
+            progress.value += 1
+
+        def _run() -> None:
+            try:
+                login_nodes(
+                    selected,
+                    session,
+                    username_input.value,
+                    password_input.value,
+                    max_workers=max_workers,
+                    on_result=_show_result,
+                )
+            finally:
+                progress.layout.visibility = "hidden"
+                login_button.disabled = False
+
+        # widget callbacks run on the kernel's event loop, don't block it while waiting for the nodes
+        threading.Thread(target=_run, daemon=True).start()
+
+    login_button.on_click(_on_login_click)
+    display(widgets)
+    return widgets
@@ -0,0 +1,150 @@
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Literal, Optional
+
+__all__ = ["RequestRecord", "Collector", "InMemoryCollector", "StatsCollector", "OpenTelemetryCollector"]
+
+
+@dataclass(frozen=True)
+class RequestRecord:
+    """
+    Information about a single network request or registry cache access made by a MarbleClient.
+
+    Timing values are in seconds. `elapsed` is the time between sending the request and receiving the
+    response headers and `duration` is the total time including reading the response body.
+
+    `shared` is True if no request was sent because the response of an identical concurrent request was reused.
+    `queue_delay` is the time spent waiting for the node's rate limit or concurrency limit before the request was
+    sent (None if the node is not rate limited) and is not included in `duration`.
+    """
+
+    operation: str
+    method: str
+    url: str
+    start: float
+    duration: float
+    node_id: Optional[str] = None
+    status: Optional[int] = None
+    bytes: Optional[int] = None
+    elapsed: Optional[float] = None
+    cache: Optional[Literal["hit", "miss"]] = None
+    error: Optional[str] = None
+    shared: bool = False
+    queue_delay: Optional[float] = None
+
+
+Collector = Callable[[RequestRecord], None]
+
+
+class InMemoryCollector:
+    """Collector that keeps every record in memory (useful for testing and debugging)."""
+
+    def __init__(self) -> None:
+        self.records: list[RequestRecord] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: RequestRecord) -> None:
+        """Store the record."""
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self) -> None:
+        """Remove all stored records."""
+        with self._lock:
+            self.records.clear()
+
+
+class StatsCollector:
+    """Collector that aggregates records by operation."""
+
+    def __init__(self) -> None:
+        self._stats: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record: RequestRecord) -> None:
+        """Add the record to the aggregated statistics."""
+        with self._lock:
+            stats = self._stats.setdefault(
+                record.operation,
+                {
+                    "count": 0,
+                    "errors": 0,
+                    "total_duration": 0.0,
+                    "max_duration": 0.0,
+                    "bytes": 0,
+                    "cache_hits": 0,
+                    "cache_misses": 0,
+                    "shared": 0,
+                    "total_queue_delay": 0.0,
+                    "max_queue_delay": 0.0,
+                },
+            )
+            stats["count"] += 1
+            stats["total_duration"] += record.duration
+            stats["max_duration"] = max(stats["max_duration"], record.duration)
+            stats["bytes"] += record.bytes or 0
+            if record.error is not None or (record.status is not None and record.status >= 400):
+                stats["errors"] += 1
+            if record.shared:
+                stats["shared"] += 1
+            if record.queue_delay is not None:
+                stats["total_queue_delay"] += record.queue_delay
+                stats["max_queue_delay"] = max(stats["max_queue_delay"], record.queue_delay)
+            if record.cache == "hit":
+                stats["cache_hits"] += 1
+            elif record.cache == "miss":
+                stats["cache_misses"] += 1
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """
+        Return the aggregated statistics for each operation.
+
+        The mean duration for each operation is included as "mean_duration".
+        """
+        with self._lock:
+            return {
+                operation: {**stats, "mean_duration": stats["total_duration"] / stats["count"]}
+                for operation, stats in self._stats.items()
+            }
+
+
+class OpenTelemetryCollector:
+    """
+    Collector that emits an OpenTelemetry span for every record.
+
+    This requires the opentelemetry-api package to be installed.
+    """
+
+    def __init__(self, tracer: Any = None) -> None:
+        from opentelemetry import trace  # type: ignore
+
+        self._trace = trace
+        self._tracer = tracer or trace.get_tracer("marble_client")
+
+    def __call__(self, record: RequestRecord) -> None:
+        """Emit a span for the record."""
+        attributes = {
+            "marble.operation": record.operation,
+            "http.request.method": record.method,
+            "url.full": record.url,
+        }
+        if record.node_id is not None:
+            attributes["marble.node_id"] = record.node_id
+        if record.status is not None:
+            attributes["http.response.status_code"] = record.status
+        if record.bytes is not None:
+            attributes["http.response.body.size"] = record.bytes
+        if record.cache is not None:
+            attributes["marble.cache"] = record.cache
+        if record.shared:
+            attributes["marble.shared"] = True
+        if record.queue_delay is not None:
+            attributes["marble.queue_delay"] = record.queue_delay
+        start_time = int(record.start * 1e9)
+        span = self._tracer.start_span(
+            f"marble_client {record.operation}", start_time=start_time, attributes=attributes
+        )
+        if record.error is not None:
+            span.set_attribute("error.type", record.error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, record.error))
+        span.end(end_time=start_time + int(record.duration * 1e9))
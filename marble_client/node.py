@@ -1,4 +1,4 @@
-import getpass
+import time
 import warnings
 from datetime import datetime
 from typing import TYPE_CHECKING, Literal, Optional
@@ -7,6 +7,7 @@ import dateutil.parser
 import requests
 
 from marble_client.exceptions import ServiceNotAvailableError
+from marble_client.login import login_stdin, login_widget
 from marble_client.services import MarbleService
 from marble_client.utils import check_rich_output_shell
 
@@ -43,12 +44,16 @@ class MarbleNode:
 
     def is_online(self) -> bool:
         """Return True iff the node is currently online."""
+        start = time.perf_counter()
         try:
-            registry = requests.get(self.url)
-            registry.raise_for_status()
-            return True
+            response = self._client._transport.request("GET", self.url, operation="is_online", node_id=self.id)
+            response.raise_for_status()
         except (requests.exceptions.RequestException, requests.exceptions.ConnectionError):
+            self._client._health.record_failure(self.id)
             return False
+        # the response time is used to choose between replicas (see MarbleClient.fetch)
+        self._client._health.record_success(self.id, time.perf_counter() - start)
+        return True
 
     @property
     def id(self) -> str:
@@ -171,8 +176,12 @@ class MarbleNode:
             raise RuntimeError("Username or email is required")
         if password is None or not password.strip():
             raise RuntimeError("Password is required")
-        response = session.post(
+        response = self._client._transport.request(
+            "POST",
             self.url.rstrip("/") + "/magpie/signin",
+            operation="login",
+            node_id=self.id,
+            session=session,
             json={"user_name": user_name, "password": password},
         )
         if response.ok:
@@ -182,63 +191,6 @@ class MarbleNode:
         except requests.exceptions.JSONDecodeError as e:
             raise RuntimeError("Unable to log in") from e
 
-    def _widget_login(self, session: requests.Session) -> tuple[str, str]:
-        import ipywidgets  # type: ignore
-        from IPython.display import display  # type: ignore
-
-        font_family = "Helvetica Neue"
-        font_size = "16px"
-        primary_colour = "#304FFE"
-        label_style = {"font_family": font_family, "font_size": font_size, "text_color": primary_colour}
-        input_style = {"description_width": "initial"}
-        button_style = {
-            "font_family": font_family,
-            "font_size": font_size,
-            "button_color": primary_colour,
-            "text_color": "white",
-        }
-        credentials = {}
-
-        username_label = ipywidgets.Label(value="Username or email", style=label_style)
-        username_input = ipywidgets.Text(style=input_style)
-        password_label = ipywidgets.Label(value="Password", style=label_style)
-        password_input = ipywidgets.Password(style=input_style)
-        login_button = ipywidgets.Button(description="Login", tooltip="Login", style=button_style)
-        output = ipywidgets.Output()
-        widgets = ipywidgets.VBox(
-            [username_label, username_input, password_label, password_input, login_button, output]
-        )
-
-        def _on_username_change(change: dict) -> None:
-            try:
-                credentials["user_name"] = change["new"]
-            except KeyError as e:
-                raise Exception(str(e), change)
-
-        username_input.observe(_on_username_change, names="value")
-
-        def _on_password_change(change: dict) -> None:
-            credentials["password"] = change["new"]
-
-        password_input.observe(_on_password_change, names="value")
-
-        def _on_login_click(*_) -> None:
-            output.clear_output()
-            with output:
-                try:
-                    message = self._login(session, credentials.get("user_name"), credentials.get("password"))
-                except RuntimeError as e:
-                    display(ipywidgets.Label(value=str(e), style={**label_style, "text_color": "red"}))
-                else:
-                    display(ipywidgets.Label(value=message, style={**label_style, "text_color": "green"}))
-
-        login_button.on_click(_on_login_click)
-        display(widgets)
-
-    def _stdin_login(self, session: requests.Session) -> tuple[str, str]:
-        message = self._login(session, input("Username or email: "), getpass.getpass("Password: "))
-        print(message)
-
     def login(
         self, session: requests.Session | None = None, input_type: Literal["stdin", "widget"] | None = None
     ) -> requests.Session:
@@ -247,6 +199,8 @@ class MarbleNode:
 
         This will get user name and password using user input using jupyter widgets
         if available. Otherwise it will prompt the user to input details from stdin.
+        When using widgets, this returns immediately and the login is completed in the
+        background when the user clicks the login button.
 
         If you want to force the function to use either stdin or widgets specify "stdin"
         or "widget" as the input type. Otherwise, this function will make its best guess
@@ -257,9 +211,9 @@ class MarbleNode:
         if input_type is None:
             input_type = "widget" if check_rich_output_shell() else "stdin"
         if input_type == "widget":
-            self._widget_login(session)
+            login_widget([self], session)
         elif input_type == "stdin":
-            self._stdin_login(session)
+            login_stdin([self], session)
         else:
             raise TypeError("input_type must be one of 'stdin', 'widget' or None.")
 
@@ -0,0 +1,212 @@
+import copy
+import math
+import operator
+import re
+from array import array
+from collections.abc import Mapping
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator, Optional, Union
+
+if TYPE_CHECKING:
+    from marble_client.node import MarbleNode
+
+__all__ = ["NodeView"]
+
+_VERSION_OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+}
+_VERSION_RE = re.compile(r"\s*v?(\d+(?:\.\d+)*)")
+_VERSION_CLAUSE_RE = re.compile(r"\s*(>=|<=|==|!=|>|<)?\s*v?(\d+(?:\.\d+)*)\s*")
+
+
+def _parse_version(version: Any) -> Optional[tuple[int, ...]]:
+    """Return the numeric release part of a version string (e.g. "2.4.1-rc1" -> (2, 4, 1)) or None if there is none."""
+    match = _VERSION_RE.match(str(version)) if version is not None else None
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.group(1).split("."))
+
+
+def _version_matcher(spec: str) -> Callable[[tuple[int, ...]], bool]:
+    """
+    Return a function that checks whether a parsed version satisfies spec.
+
+    The spec is a comma separated list of clauses (e.g. ">=2.4,<3"). A version without an operator must match exactly.
+    Missing trailing parts are treated as 0 so "2.4" is equal to "2.4.0".
+    """
+    clauses = []
+    for clause in spec.split(","):
+        match = _VERSION_CLAUSE_RE.fullmatch(clause)
+        if match is None:
+            raise ValueError(f"Invalid version specifier '{spec}'")
+        clauses.append((_VERSION_OPERATORS[match.group(1) or "=="], _parse_version(match.group(2))))
+
+    def matches(version: tuple[int, ...]) -> bool:
+        for op, target in clauses:
+            length = max(len(version), len(target))
+            if not op(version + (0,) * (length - len(version)), target + (0,) * (length - len(target))):
+                return False
+        return True
+
+    return matches
+
+
+class _NodeColumns:
+    """
+    Attributes of every node in a registry, stored by column.
+
+    This allows filters to be evaluated without accessing (or parsing the registry data of) individual nodes.
+    """
+
+    def __init__(self, registry: Iterable[tuple[str, dict[str, Any]]]) -> None:
+        self.ids: list[str] = []
+        self.versions: list[Optional[tuple[int, ...]]] = []
+        self.affiliations: list[Optional[str]] = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.services: dict[str, set[int]] = {}
+        for position, (node_id, node_details) in enumerate(registry):
+            self.ids.append(node_id)
+            self.versions.append(_parse_version(node_details.get("version")))
+            self.affiliations.append(node_details.get("affiliation"))
+            location = node_details.get("location") or {}
+            self.latitudes.append(float(location.get("latitude", math.nan)))
+            self.longitudes.append(float(location.get("longitude", math.nan)))
+            for service in node_details.get("services", []):
+                self.services.setdefault(service["name"], set()).add(position)
+
+    def select_version(self, spec: str) -> set[int]:
+        matches = _version_matcher(spec)
+        return {position for position, version in enumerate(self.versions) if version is not None and matches(version)}
+
+    def select_services(self, services: Iterable[str]) -> set[int]:
+        selected = set(range(len(self.ids)))
+        for service in services:
+            selected &= self.services.get(service, set())
+        return selected
+
+    def select_affiliation(self, affiliation: str) -> set[int]:
+        return {position for position, value in enumerate(self.affiliations) if value == affiliation}
+
+    def select_bbox(self, bbox: tuple[float, float, float, float]) -> set[int]:
+        west, south, east, north = bbox
+        selected = set()
+        for position, (latitude, longitude) in enumerate(zip(self.latitudes, self.longitudes)):
+            if not south <= latitude <= north:
+                continue  # also excludes nodes without a location (nan)
+            # a bbox with west > east crosses the antimeridian
+            if (west <= longitude <= east) if west <= east else (longitude >= west or longitude <= east):
+                selected.add(position)
+        return selected
+
+
+class NodeView(Mapping):
+    """
+    Read-only mapping of node ids to the nodes in a registry (it can be used like a dict).
+
+    Use `filter` to select nodes by their attributes. Filters are evaluated against the attributes of all nodes,
+    which are extracted once when the registry is loaded. The returned views are lazy: a filter is only evaluated
+    when the contents of the view are first accessed.
+    """
+
+    def __init__(self, nodes: dict[str, "MarbleNode"]) -> None:
+        """
+        Initialize a view of all nodes.
+
+        :param nodes: Mapping of node ids to nodes. This must not be modified after the view is created.
+        :type nodes: dict[str, MarbleNode]
+        """
+        self._nodes = nodes
+        self._columns = _NodeColumns((node_id, node._nodedata) for node_id, node in nodes.items())
+        self._selectors: tuple[Callable[[_NodeColumns], set[int]], ...] = ()
+        # the ids of the nodes in this view (in registry order) and the same ids as a set, computed when first needed.
+        # Both are assigned at once so that other threads never see one without the other.
+        self._selection: Optional[tuple[list[str], frozenset[str]]] = None
+
+    def _selected(self) -> tuple[list[str], frozenset[str]]:
+        """Return the ids of the nodes in this view (in registry order) and the same ids as a set."""
+        selection = self._selection
+        if selection is None:
+            selected = set(range(len(self._columns.ids)))
+            for selector in self._selectors:
+                selected &= selector(self._columns)
+            ids = [self._columns.ids[position] for position in sorted(selected)]
+            selection = self._selection = (ids, frozenset(ids))
+        return selection
+
+    def filter(
+        self,
+        version: Optional[str] = None,
+        has_service: Union[str, Iterable[str], None] = None,
+        affiliation: Optional[str] = None,
+        bbox: Optional[tuple[float, float, float, float]] = None,
+    ) -> "NodeView":
+        """
+        Return a view of the nodes in this view that match all the given conditions.
+
+        E.g.::
+
+            client.nodes.filter(version=">=2.4", has_service="thredds", bbox=(-80, 40, -70, 50))
+
+        :param version: Version specifier that the node's version must satisfy. This is a comma separated list of
+            comparisons (using >=, <=, >, <, == or !=) such as ">=2.4,<3". A version without a comparison operator
+            must match exactly.
+        :type version: str | None
+        :param has_service: Name of a service (or names of services) that the node must offer
+        :type has_service: str | Iterable[str] | None
+        :param affiliation: Affiliation of the node
+        :type affiliation: str | None
+        :param bbox: Bounding box (west, south, east, north) in degrees that the node's location must be in
+        :type bbox: tuple[float, float, float, float] | None
+        :raises ValueError: If the version specifier is invalid
+        :return: A lazy view of the matching nodes
+        :rtype: NodeView
+        """
+        selectors = list(self._selectors)
+        if version is not None:
+            _version_matcher(version)  # raise invalid specifiers now, not when the view is evaluated
+            selectors.append(lambda columns: columns.select_version(version))
+        if has_service is not None:
+            services = [has_service] if isinstance(has_service, str) else list(has_service)
+            selectors.append(lambda columns: columns.select_services(services))
+        if affiliation is not None:
+            selectors.append(lambda columns: columns.select_affiliation(affiliation))
+        if bbox is not None:
+            bbox = tuple(bbox)
+            selectors.append(lambda columns: columns.select_bbox(bbox))
+        view = copy.copy(self)
+        view._selectors = tuple(selectors)
+        view._selection = None
+        return view
+
+    def __getitem__(self, node_id: str) -> "MarbleNode":
+        """Return the node with this id if it is in this view."""
+        if self._selectors and node_id not in self:
+            raise KeyError(node_id)
+        return self._nodes[node_id]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the ids of the nodes in this view."""
+        if not self._selectors:
+            return iter(self._nodes)
+        return iter(self._selected()[0])
+
+    def __len__(self) -> int:
+        """Return the number of nodes in this view."""
+        if not self._selectors:
+            return len(self._nodes)
+        return len(self._selected()[0])
+
+    def __contains__(self, node_id: object) -> bool:
+        """Return True if the node with this id is in this view."""
+        if not self._selectors:
+            return node_id in self._nodes
+        return node_id in self._selected()[1]
+
+    def __repr__(self) -> str:
+        """Return the repr of a dict with the same contents."""
+        return repr(dict(self.items()))
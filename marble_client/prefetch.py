@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Optional
+
+from marble_client.exceptions import JupyterEnvironmentError
+from marble_client.utils import check_jupyterlab
+
+if TYPE_CHECKING:
+    from marble_client.snapshot import RegistrySnapshot
+
+__all__ = ["start", "load_ipython_extension"]
+
+_lock = threading.Lock()
+_futures: dict[str, Future] = {}
+_local = threading.local()
+
+
+def _load_registry() -> "RegistrySnapshot":
+    from marble_client.client import MarbleClient
+
+    # the client created here must load the registry itself instead of waiting for this prefetch
+    _local.prefetching = True
+    try:
+        client = MarbleClient()
+    finally:
+        _local.prefetching = False
+    snapshot = client._current_snapshot()
+    # build the index used by MarbleClient.this_node now as well
+    snapshot.node_by_hostname(None)
+    return snapshot
+
+
+def _load_session_cookies() -> dict[str, str]:
+    from marble_client.client import _jupyterhub_session_cookies
+    from marble_client.transport import Transport
+
+    return _jupyterhub_session_cookies(Transport())
+
+
+@check_jupyterlab
+def _start() -> None:
+    with _lock:
+        if _futures:
+            return
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="marble_client_prefetch")
+        _futures["registry"] = executor.submit(_load_registry)
+        _futures["session_cookies"] = executor.submit(_load_session_cookies)
+        executor.shutdown(wait=False)
+
+
+def start() -> bool:
+    """
+    Start loading the registry and the login cookies of the current user in the background.
+
+    The next MarbleClient created with the default registry options uses the prefetched registry (with its nodes
+    and the index used by `MarbleClient.this_node` already built), and the next call to `MarbleClient.this_session`
+    uses the prefetched cookies, instead of waiting for new requests. Prefetched
+    values are only used once. If prefetching fails, they are requested again as usual.
+
+    This only prefetches in a Marble Jupyterlab environment.
+
+    :return: True if prefetching was started (or had already been started), False if this is not a Marble
+        Jupyterlab environment
+    :rtype: bool
+    """
+    try:
+        _start()
+    except JupyterEnvironmentError:
+        return False
+    return True
+
+
+def _take(name: str) -> Optional[Any]:
+    """Wait for a prefetched value, return it (or None if it was not prefetched or failed) and forget it."""
+    if getattr(_local, "prefetching", False):
+        return None
+    with _lock:
+        future = _futures.pop(name, None)
+    if future is None or future.exception() is not None:
+        return None
+    return future.result()
+
+
+def take_registry() -> Optional["RegistrySnapshot"]:
+    """Return the prefetched registry (with its nodes already constructed), or None if there is none."""
+    return _take("registry")
+
+
+def take_session_cookies() -> Optional[dict[str, str]]:
+    """Return the prefetched login cookies of the current user, or None if there are none."""
+    return _take("session_cookies")
+
+
+def load_ipython_extension(ipython: Any) -> None:
+    """
+    Start prefetching when the extension is loaded (with `%load_ext marble_client` or in the IPython configuration).
+
+    Nothing is done outside of a Marble Jupyterlab environment so the extension can be enabled everywhere.
+    """
+    start()
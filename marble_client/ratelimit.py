@@ -0,0 +1,95 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+__all__ = ["RateLimit", "TokenBucket", "NodeLimiter"]
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """
+    Limits on the requests that a client sends to a single Marble node.
+
+    `rate` is the average number of requests per second and `burst` is the number of requests that can be sent
+    at once before that rate applies. `max_concurrency` is the number of requests that can be in progress at the
+    same time. A limit that is None is not enforced.
+    """
+
+    rate: Optional[float] = None
+    burst: int = 1
+    max_concurrency: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        """Check that the limits are valid."""
+        if self.rate is not None and self.rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        if self.burst < 1:
+            raise ValueError("burst must be at least 1")
+        if self.max_concurrency is not None and self.max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+    @property
+    def unlimited(self) -> bool:
+        """Return True if no limit is enforced."""
+        return self.rate is None and self.max_concurrency is None
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills at `rate` tokens per second up to `burst` tokens."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available.
+
+        Tokens are reserved in the order that callers arrive so waiting callers are served first come, first served.
+
+        :return: The number of seconds spent waiting
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class NodeLimiter:
+    """Enforce a RateLimit for the requests sent to one node."""
+
+    def __init__(self, rate_limit: RateLimit) -> None:
+        self.rate_limit = rate_limit
+        self._bucket = TokenBucket(rate_limit.rate, rate_limit.burst) if rate_limit.rate is not None else None
+        self._semaphore = (
+            threading.BoundedSemaphore(rate_limit.max_concurrency) if rate_limit.max_concurrency is not None else None
+        )
+
+    def acquire(self) -> float:
+        """
+        Wait until a request can be sent to the node. Every call must be followed by a call to `release`.
+
+        :return: The number of seconds spent waiting (the queueing delay)
+        :rtype: float
+        """
+        start = time.perf_counter()
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        if self._bucket is not None:
+            self._bucket.acquire()
+        return time.perf_counter() - start
+
+    def release(self) -> None:
+        """Mark a request to the node as finished."""
+        if self._semaphore is not None:
+            self._semaphore.release()
@@ -0,0 +1,245 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Iterable, Optional
+
+import requests
+
+from marble_client.exceptions import ServiceNotAvailableError
+
+if TYPE_CHECKING:
+    from marble_client.client import MarbleClient
+    from marble_client.node import MarbleNode
+
+__all__ = ["CircuitBreaker", "NodeHealth", "fetch"]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the requests sent to one node.
+
+    After `failure_threshold` consecutive failures the circuit opens and the node is not used for `reset_timeout`
+    seconds. After that, a single trial request is allowed (the circuit is half-open): the circuit closes again if it
+    succeeds and opens again if it fails.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        """Return "closed", "open" or "half-open"."""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    @property
+    def available(self) -> bool:
+        """Return True if a request could be sent now (without reserving the trial request)."""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._trial)
+
+    def allow(self) -> bool:
+        """Return True if a request can be sent (this reserves the trial request if the circuit is half-open)."""
+        state = self.state
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return state == "closed"
+
+    def record_success(self) -> None:
+        """Close the circuit."""
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self) -> None:
+        """Count a failure and open the circuit if there have been too many."""
+        self._failures += 1
+        if self._trial or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._trial = False
+
+
+class NodeHealth:
+    """
+    Latency estimates and circuit breakers for the nodes used by a client.
+
+    Latency is an exponentially weighted moving average of the time taken to receive response headers from
+    the node (e.g. from `MarbleNode.is_online` probes and previous fetches).
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30, smoothing: float = 0.3) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.smoothing = smoothing
+        self._latencies: dict[str, float] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, node_id: str) -> CircuitBreaker:
+        if node_id not in self._breakers:
+            self._breakers[node_id] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self._breakers[node_id]
+
+    def latency(self, node_id: str) -> Optional[float]:
+        """Return the estimated latency of the node in seconds (None if it has not been measured)."""
+        with self._lock:
+            return self._latencies.get(node_id)
+
+    def state(self, node_id: str) -> str:
+        """Return the state of the node's circuit breaker ("closed", "open" or "half-open")."""
+        with self._lock:
+            return self._breaker(node_id).state
+
+    def allow(self, node_id: str) -> bool:
+        """Return True if a request can be sent to the node (see `CircuitBreaker.allow`)."""
+        with self._lock:
+            return self._breaker(node_id).allow()
+
+    def record_success(self, node_id: str, latency: float) -> None:
+        """Update the node's latency estimate and close its circuit."""
+        with self._lock:
+            previous = self._latencies.get(node_id)
+            self._latencies[node_id] = (
+                latency if previous is None else self.smoothing * latency + (1 - self.smoothing) * previous
+            )
+            self._breaker(node_id).record_success()
+
+    def record_failure(self, node_id: str) -> None:
+        """Count a failed request to the node."""
+        with self._lock:
+            self._breaker(node_id).record_failure()
+
+    def rank(self, nodes: Iterable["MarbleNode"]) -> list["MarbleNode"]:
+        """
+        Return the nodes whose circuit would allow a request, fastest first.
+
+        Nodes whose latency has not been measured yet are tried first so that their latency can be measured.
+        This does not reserve the trial request of half-open circuits, call `allow` before sending a request.
+        """
+        with self._lock:
+            allowed = [node for node in nodes if self._breaker(node.id).available]
+            return sorted(allowed, key=lambda node: self._latencies.get(node.id, 0.0))
+
+
+def _request(
+    client: "MarbleClient", node: "MarbleNode", url: str, session: Optional[requests.Session], timeout: Optional[float]
+) -> requests.Response:
+    """Request url from node and record the outcome in the client's node health."""
+    start = time.perf_counter()
+    try:
+        response = client._transport.request(
+            "GET", url, operation="fetch", node_id=node.id, session=session, stream=True, timeout=timeout
+        )
+        response.raise_for_status()
+    except requests.exceptions.HTTPError:
+        response.close()
+        # a client error (such as 404) means that the node is responding but does not have the file
+        if response.status_code >= 500:
+            client._health.record_failure(node.id)
+        else:
+            client._health.record_success(node.id, time.perf_counter() - start)
+        raise
+    except requests.exceptions.RequestException:
+        client._health.record_failure(node.id)
+        raise
+    client._health.record_success(node.id, time.perf_counter() - start)
+    return response
+
+
+def _close_response(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def fetch(
+    client: "MarbleClient",
+    path: str,
+    service: str,
+    destination: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+    hedge_after: float = 1.0,
+    timeout: Optional[float] = 30,
+    chunk_size: int = 1024 * 1024,
+) -> str:
+    """
+    Download path from the replica of service that is expected to respond first and return the downloaded file's path.
+
+    See MarbleClient.fetch for details.
+    """
+    candidates = list(client.nodes.filter(has_service=service).values())
+    if not candidates:
+        raise ServiceNotAvailableError(f"No node offers a service named '{service}'.")
+    ranked = iter(client._health.rank(candidates))
+    destination = destination or os.path.basename(path.rstrip("/"))
+
+    executor = ThreadPoolExecutor(max_workers=2)
+    pending: dict[Future, "MarbleNode"] = {}
+    errors: list[str] = []
+
+    def start_next() -> bool:
+        node = next(ranked, None)
+        # the circuit may have changed since ranking, or another fetch may have taken the trial request
+        while node is not None and not client._health.allow(node.id):
+            node = next(ranked, None)
+        if node is None:
+            return False
+        url = f"{node[service].url.rstrip('/')}/{path.lstrip('/')}"
+        pending[executor.submit(_request, client, node, url, session, timeout)] = node
+        return True
+
+    winner: Optional[tuple["MarbleNode", requests.Response]] = None
+    try:
+        start_next()
+        while pending and winner is None:
+            done, _ = wait(pending, timeout=hedge_after if len(pending) < 2 else None, return_when=FIRST_COMPLETED)
+            if not done:
+                # the request is slow, send a hedged request to the next best node
+                start_next()
+                continue
+            for future in done:
+                node = pending.pop(future)
+                try:
+                    winner = node, future.result()
+                    break
+                except requests.exceptions.RequestException as err:
+                    errors.append(f"{node.id}: {err}")
+            if winner is None and len(pending) < 2:
+                start_next()
+    finally:
+        # cancel the requests that lost the race, responses that arrive later are closed without being read
+        for future in pending:
+            future.cancel()
+            future.add_done_callback(_close_response)
+        executor.shutdown(wait=False)
+
+    if winner is None:
+        raise RuntimeError(f"Could not fetch '{path}' from any node offering '{service}': {'; '.join(errors)}")
+
+    node, response = winner
+    directory = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(directory, exist_ok=True)
+    partial = tempfile.NamedTemporaryFile(
+        "wb", dir=directory, prefix=os.path.basename(destination), suffix=".partial", delete=False
+    )
+    try:
+        with response, partial:
+            for chunk in response.iter_content(chunk_size):
+                partial.write(chunk)
+        os.replace(partial.name, destination)
+    except (requests.exceptions.RequestException, OSError) as err:
+        client._health.record_failure(node.id)
+        raise RuntimeError(f"Could not download '{path}' from node '{node.id}': {err}") from err
+    finally:
+        if os.path.isfile(partial.name):
+            os.remove(partial.name)
+    return destination
@@ -1,4 +1,8 @@
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, Literal, Optional
+
+import requests
+
+from marble_client.capabilities import fetch_capabilities, service_kind
 
 if TYPE_CHECKING:
     from marble_client.node import MarbleNode
@@ -78,6 +82,82 @@ class MarbleService:
         """Return documentation URL."""
         return self._service_doc
 
+    def capabilities(
+        self,
+        kind: Optional[Literal["stac", "thredds", "wps"]] = None,
+        session: Optional[requests.Session] = None,
+        ttl: Optional[float] = None,
+        refresh: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Return a summary of what this service offers, parsed from its capabilities document.
+
+        The document that is requested depends on the kind of service: the root catalog for STAC services,
+        the top level catalog for THREDDS servers and the GetCapabilities document for WPS servers.
+
+        Results are cached (in memory and in the MARBLE_CACHE_DIR directory) for each node and service version.
+        Cached results older than `ttl` seconds are revalidated with the server before they are reused. Results
+        requested with a `session` are never cached (or read from the cache).
+
+        :param kind: The kind of service, by default this is determined from the service's name and keywords
+        :type kind: str | None
+        :param session: Session used to make the request (e.g. to access a protected service)
+        :type session: requests.Session | None
+        :param ttl: Number of seconds that cached results are used without revalidation,
+            defaults to CAPABILITIES_TTL (set by the MARBLE_CAPABILITIES_TTL environment variable)
+        :type ttl: float | None
+        :param refresh: If True, always revalidate cached results, defaults to False
+        :type refresh: bool
+        :raises ValueError: If the kind of service cannot be determined
+        :raises RuntimeError: If the capabilities document cannot be parsed
+        :raises requests.exceptions.RequestException: If the capabilities document cannot be retrieved
+        :return: A dictionary describing the service's capabilities
+        :rtype: dict[str, Any]
+        """
+        return fetch_capabilities(self, kind=kind, session=session, ttl=ttl, refresh=refresh)
+
+    def search(
+        self,
+        query: dict[str, Any],
+        session: Optional[requests.Session] = None,
+        timeout: Optional[float] = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Search this service and return the matching items.
+
+        Only STAC services are supported. The query is sent to the STAC API item search endpoint and the
+        features in the first page of results are returned (use the "limit" parameter to request more items).
+
+        :param query: Search parameters according to the STAC API item search specification
+            (e.g. {"collections": ["CMIP6"], "bbox": [-80, 40, -70, 50], "limit": 100})
+        :type query: dict[str, Any]
+        :param session: Session used to make the request (e.g. to access a protected service)
+        :type session: requests.Session | None
+        :param timeout: Number of seconds to wait for the service to respond, defaults to no timeout
+        :type timeout: float | None
+        :raises ValueError: If this is not a STAC service
+        :raises RuntimeError: If the search results cannot be parsed
+        :raises requests.exceptions.RequestException: If the search request fails
+        :return: The items matching the query
+        :rtype: list[dict[str, Any]]
+        """
+        if service_kind(self) != "stac":
+            raise ValueError(f"Service '{self.name}' does not support searching. Only STAC services can be searched.")
+        response = self._node._client._transport.request(
+            "POST",
+            self.url.rstrip("/") + "/search",
+            operation="search",
+            node_id=self._node.id,
+            session=session,
+            json=query,
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        try:
+            return response.json()["features"]
+        except (ValueError, KeyError, TypeError) as err:
+            raise RuntimeError(f"Could not parse the search results returned from {response.url}") from err
+
     def __str__(self) -> str:
         """Return string containing name and node_id."""
         return f"<{self.__class__.__name__}(name: '{self.name}', node_id: '{self._node.id}')>"
@@ -0,0 +1,50 @@
+from functools import cached_property
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Iterable, Mapping, Optional
+from urllib.parse import urlparse
+
+from marble_client.nodeview import NodeView
+
+if TYPE_CHECKING:
+    from marble_client.node import MarbleNode
+
+__all__ = ["RegistrySnapshot"]
+
+
+class RegistrySnapshot:
+    """
+    An immutable version of a loaded registry: the nodes it contains, where it was loaded from and indexes over them.
+
+    A client replaces its snapshot as a whole (by assigning a new one) when the registry is loaded or refreshed, so
+    code that holds a snapshot always sees a consistent version of the registry, even from other threads and without
+    locks.
+    """
+
+    def __init__(self, uris: Iterable[str], nodes: dict[str, "MarbleNode"]) -> None:
+        """
+        Initialize a snapshot.
+
+        :param uris: URIs that the registry was loaded from
+        :type uris: Iterable[str]
+        :param nodes: Mapping of node ids to nodes. This must not be modified after the snapshot is created.
+        :type nodes: dict[str, MarbleNode]
+        """
+        self.uris: tuple[str, ...] = tuple(uris)
+        self.nodes: Mapping[str, "MarbleNode"] = MappingProxyType(nodes)
+        self.view = NodeView(nodes)
+
+    @cached_property
+    def _nodes_by_hostname(self) -> dict[str, "MarbleNode"]:
+        # computing this twice in concurrent threads is harmless since both results are identical
+        by_hostname: dict[str, "MarbleNode"] = {}
+        for node in self.nodes.values():
+            by_hostname.setdefault(urlparse(node.url).hostname, node)
+        return by_hostname
+
+    def node_by_hostname(self, hostname: Optional[str]) -> Optional["MarbleNode"]:
+        """Return the first node whose URL has this hostname or None if there is none."""
+        return self._nodes_by_hostname.get(hostname)
+
+    def __repr__(self) -> str:
+        """Return a repr containing the registry URIs and the number of nodes."""
+        return f"<{self.__class__.__name__}(uris: {list(self.uris)}, nodes: {len(self.nodes)})>"
@@ -0,0 +1,295 @@
+import json
+import threading
+import time
+import weakref
+from typing import Any, Callable, Hashable, Iterable, Literal, Mapping, Optional
+
+import requests
+
+from marble_client.metrics import Collector, RequestRecord
+from marble_client.ratelimit import NodeLimiter, RateLimit
+
+__all__ = ["SingleFlight", "Transport"]
+
+# Only requests without side effects and whose response body can be shared between callers are coalesced
+_COALESCED_METHODS = {"GET", "HEAD"}
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls.
+
+    While a call for a given key is in progress, other calls with the same key wait for it to finish and
+    receive its result (or exception) instead of running again.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Call func unless a call with the same key is already in progress and return its result.
+
+        :return: The result of the call and whether it was shared with a call that was already in progress
+        :rtype: tuple[Any, bool]
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = func()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+# Shared by all transports so that identical requests made by different clients in the same process are coalesced
+_SINGLEFLIGHT = SingleFlight()
+
+
+def _release_on_close(response: requests.Response, release: Callable[[], None]) -> None:
+    """Call release once, when the response is closed (or garbage collected if it is never closed)."""
+    lock = threading.Lock()
+    released = False
+
+    def release_once() -> None:
+        nonlocal released
+        with lock:
+            if released:
+                return
+            released = True
+        release()
+
+    close = response.close
+
+    def close_and_release() -> None:
+        try:
+            close()
+        finally:
+            release_once()
+
+    response.close = close_and_release  # type: ignore[method-assign]
+    weakref.finalize(response, release_once)
+
+
+class Transport:
+    """
+    Make the network requests for a MarbleClient and the nodes and services that belong to it.
+
+    If any collectors are registered, each request is timed and reported to the collectors as a RequestRecord.
+    Otherwise requests are not timed.
+
+    Concurrent identical GET and HEAD requests (same URL, session and arguments) are coalesced: only one of them
+    is sent and its response is shared by all callers. Streamed requests are never coalesced.
+
+    Requests sent to a node are limited by the RateLimit for that node in `node_rate_limits` or, if there is none,
+    by `rate_limit`. Time spent waiting for a limit is reported to the collectors as the record's `queue_delay`.
+    """
+
+    def __init__(
+        self,
+        collectors: Optional[Iterable[Collector]] = None,
+        coalesce: bool = True,
+        rate_limit: Optional[RateLimit] = None,
+        node_rate_limits: Optional[Mapping[str, RateLimit]] = None,
+    ) -> None:
+        self.collectors: list[Collector] = list(collectors or [])
+        self.rate_limit = rate_limit or RateLimit()
+        self.node_rate_limits: dict[str, RateLimit] = dict(node_rate_limits or {})
+        self._singleflight = _SINGLEFLIGHT if coalesce else None
+        self._limiters: dict[str, Optional[NodeLimiter]] = {}
+        self._limiters_lock = threading.Lock()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        operation: str,
+        node_id: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Make a request with `session` (or with the requests module if no session is given).
+
+        :param operation: Name of the client operation making this request (reported to collectors)
+        :type operation: str
+        :param node_id: ID of the node that this request is sent to (reported to collectors)
+        :type node_id: str | None
+        """
+        if self._singleflight is None or method.upper() not in _COALESCED_METHODS or kwargs.get("stream"):
+            return self._request(method, url, operation, node_id, session, **kwargs)
+        key = (method.upper(), url, id(session), json.dumps(kwargs, sort_keys=True, default=repr))
+
+        def send() -> tuple[Optional[requests.Response], Optional[requests.exceptions.RequestException]]:
+            # errors are returned rather than raised so that they are reported to each caller's collectors
+            try:
+                return self._request(method, url, operation, node_id, session, **kwargs), None
+            except requests.exceptions.RequestException as err:
+                return None, err
+
+        start = time.time()
+        start_perf = time.perf_counter()
+        (response, error), shared = self._singleflight.do(key, send)
+        if shared and self.collectors:
+            self._emit_shared(
+                method,
+                url,
+                operation,
+                node_id,
+                start,
+                start_perf,
+                status=None if response is None else response.status_code,
+                error=None if error is None else type(error).__name__,
+            )
+        if error is not None:
+            raise error
+        return response
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        operation: str,
+        node_id: Optional[str],
+        session: Optional[requests.Session],
+        **kwargs,
+    ) -> requests.Response:
+        limiter = self._limiter(node_id)
+        if limiter is None:
+            return self._send(method, url, operation, node_id, session, None, **kwargs)
+        queue_delay = limiter.acquire()
+        try:
+            response = self._send(method, url, operation, node_id, session, queue_delay, **kwargs)
+        except BaseException:
+            limiter.release()
+            raise
+        if kwargs.get("stream"):
+            # the body of a streamed response is read after it is returned, the request is finished when it is closed
+            _release_on_close(response, limiter.release)
+        else:
+            limiter.release()
+        return response
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        operation: str,
+        node_id: Optional[str],
+        session: Optional[requests.Session],
+        queue_delay: Optional[float],
+        **kwargs,
+    ) -> requests.Response:
+        requester = session or requests
+        if not self.collectors:
+            return requester.request(method, url, **kwargs)
+        start = time.time()
+        start_perf = time.perf_counter()
+        try:
+            response = requester.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as err:
+            self.emit(
+                RequestRecord(
+                    operation=operation,
+                    method=method,
+                    url=url,
+                    node_id=node_id,
+                    start=start,
+                    duration=time.perf_counter() - start_perf,
+                    error=type(err).__name__,
+                    queue_delay=queue_delay,
+                )
+            )
+            raise
+        self.emit(
+            RequestRecord(
+                operation=operation,
+                method=method,
+                url=url,
+                node_id=node_id,
+                start=start,
+                duration=time.perf_counter() - start_perf,
+                status=response.status_code,
+                bytes=None if kwargs.get("stream") else len(response.content),
+                elapsed=response.elapsed.total_seconds(),
+                queue_delay=queue_delay,
+            )
+        )
+        return response
+
+    def _limiter(self, node_id: Optional[str]) -> Optional[NodeLimiter]:
+        """Return the limiter for requests sent to the node or None if those requests are not limited."""
+        if node_id is None:
+            return None
+        with self._limiters_lock:
+            if node_id not in self._limiters:
+                rate_limit = self.node_rate_limits.get(node_id, self.rate_limit)
+                self._limiters[node_id] = None if rate_limit.unlimited else NodeLimiter(rate_limit)
+            return self._limiters[node_id]
+
+    def _emit_shared(
+        self,
+        method: str,
+        url: str,
+        operation: str,
+        node_id: Optional[str],
+        start: float,
+        start_perf: float,
+        status: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """Report a request that was not sent because the response of an identical request was shared."""
+        self.emit(
+            RequestRecord(
+                operation=operation,
+                method=method,
+                url=url,
+                node_id=node_id,
+                start=start,
+                duration=time.perf_counter() - start_perf,
+                status=status,
+                error=error,
+                shared=True,
+            )
+        )
+
+    def record_cache(self, operation: str, url: str, cache: Literal["hit", "miss"], duration: float = 0.0) -> None:
+        """Report a cache access to the collectors."""
+        if self.collectors:
+            self.emit(
+                RequestRecord(
+                    operation=operation,
+                    method="GET",
+                    url=url,
+                    start=time.time() - duration,
+                    duration=duration,
+                    cache=cache,
+                )
+            )
+
+    def emit(self, record: RequestRecord) -> None:
+        """Send the record to all collectors."""
+        for collector in self.collectors:
+            collector(record)
@@ -1,6 +1,9 @@
+import gzip
+import importlib
 import os
+import zlib
 from functools import cache, wraps
-from typing import Any, Callable
+from typing import Any, BinaryIO, Callable, Literal
 
 from marble_client.exceptions import JupyterEnvironmentError
 
@@ -45,3 +48,110 @@ def check_jupyterlab(f: Callable) -> Callable:
         raise JupyterEnvironmentError("Not in a Marble jupyterlab environment")
 
     return wrapper
+
+
+_COMPRESSION_MAGIC_BYTES = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+_COMPRESSIONS = ("gzip", "zstd", "none")
+
+
+def _zstd() -> Any:
+    """
+    Return the zstd module (from the standard library or the backports.zstd package).
+
+    :raises OSError: If neither is available, so that callers handle it like any other cache read or write error
+    """
+    for module in ("compression.zstd", "backports.zstd"):
+        try:
+            return importlib.import_module(module)
+        except ImportError:
+            pass
+    raise OSError("zstd compression requires python 3.14+ or the backports.zstd package")
+
+
+def check_compression(compression: str) -> None:
+    """Raise a ValueError if compression is not one of "gzip", "zstd" or "none"."""
+    if compression not in _COMPRESSIONS:
+        raise ValueError(f"Unsupported compression '{compression}'. Must be one of 'gzip', 'zstd' or 'none'.")
+
+
+def _detect_compression(data: bytes) -> str:
+    for magic, compression in _COMPRESSION_MAGIC_BYTES.items():
+        if data.startswith(magic):
+            return compression
+    return "none"
+
+
+def detect_compression(path: str) -> str:
+    """Return the compression used for the file at path ("gzip", "zstd" or "none") based on its magic bytes."""
+    with open(path, "rb") as f:
+        return _detect_compression(f.read(4))
+
+
+def compress(data: bytes, compression: str = "none") -> bytes:
+    """
+    Compress data with gzip or zstd (or return it unchanged if compression is "none").
+
+    :raises OSError: If the zstd module is not available
+    """
+    if compression == "gzip":
+        return gzip.compress(data)
+    if compression == "zstd":
+        return _zstd().compress(data)
+    if compression == "none":
+        return data
+    raise ValueError(f"Unsupported compression '{compression}'. Must be one of 'gzip', 'zstd' or 'none'.")
+
+
+def decompress(data: bytes) -> bytes:
+    """
+    Decompress data compressed by `compress`, the compression is detected from its magic bytes.
+
+    :raises OSError: If the data is truncated or corrupt or if it is compressed with zstd and the zstd module is not
+        available
+    """
+    compression = _detect_compression(data)
+    if compression == "gzip":
+        try:
+            return gzip.decompress(data)
+        except (EOFError, zlib.error) as err:
+            raise OSError(f"Could not decompress gzip data: {err}") from err
+    if compression == "zstd":
+        zstd = _zstd()
+        try:
+            return zstd.decompress(data)
+        except zstd.ZstdError as err:
+            raise OSError(f"Could not decompress zstd data: {err}") from err
+    return data
+
+
+def compressed_writer(fileobj: BinaryIO, compression: str = "none") -> BinaryIO:
+    """
+    Return a file object that compresses everything written to it with gzip or zstd and writes it to fileobj.
+
+    Closing the returned file object does not close fileobj.
+    """
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb")
+    if compression == "zstd":
+        return _zstd().ZstdFile(fileobj, mode="wb")
+    if compression == "none":
+        return fileobj
+    raise ValueError(f"Unsupported compression '{compression}'. Must be one of 'gzip', 'zstd' or 'none'.")
+
+
+def open_compressed(path: str, mode: Literal["rb", "wb"], compression: str = "none") -> BinaryIO:
+    """
+    Open a binary file that may be compressed with gzip or zstd.
+
+    When reading, the compression is detected from the file's magic bytes and the `compression`
+    argument is ignored. Note that zstd support requires python 3.14+ or the backports.zstd package.
+    """
+    if mode == "rb":
+        compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode)
+    if compression == "zstd":
+        return _zstd().open(path, mode)
+    if compression == "none":
+        return open(path, mode)
+    raise ValueError(f"Unsupported compression '{compression}'. Must be one of 'gzip', 'zstd' or 'none'.")
@@ -0,0 +1,122 @@
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import marble_client
+
+# The largest registry is expensive to generate and load so it only runs when explicitly requested
+REGISTRY_SIZES = [10, 1_000] + ([100_000] if os.getenv("MARBLE_BENCHMARK_LARGE") else [])
+SERVICES_PER_NODE = 8
+
+
+def make_registry(size: int, services_per_node: int = SERVICES_PER_NODE) -> dict:
+    registry = {}
+    for i in range(size):
+        host = f"https://node{i}.example.com"
+        registry[f"node{i}"] = {
+            "name": f"Node {i}",
+            "description": f"Synthetic node number {i}",
+            "date_added": "2024-01-01T00:00:00Z",
+            "last_updated": "2024-06-01T00:00:00Z",
+            "affiliation": f"Affiliation {i % 50}",
+            "location": {"longitude": -180 + (i % 360), "latitude": -90 + (i % 180)},
+            "contact": f"admin@node{i}.example.com",
+            "version": f"2.{i % 12}.0",
+            "links": [
+                {"rel": "service", "href": f"{host}/"},
+                {"rel": "collection", "href": f"{host}/services"},
+                {"rel": "version", "href": f"{host}/version"},
+            ],
+            "services": [
+                {
+                    "name": f"service{j}",
+                    "keywords": ["data", f"keyword{j}"],
+                    "description": f"Synthetic service {j}",
+                    "links": [
+                        {"rel": "service", "href": f"{host}/service{j}/"},
+                        {"rel": "service-doc", "href": f"{host}/service{j}/doc"},
+                    ],
+                }
+                for j in range(services_per_node)
+            ],
+        }
+    return registry
+
+
+class _RegistryHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = self.server.registries.get(self.path)
+        if body is None:
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture(scope="session")
+def registry_server():
+    """A local HTTP server that serves registries added to its `registries` dict (path -> bytes)."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RegistryHandler)
+    server.registries = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope="session", params=REGISTRY_SIZES, ids=lambda size: f"{size}nodes")
+def synthetic_registry(request):
+    yield make_registry(request.param)
+
+
+@pytest.fixture
+def registry_url(registry_server, synthetic_registry, responses, monkeypatch):
+    """Serve the synthetic registry from the local server and point marble_client at it."""
+    path = f"/registry-{len(synthetic_registry)}.json"
+    if path not in registry_server.registries:
+        registry_server.registries[path] = json.dumps(synthetic_registry).encode()
+    url = f"http://{registry_server.server_address[0]}:{registry_server.server_address[1]}{path}"
+    responses.add_passthru(url)
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URL", url)
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URLS", [url])
+    yield url
+
+
+@pytest.fixture
+def unavailable_registry_url(registry_server, synthetic_registry, responses, monkeypatch):
+    """Point marble_client at a registry URL that always fails so that the local cache is used instead."""
+    url = f"http://{registry_server.server_address[0]}:{registry_server.server_address[1]}/unavailable.json"
+    responses.add_passthru(url)
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URL", url)
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URLS", [url])
+    marble_client.cache.FileCacheBackend().set(
+        url, marble_client.MarbleClient._serialize_registry_cache(synthetic_registry)
+    )
+    yield url
+
+
+@pytest.fixture
+def loaded_client(registry_url):
+    yield marble_client.MarbleClient()
+
+
+@pytest.fixture(autouse=True)
+def registry_request():
+    """Override the default registry mock; benchmarks talk to the local registry server instead."""
+    yield
+
+
+@pytest.fixture(autouse=True)
+def jupyterlab_environment():
+    """Override the default jupyterlab environment; it requires the real registry content."""
+    yield
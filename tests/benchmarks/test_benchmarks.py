@@ -0,0 +1,107 @@
+import warnings
+
+import pytest
+
+import marble_client
+
+
+def _rounds(registry: dict) -> int:
+    return max(1, min(10, 5_000 // len(registry)))
+
+
+def test_cold_construction(benchmark, registry_url, synthetic_registry):
+    """Construct a client from a registry fetched over HTTP (includes the cache write)."""
+    client = benchmark.pedantic(marble_client.MarbleClient, rounds=_rounds(synthetic_registry))
+    assert len(client.nodes) == len(synthetic_registry)
+
+
+def test_stream_construction(benchmark, registry_url, synthetic_registry):
+    """Construct a client and all of its nodes while streaming the registry (includes the cache write)."""
+    client = benchmark.pedantic(
+        lambda: marble_client.MarbleClient(stream=True).nodes, rounds=_rounds(synthetic_registry)
+    )
+    assert len(client) == len(synthetic_registry)
+
+
+def test_stream_first_lookup(benchmark, registry_url, synthetic_registry):
+    """Construct a client and look up the first node while streaming the registry."""
+    node = benchmark.pedantic(
+        lambda: marble_client.MarbleClient(stream=True)["node0"], rounds=_rounds(synthetic_registry)
+    )
+    assert node.id == "node0"
+
+
+def test_cache_fallback_construction(benchmark, unavailable_registry_url, synthetic_registry, capsys):
+    """Construct a client when the remote registry is unavailable and the local cache has to be used."""
+
+    def construct():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return marble_client.MarbleClient()
+
+    client = benchmark.pedantic(construct, rounds=_rounds(synthetic_registry))
+    assert len(client.nodes) == len(synthetic_registry)
+
+
+def test_cache_write(benchmark, loaded_client, synthetic_registry):
+    benchmark.pedantic(
+        loaded_client._save_registry_as_cache, args=(synthetic_registry,), rounds=_rounds(synthetic_registry)
+    )
+
+
+def test_node_construction(benchmark, loaded_client, synthetic_registry):
+    """Construct every MarbleNode in the registry (without fetching the registry)."""
+
+    def construct():
+        return [marble_client.MarbleNode(id_, data, loaded_client) for id_, data in synthetic_registry.items()]
+
+    nodes = benchmark.pedantic(construct, rounds=_rounds(synthetic_registry))
+    assert len(nodes) == len(synthetic_registry)
+
+
+def test_getitem(benchmark, loaded_client, synthetic_registry):
+    node_id = f"node{len(synthetic_registry) - 1}"
+    assert benchmark(loaded_client.__getitem__, node_id).id == node_id
+
+
+def test_contains(benchmark, loaded_client, synthetic_registry):
+    assert benchmark(loaded_client.__contains__, f"node{len(synthetic_registry) - 1}")
+
+
+def test_not_contains(benchmark, loaded_client):
+    assert not benchmark(loaded_client.__contains__, "no-such-node")
+
+
+def test_service_getitem(benchmark, loaded_client, synthetic_registry):
+    node = loaded_client[f"node{len(synthetic_registry) - 1}"]
+    assert benchmark(node.__getitem__, "service0").name == "service0"
+
+
+def test_service_url_lookup(benchmark, loaded_client, synthetic_registry):
+    node_id = f"node{len(synthetic_registry) - 1}"
+    assert benchmark(lambda: loaded_client[node_id]["service0"].url).startswith("https://")
+
+
+def test_service_listing(benchmark, loaded_client):
+    assert benchmark(lambda: sum(len(node.services) for node in loaded_client.nodes.values()))
+
+
+@pytest.mark.parametrize("position", ["first", "last"])
+def test_this_node(benchmark, loaded_client, synthetic_registry, monkeypatch, position):
+    """Find the current node by hostname, either at the start or end of the registry (including the environment check)."""
+    index = 0 if position == "first" else len(synthetic_registry) - 1
+    monkeypatch.setenv("BIRDHOUSE_HOST_URL", f"https://node{index}.example.com/")
+    monkeypatch.setenv("JUPYTERHUB_API_URL", "http://jupyterhub.example.com")
+    monkeypatch.setenv("JUPYTERHUB_USER", "example_user")
+    monkeypatch.setenv("JUPYTERHUB_API_TOKEN", "example_token")
+    assert benchmark(lambda: loaded_client.this_node).id == f"node{index}"
+
+
+def test_nodes_filter(benchmark, loaded_client):
+    """Filter the nodes by version, service and location (evaluating the lazy view)."""
+    nodes = loaded_client.nodes
+
+    def filter_nodes():
+        return len(nodes.filter(version=">=2.4", has_service="service0", bbox=(-180, -90, 0, 90)))
+
+    assert benchmark(filter_nodes)
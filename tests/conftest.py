@@ -73,6 +73,10 @@ def tmp_cache(monkeypatch):
         importlib.reload(marble_client.constants)
         importlib.reload(marble_client.client)
         yield os.path.realpath(tmp_dir)
+    # restore the modules so that later session scoped fixtures don't see the deleted temporary directory
+    monkeypatch.undo()
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
 
 
 @pytest.fixture
@@ -0,0 +1,33 @@
+import pytest
+from network import NODES, REPORTS, SimulatedNetwork
+
+import marble_client
+
+
+def pytest_terminal_summary(terminalreporter) -> None:
+    if REPORTS:
+        terminalreporter.section("Marble network simulation")
+        for report in REPORTS:
+            terminalreporter.write_line(report.summary())
+
+
+@pytest.fixture
+def network(monkeypatch):
+    """Start a simulated network and point marble_client at its registry."""
+    network = SimulatedNetwork(NODES).start()
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URL", network.registry_url)
+    monkeypatch.setattr(marble_client.client, "NODE_REGISTRY_URLS", [network.registry_url])
+    yield network
+    network.stop()
+
+
+@pytest.fixture(autouse=True)
+def registry_request(tmp_cache):
+    """Override the default registry mock; the simulation talks to the local servers instead."""
+    yield
+
+
+@pytest.fixture(autouse=True)
+def jupyterlab_environment():
+    """Override the default jupyterlab environment; it requires the real registry content."""
+    yield
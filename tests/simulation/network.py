@@ -0,0 +1,248 @@
+import dataclasses
+import http.server
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Scale of the load scenarios. The defaults keep the scenarios fast enough to run with the rest of the test suite.
+NODES = int(os.getenv("MARBLE_SIMULATION_NODES", "4"))
+CLIENTS = int(os.getenv("MARBLE_SIMULATION_CLIENTS", "16"))
+ITERATIONS = int(os.getenv("MARBLE_SIMULATION_ITERATIONS", "64"))
+
+USER_NAME = "user"
+PASSWORD = "password"
+FILE_PATH = "fileServer/birdhouse/data.nc"
+
+
+@dataclasses.dataclass
+class Behaviour:
+    """How a simulated server responds to requests."""
+
+    latency: float = 0.0  # seconds to wait before responding
+    error_rate: float = 0.0  # fraction of requests that get a 503 response
+    bandwidth: Optional[float] = None  # maximum bytes per second for response bodies
+
+
+class SimulatedNetwork:
+    """
+    A local registry server and N fake Marble nodes, all served by one HTTP server.
+
+    Node i is served under /node<i>/ with a Magpie sign-in endpoint, a thredds service that serves files of
+    `file_size` bytes and a STAC service that answers item searches. The behaviour (latency, error rate and bandwidth)
+    of the registry and of each node can be changed while the network is running.
+    """
+
+    def __init__(self, nodes: int, file_size: int = 64 * 1024, seed: int = 0) -> None:
+        self.file_size = file_size
+        self.registry_behaviour = Behaviour()
+        self.behaviours = {f"node{i}": Behaviour() for i in range(nodes)}
+        self.requests: Counter = Counter()  # (node id or "registry", endpoint) -> number of requests served
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.network = self
+        self.url = f"http://{self._server.server_address[0]}:{self._server.server_address[1]}"
+        self.registry_url = f"{self.url}/registry.json"
+        self.registry = {node_id: self._node_json(node_id) for node_id in self.behaviours}
+        self._registry_body = json.dumps(self.registry).encode()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _node_json(self, node_id: str) -> dict:
+        url = f"{self.url}/{node_id}/"
+        return {
+            "name": node_id,
+            "description": f"Simulated node {node_id}",
+            "date_added": "2024-01-01T00:00:00Z",
+            "last_updated": "2024-06-01T00:00:00Z",
+            "affiliation": "Simulation",
+            "location": {"longitude": -75.0, "latitude": 45.0},
+            "contact": f"admin@{node_id}.example.com",
+            "version": "2.4.0",
+            "links": [{"rel": "service", "href": url}, {"rel": "version", "href": f"{url}version"}],
+            "services": [
+                {
+                    "name": service,
+                    "keywords": ["data"],
+                    "description": f"Simulated {service} service",
+                    "links": [{"rel": "service", "href": f"{url}{service}/"}],
+                }
+                for service in ("thredds", "stac")
+            ],
+        }
+
+    def start(self) -> "SimulatedNetwork":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, endpoint: str) -> int:
+        """Return the number of requests served for an endpoint (summed over the registry and all nodes)."""
+        return sum(count for (_, name), count in self.requests.items() if name == endpoint)
+
+    def _apply(self, behaviour: Behaviour) -> bool:
+        """Wait for the simulated latency and return False if the request should fail."""
+        if behaviour.latency:
+            time.sleep(behaviour.latency)
+        with self._lock:
+            return self._random.random() >= behaviour.error_rate
+
+    def _record(self, source: str, endpoint: str) -> None:
+        with self._lock:
+            self.requests[(source, endpoint)] += 1
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    # many clients connect at the same time during load scenarios
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address) -> None:
+        # clients close connections early (e.g. cancelled hedged requests), which is expected
+        pass
+
+
+_NODE_PATH_RE = re.compile(r"/(node\d+)/(.*)")
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def network(self) -> SimulatedNetwork:
+        return self.server.network
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[dict] = None, bandwidth=None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if bandwidth is None:
+            self.wfile.write(body)
+            return
+        chunk_size = max(1, int(bandwidth / 100))  # about 100 writes per second
+        for start in range(0, len(body), chunk_size):
+            self.wfile.write(body[start : start + chunk_size])
+            self.wfile.flush()
+            time.sleep(chunk_size / bandwidth)
+
+    def _json(self, status: int, data: object, headers: Optional[dict] = None) -> None:
+        self._send(status, json.dumps(data).encode(), {"Content-Type": "application/json", **(headers or {})})
+
+    def _handle(self, method: str) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/registry.json" and method == "GET":
+            self.network._record("registry", "registry")
+            if not self.network._apply(self.network.registry_behaviour):
+                return self._send(503)
+            return self._send(200, self.network._registry_body, {"Content-Type": "application/json"})
+        match = _NODE_PATH_RE.fullmatch(self.path)
+        if match is None or match.group(1) not in self.network.behaviours:
+            return self._send(404)
+        node_id, path = match.groups()
+        behaviour = self.network.behaviours[node_id]
+        endpoint = {
+            ("GET", ""): "node",
+            ("POST", "magpie/signin"): "signin",
+            ("POST", "stac/search"): "search",
+        }.get((method, path))
+        if endpoint is None and method == "GET" and path.startswith("thredds/fileServer/"):
+            endpoint = "file"
+        if endpoint is None:
+            return self._send(404)
+        self.network._record(node_id, endpoint)
+        if not self.network._apply(behaviour):
+            return self._send(503)
+        if endpoint == "node":
+            self._send(200, b"<html></html>", {"Content-Type": "text/html"})
+        elif endpoint == "signin":
+            credentials = json.loads(body or b"{}")
+            if credentials.get("user_name") != USER_NAME or credentials.get("password") != PASSWORD:
+                return self._json(401, {"detail": "Incorrect credentials."})
+            cookie = f"auth_tkt={node_id}-{USER_NAME}; Path=/{node_id}/"
+            self._json(200, {"detail": "Login successful."}, {"Set-Cookie": cookie})
+        elif endpoint == "search":
+            limit = json.loads(body or b"{}").get("limit", 10)
+            self._json(200, {"type": "FeatureCollection", "features": [{"id": f"{node_id}-{i}"} for i in range(limit)]})
+        else:
+            self._send(200, b"\0" * self.network.file_size, bandwidth=behaviour.bandwidth)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@dataclasses.dataclass
+class LoadReport:
+    """Throughput, latency percentiles and errors of a load scenario."""
+
+    name: str
+    duration: float
+    latencies: list[float]
+    errors: list[str]
+
+    @property
+    def requests(self) -> int:
+        return len(self.latencies) + len(self.errors)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.duration if self.duration else math.inf
+
+    def percentile(self, p: float) -> float:
+        """Return the p-th percentile of the latencies of the successful operations (nearest rank)."""
+        if not self.latencies:
+            return math.nan
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def summary(self) -> str:
+        return (
+            f"{self.name}: {self.requests} ops in {self.duration:.2f}s ({self.throughput:.1f} ops/s), "
+            f"{len(self.errors)} errors, latency p50={self.percentile(50) * 1000:.1f}ms "
+            f"p90={self.percentile(90) * 1000:.1f}ms p99={self.percentile(99) * 1000:.1f}ms"
+        )
+
+
+# reports of the scenarios run in this session (printed at the end of the test session)
+REPORTS: list[LoadReport] = []
+
+
+def run_load(name: str, operation: Callable[[int], object], clients: int, iterations: int) -> LoadReport:
+    """
+    Run operation `iterations` times from `clients` concurrent threads and report how long each call took.
+
+    The operation is called with the iteration number. Exceptions are recorded as errors.
+    """
+    latencies: list[float] = []
+    errors: list[str] = []
+
+    def timed(i: int) -> None:
+        start = time.perf_counter()
+        try:
+            operation(i)
+        except Exception as err:
+            errors.append(f"{type(err).__name__}: {err}")
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(timed, range(iterations)))
+    report = LoadReport(name, time.perf_counter() - start, latencies, errors)
+    REPORTS.append(report)
+    return report
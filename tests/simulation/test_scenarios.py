@@ -0,0 +1,101 @@
+import pytest
+import requests
+from network import CLIENTS, FILE_PATH, ITERATIONS, PASSWORD, USER_NAME, Behaviour, run_load
+
+import marble_client
+from marble_client.login import login_nodes
+
+
+def test_network_serves_nodes(network, tmp_path):
+    """Sanity check of the simulated network itself"""
+    client = marble_client.MarbleClient()
+    assert list(client.nodes) == list(network.behaviours)
+    assert client.check_nodes() == {node_id: True for node_id in network.behaviours}
+    destination = client.fetch(FILE_PATH, destination=str(tmp_path / "data.nc"))
+    assert (tmp_path / "data.nc").stat().st_size == network.file_size == len(open(destination, "rb").read())
+    assert len(list(client.search({"limit": 2}))) == 2 * len(network.behaviours)
+
+
+def test_concurrent_clients(network, tmp_path):
+    """Many users each load the registry, check the nodes, search and download a file"""
+
+    def user_session(i):
+        client = marble_client.MarbleClient()
+        client.check_nodes()
+        assert len(list(client.search({"limit": 5}))) == 5 * len(client.nodes)
+        client.fetch(FILE_PATH, destination=str(tmp_path / f"data{i}.nc"))
+
+    report = run_load("concurrent clients", user_session, CLIENTS, ITERATIONS)
+    assert report.errors == []
+    assert network.count("file") == ITERATIONS
+
+
+def test_registry_refresh_storm(network):
+    """Many clients load a slow registry at the same time"""
+    network.registry_behaviour = Behaviour(latency=0.1)
+    report = run_load("registry refresh storm", lambda _: marble_client.MarbleClient(), CLIENTS, ITERATIONS)
+    assert report.errors == []
+    assert network.count("registry") <= ITERATIONS
+
+
+def test_registry_refresh_storm_with_errors(network):
+    """Clients fall back to the cached registry when the registry server fails under load"""
+    marble_client.MarbleClient()  # populate the cache
+    network.registry_behaviour = Behaviour(latency=0.05, error_rate=0.5)
+    with pytest.warns(UserWarning):
+        report = run_load(
+            "registry refresh storm (50% errors)", lambda _: marble_client.MarbleClient(), CLIENTS, ITERATIONS
+        )
+    assert report.errors == []
+
+
+def test_login_burst(network):
+    """Many users log in to every node at the same time"""
+    client = marble_client.MarbleClient()
+    nodes = list(client.nodes.values())
+    for behaviour in network.behaviours.values():
+        behaviour.latency = 0.02
+
+    def login(_):
+        session = requests.Session()
+        results = login_nodes(nodes, session, USER_NAME, PASSWORD)
+        assert all(not isinstance(result, Exception) for result in results.values()), results
+        assert len(session.cookies) == len(nodes)
+
+    report = run_load("login burst", login, CLIENTS, ITERATIONS)
+    assert report.errors == []
+    assert network.count("signin") == ITERATIONS * len(nodes)
+
+
+def test_fetch_with_degraded_nodes(network, tmp_path):
+    """Fetches succeed and stay fast when some replicas are slow or failing"""
+    slow, failing, *_ = network.behaviours.values()
+    slow.latency = 1.0
+    failing.error_rate = 0.5
+    client = marble_client.MarbleClient()
+
+    report = run_load(
+        "fetch with degraded nodes",
+        lambda i: client.fetch(FILE_PATH, destination=str(tmp_path / f"data{i}.nc"), hedge_after=0.2),
+        CLIENTS,
+        ITERATIONS,
+    )
+    assert report.errors == []
+    # hedging means that no fetch waits for the full latency of the slow node
+    assert report.percentile(99) < 1.0
+
+
+def test_fetch_low_bandwidth(network, tmp_path):
+    """Downloads from a node are limited by its bandwidth"""
+    for behaviour in network.behaviours.values():
+        behaviour.bandwidth = network.file_size * 4  # a quarter of a second per file
+    client = marble_client.MarbleClient()
+
+    report = run_load(
+        "fetch with low bandwidth",
+        lambda i: client.fetch(FILE_PATH, destination=str(tmp_path / f"data{i}.nc")),
+        CLIENTS,
+        CLIENTS,
+    )
+    assert report.errors == []
+    assert report.percentile(0) >= 0.2
@@ -0,0 +1,286 @@
+import importlib
+import os
+import time
+
+import fakeredis
+import pytest
+import responses as responses_
+
+import marble_client
+from marble_client.cache import (
+    FileCacheBackend,
+    KeyValueCacheBackend,
+    MemoryCacheBackend,
+    ShardedFileCacheBackend,
+    ShardedRegistry,
+    get_cache_backend,
+)
+
+REGISTRY_URL = "https://registry.example.com/registry.json"
+
+
+@pytest.fixture(params=["file", "memory", "kv"])
+def backend(request, tmp_path):
+    if request.param == "file":
+        yield FileCacheBackend(str(tmp_path))
+    elif request.param == "memory":
+        yield MemoryCacheBackend()
+    else:
+        yield KeyValueCacheBackend(fakeredis.FakeRedis())
+
+
+def test_get_missing(backend):
+    assert backend.get(REGISTRY_URL) is None
+
+
+def test_set_get(backend):
+    backend.set(REGISTRY_URL, b"value")
+    backend.set(REGISTRY_URL, b"new value")
+    assert backend.get(REGISTRY_URL) == b"new value"
+    assert backend.get(REGISTRY_URL + "?other") is None
+
+
+def test_writer_commit(backend):
+    writer = backend.writer(REGISTRY_URL)
+    writer.write(b"part 1, ")
+    writer.write(b"part 2")
+    assert backend.get(REGISTRY_URL) is None
+    writer.commit()
+    writer.close()
+    assert backend.get(REGISTRY_URL) == b"part 1, part 2"
+
+
+def test_writer_discarded(backend):
+    backend.set(REGISTRY_URL, b"value")
+    writer = backend.writer(REGISTRY_URL)
+    writer.write(b"partial value")
+    writer.close()
+    assert backend.get(REGISTRY_URL) == b"value"
+
+
+def test_set_get_registry(backend, registry_content):
+    assert backend.get_registry(REGISTRY_URL) is None
+    backend.set_registry(REGISTRY_URL, registry_content, "2024-01-01T00:00:00+00:00")
+    registry = backend.get_registry(REGISTRY_URL)
+    assert registry.last_updated == "2024-01-01T00:00:00+00:00"
+    assert registry.node_ids == list(registry_content)
+    first_id = registry.node_ids[0]
+    assert registry.get(first_id) == registry_content[first_id]
+    assert registry.get("unknown") is None
+    assert list(registry) == list(registry_content.items())
+
+
+def test_get_registry_invalid(backend):
+    backend.set(REGISTRY_URL, b"not json")
+    with pytest.raises(OSError):
+        backend.get_registry(REGISTRY_URL)
+
+
+def test_file_backend_paths(tmp_path):
+    backend = FileCacheBackend(str(tmp_path))
+    assert backend.path(marble_client.constants.NODE_REGISTRY_URL) == str(tmp_path / "registry.cached.json")
+    assert os.path.dirname(backend.path(REGISTRY_URL)) == str(tmp_path)
+    assert backend.path(REGISTRY_URL) != backend.path(REGISTRY_URL + "?other")
+    backend.writer(REGISTRY_URL).close()
+    assert not os.listdir(tmp_path)
+
+
+def test_kv_backend_options():
+    store = fakeredis.FakeRedis()
+    backend = KeyValueCacheBackend(store, prefix="test:", ttl=60)
+    backend.set(REGISTRY_URL, b"value")
+    assert store.get(f"test:{REGISTRY_URL}") == b"value"
+    assert 0 < store.ttl(f"test:{REGISTRY_URL}") <= 60
+    assert backend.uri(REGISTRY_URL) == f"kv://test:{REGISTRY_URL}"
+
+
+def test_kv_backend_errors():
+    """Test that errors from the key-value store are raised as OSError"""
+    server = fakeredis.FakeServer()
+    server.connected = False
+    store = fakeredis.FakeRedis(server=server)
+    backend = KeyValueCacheBackend(store)
+    with pytest.raises(OSError):
+        backend.get(REGISTRY_URL)
+    with pytest.raises(OSError):
+        backend.set(REGISTRY_URL, b"value")
+
+
+def test_get_cache_backend(tmp_path):
+    assert isinstance(get_cache_backend(None), FileCacheBackend)
+    assert get_cache_backend(f"file://{tmp_path}").path(REGISTRY_URL).startswith(str(tmp_path))
+    assert get_cache_backend("memory://") is get_cache_backend("memory://")
+    assert isinstance(get_cache_backend("redis://localhost:6379/0"), KeyValueCacheBackend)
+    assert isinstance(get_cache_backend("sharded://"), ShardedFileCacheBackend)
+    assert get_cache_backend(f"sharded://{tmp_path}").shard_directory(REGISTRY_URL).startswith(str(tmp_path))
+    with pytest.raises(ValueError):
+        get_cache_backend("other://")
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_shared_cache(stream, tmp_cache, registry_content, responses):
+    """Test that clients that share a cache backend can use a registry cached by another client"""
+    cache = KeyValueCacheBackend(fakeredis.FakeRedis())
+    marble_client.MarbleClient(cache=cache, stream=stream).nodes
+    assert not os.listdir(tmp_cache)
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient(cache=cache)
+    assert set(client.nodes) == set(registry_content)
+    assert client.registry_uri == cache.uri(marble_client.constants.NODE_REGISTRY_URL)
+
+
+def test_shared_cache_offline(registry_content, responses):
+    cache = MemoryCacheBackend()
+    marble_client.MarbleClient(cache=cache)
+    client = marble_client.MarbleClient(cache=cache, offline=True)
+    assert len(responses.calls) == 1
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_cache_write_error(registry_content):
+    """Test that a warning is issued if the registry cannot be cached"""
+    server = fakeredis.FakeServer()
+    server.connected = False
+    store = fakeredis.FakeRedis(server=server)
+    with pytest.warns(UserWarning, match="Could not write the registry cache"):
+        client = marble_client.MarbleClient(cache=KeyValueCacheBackend(store))
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_cache_url_env(monkeypatch, registry_content, responses):
+    monkeypatch.setenv("MARBLE_CACHE_URL", "memory://")
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    marble_client.MarbleClient()
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient()
+    assert client.registry_uri == f"memory://{marble_client.constants.NODE_REGISTRY_URL}"
+    assert set(client.nodes) == set(registry_content)
+
+
+def _shards(backend, key=REGISTRY_URL):
+    directory = backend.shard_directory(key)
+    return {name: os.stat(os.path.join(directory, name)).st_mtime_ns for name in os.listdir(directory)}
+
+
+def test_sharded_set_get_registry(tmp_path, registry_content):
+    backend = ShardedFileCacheBackend(str(tmp_path))
+    assert backend.get_registry(REGISTRY_URL) is None
+    backend.set_registry(REGISTRY_URL, registry_content, "2024-01-01T00:00:00+00:00")
+    registry = backend.get_registry(REGISTRY_URL)
+    assert registry.last_updated == "2024-01-01T00:00:00+00:00"
+    assert registry.node_ids == list(registry_content)
+    assert list(registry) == list(registry_content.items())
+    assert len(_shards(backend)) == len(registry_content) + 1  # with the manifest
+
+
+def test_sharded_writes_only_changed_shards(tmp_path, registry_content):
+    """Test that storing a new version of a registry only writes the shards of the nodes that changed"""
+    backend = ShardedFileCacheBackend(str(tmp_path))
+    backend.set_registry(REGISTRY_URL, registry_content)
+    before = _shards(backend)
+    changed_id, *unchanged_ids = registry_content
+    new_registry = {**registry_content, changed_id: {**registry_content[changed_id], "last_updated": "2030-01-01"}}
+    backend.set_registry(REGISTRY_URL, new_registry)
+    after = _shards(backend)
+    assert len(set(after) - set(before)) == 1
+    for name, mtime in before.items():
+        if name != "manifest.json" and not name.startswith(f"{changed_id}."):
+            assert after[name] == mtime
+    assert dict(backend.get_registry(REGISTRY_URL)) == new_registry
+
+
+def _change_node(registry, node_id, last_updated):
+    return {**registry, node_id: {**registry[node_id], "last_updated": last_updated}}
+
+
+def test_sharded_previous_manifest_readable(tmp_path, registry_content):
+    """Test that a registry read from the previous manifest can still read its shards after a new version is stored"""
+    backend = ShardedFileCacheBackend(str(tmp_path))
+    backend.set_registry(REGISTRY_URL, registry_content)
+    # a registry loaded (lazily) by another process before the new version is stored
+    previous = ShardedFileCacheBackend(str(tmp_path)).get_registry(REGISTRY_URL)
+    changed_id = previous.node_ids[0]
+    backend.set_registry(REGISTRY_URL, _change_node(registry_content, changed_id, "2030-01-01"))
+    assert previous.get(changed_id) == registry_content[changed_id]
+
+
+def test_sharded_stale_shards_removed_after_grace_period(tmp_path, registry_content):
+    backend = ShardedFileCacheBackend(str(tmp_path), grace_period=0.1)
+    backend.set_registry(REGISTRY_URL, registry_content)
+    old_shards = set(_shards(backend))
+    # the grace period starts when a shard stops being referenced, not when it was written
+    for name in old_shards:
+        os.utime(os.path.join(backend.shard_directory(REGISTRY_URL), name), (0, 0))
+    changed_id = next(iter(registry_content))
+    stale = {name for name in old_shards if name.startswith(f"{changed_id}.")}
+    new_registry = _change_node(registry_content, changed_id, "2030-01-01")
+    backend.set_registry(REGISTRY_URL, new_registry)
+    assert stale < set(_shards(backend))
+    time.sleep(0.15)
+    backend.set_registry(REGISTRY_URL, new_registry)
+    assert stale.isdisjoint(_shards(backend))
+    assert len(_shards(backend)) == len(registry_content) + 1  # with the manifest
+
+
+def test_sharded_bytes_interface(tmp_path, registry_content):
+    """Test that values in the registry cache format can be stored and read (e.g. by `marble cache seed`)"""
+    backend = ShardedFileCacheBackend(str(tmp_path))
+    backend.set(REGISTRY_URL, marble_client.MarbleClient._serialize_registry_cache(registry_content))
+    registry, _ = marble_client.MarbleClient._parse_registry_cache(backend.get(REGISTRY_URL), REGISTRY_URL)
+    assert registry == registry_content
+    assert backend.uri(REGISTRY_URL) == f"file://{os.path.realpath(backend.shard_directory(REGISTRY_URL))}"
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_sharded_client_cache(stream, tmp_path, registry_content):
+    cache = ShardedFileCacheBackend(str(tmp_path))
+    marble_client.MarbleClient(cache=cache, stream=stream).nodes
+    client = marble_client.MarbleClient(cache=cache, offline=True)
+    assert list(client.nodes) == list(registry_content)
+    assert client.registry_uri == cache.uri(marble_client.constants.NODE_REGISTRY_URL)
+
+
+@pytest.mark.parametrize("offline", [True, False])
+def test_sharded_client_lookup_reads_one_shard(offline, tmp_path, registry_content, monkeypatch, responses):
+    """Test that looking up a node in a registry loaded from the sharded cache only reads the shard of that node"""
+    cache = ShardedFileCacheBackend(str(tmp_path))
+    marble_client.MarbleClient(cache=cache)
+    reads = []
+    get = ShardedRegistry.get
+    monkeypatch.setattr(ShardedRegistry, "get", lambda self, node_id: reads.append(node_id) or get(self, node_id))
+    if offline:
+        client = marble_client.MarbleClient(cache=cache, offline=True, stream=True)
+    else:
+        responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+        with pytest.warns(UserWarning):
+            client = marble_client.MarbleClient(cache=cache, stream=True)
+    *_, last_id = registry_content
+    assert client[last_id].id == last_id
+    assert "unknown" not in client
+    assert reads == [last_id, "unknown"]
+    assert list(client.nodes) == list(registry_content)
+    assert client.nodes[last_id] is client[last_id]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_sharded_client_shards_expired(stream, tmp_path, registry_content):
+    """Test that a client keeps working after the shards of the registry version it loaded have been removed"""
+    cache = ShardedFileCacheBackend(str(tmp_path), grace_period=0)
+    cache.set_registry(marble_client.constants.NODE_REGISTRY_URL, registry_content)
+    client = marble_client.MarbleClient(cache=cache, offline=True, stream=stream)
+    first_id, *other_ids = registry_content
+    first_node = client[first_id]
+    new_registry = registry_content
+    for node_id in other_ids:
+        new_registry = _change_node(new_registry, node_id, "2030-01-01")
+    for _ in range(2):
+        cache.set_registry(marble_client.constants.NODE_REGISTRY_URL, new_registry)
+    assert client[other_ids[0]].id == other_ids[0]
+    assert client[first_id] is first_node
+    assert len(client.nodes) == len(registry_content)
+    assert client.nodes[first_id] is first_node
+    expected = new_registry if stream else registry_content  # without streaming, every shard is read at once
+    assert {node_id: node._nodedata for node_id, node in client.nodes.items()} == expected
@@ -0,0 +1,199 @@
+import os
+
+import pytest
+import requests
+import responses as responses_
+from responses import matchers
+
+import marble_client
+
+STAC_ROOT = {
+    "id": "stac",
+    "title": "Example STAC",
+    "description": "Example catalog",
+    "stac_version": "1.0.0",
+    "conformsTo": ["https://api.stacspec.org/v1.0.0/core"],
+    "links": [
+        {"rel": "self", "href": "https://example.com/stac/"},
+        {"rel": "child", "href": "https://example.com/stac/collections/a"},
+        {"rel": "data", "href": "https://example.com/stac/collections"},
+    ],
+}
+
+THREDDS_CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink" name="Example THREDDS" version="1.0.1">
+  <service name="all" serviceType="Compound" base="">
+    <service name="odap" serviceType="OpenDAP" base="/thredds/dodsC/" />
+    <service name="http" serviceType="HTTPServer" base="/thredds/fileServer/" />
+  </service>
+  <dataset name="Example dataset" ID="example" />
+  <catalogRef xlink:href="datasets/catalog.xml" xlink:title="Datasets" name="" />
+</catalog>
+"""
+
+WPS_CAPABILITIES = """<?xml version="1.0" encoding="UTF-8"?>
+<wps:Capabilities xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1"
+                  service="WPS" version="1.0.0">
+  <ows:ServiceIdentification>
+    <ows:Title>Example WPS</ows:Title>
+    <ows:Abstract>Processes for testing</ows:Abstract>
+  </ows:ServiceIdentification>
+  <wps:ProcessOfferings>
+    <wps:Process><ows:Identifier>subset</ows:Identifier><ows:Title>Subset</ows:Title></wps:Process>
+    <wps:Process><ows:Identifier>average</ows:Identifier><ows:Title>Average</ows:Title></wps:Process>
+  </wps:ProcessOfferings>
+</wps:Capabilities>
+"""
+
+
+def make_service(node, name, url, keywords=()):
+    service_json = {
+        "name": name,
+        "keywords": list(keywords),
+        "description": "",
+        "links": [{"rel": "service", "href": url}],
+    }
+    return marble_client.MarbleService(service_json, node)
+
+
+@pytest.fixture
+def stac_service(node, responses):
+    service = make_service(node, "stac", "https://example.com/stac/")
+    responses.get(service.url, json=STAC_ROOT, headers={"ETag": '"v1"'})
+    yield service
+
+
+def test_stac_capabilities(stac_service):
+    assert stac_service.capabilities() == {
+        "type": "stac",
+        "id": "stac",
+        "title": "Example STAC",
+        "description": "Example catalog",
+        "stac_version": "1.0.0",
+        "conforms_to": ["https://api.stacspec.org/v1.0.0/core"],
+        "children": ["https://example.com/stac/collections/a", "https://example.com/stac/collections"],
+    }
+
+
+def test_thredds_capabilities(node, responses):
+    service = make_service(node, "thredds", "https://example.com/thredds/")
+    responses.get("https://example.com/thredds/catalog/catalog.xml", body=THREDDS_CATALOG)
+    assert service.capabilities() == {
+        "type": "thredds",
+        "name": "Example THREDDS",
+        "version": "1.0.1",
+        "services": [
+            {"name": "odap", "type": "OpenDAP", "base": "/thredds/dodsC/"},
+            {"name": "http", "type": "HTTPServer", "base": "/thredds/fileServer/"},
+        ],
+        "datasets": ["Example dataset"],
+        "catalog_refs": ["Datasets"],
+    }
+
+
+@pytest.mark.parametrize(("name", "keywords"), [("finch", []), ("other", ["WPS"])])
+def test_wps_capabilities(node, responses, name, keywords):
+    service = make_service(node, name, "https://example.com/wps", keywords)
+    responses.get(
+        "https://example.com/wps",
+        body=WPS_CAPABILITIES,
+        match=[matchers.query_param_matcher({"service": "WPS", "request": "GetCapabilities"})],
+    )
+    assert service.capabilities() == {
+        "type": "wps",
+        "version": "1.0.0",
+        "title": "Example WPS",
+        "abstract": "Processes for testing",
+        "processes": [{"identifier": "subset", "title": "Subset"}, {"identifier": "average", "title": "Average"}],
+    }
+
+
+def test_capabilities_explicit_kind(node, responses):
+    service = make_service(node, "catalog", "https://example.com/catalog/")
+    responses.get(service.url, json=STAC_ROOT)
+    assert service.capabilities(kind="stac")["type"] == "stac"
+
+
+def test_capabilities_unknown_kind(node):
+    with pytest.raises(ValueError):
+        make_service(node, "other", "https://example.com/other/").capabilities()
+
+
+def test_capabilities_invalid_document(node, responses):
+    service = make_service(node, "thredds", "https://example.com/thredds/")
+    responses.get("https://example.com/thredds/catalog/catalog.xml", body="<catalog")
+    with pytest.raises(RuntimeError):
+        service.capabilities()
+
+
+def test_capabilities_error_status(node, responses):
+    service = make_service(node, "stac", "https://example.com/stac/")
+    responses.get(service.url, status=500)
+    with pytest.raises(requests.exceptions.HTTPError):
+        service.capabilities()
+
+
+def test_capabilities_cached(stac_service, responses):
+    """Test that capabilities are only requested once while the cached value is fresh"""
+    assert stac_service.capabilities() == stac_service.capabilities()
+    assert len(responses.calls) == 2  # registry and capabilities
+
+
+def test_capabilities_revalidated(stac_service, responses):
+    """Test that stale cached capabilities are revalidated with the ETag of the cached response"""
+    capabilities = stac_service.capabilities()
+    responses.replace(responses_.GET, stac_service.url, status=304)
+    assert stac_service.capabilities(ttl=0) == capabilities
+    assert responses.calls[-1].request.headers["If-None-Match"] == '"v1"'
+
+
+def test_capabilities_refresh(stac_service, responses):
+    stac_service.capabilities()
+    responses.replace(responses_.GET, stac_service.url, json={**STAC_ROOT, "title": "New title"})
+    assert stac_service.capabilities(refresh=True)["title"] == "New title"
+
+
+def test_capabilities_new_version(stac_service, responses):
+    """Test that cached capabilities are not used if the node version changes"""
+    stac_service.capabilities()
+    stac_service._node._nodedata = {**stac_service._node._nodedata, "version": "new-version"}
+    responses.replace(responses_.GET, stac_service.url, json={**STAC_ROOT, "title": "New title"})
+    assert stac_service.capabilities()["title"] == "New title"
+    assert "If-None-Match" not in responses.calls[-1].request.headers
+
+
+def test_capabilities_session_not_cached(stac_service, responses):
+    """Test that capabilities requested with a session are not shared with other callers through the cache"""
+    responses.replace(responses_.GET, stac_service.url, json={**STAC_ROOT, "title": "Private title"})
+    assert stac_service.capabilities(session=requests.Session())["title"] == "Private title"
+    responses.replace(responses_.GET, stac_service.url, json=STAC_ROOT)
+    assert stac_service.capabilities()["title"] == STAC_ROOT["title"]
+    responses.replace(responses_.GET, stac_service.url, json={**STAC_ROOT, "title": "Private title"})
+    assert stac_service.capabilities(session=requests.Session())["title"] == "Private title"
+    assert len(responses.calls) == 4  # registry and capabilities
+
+
+def test_capabilities_disk_cache(stac_service, responses, tmp_cache):
+    """Test that capabilities are cached on disk and shared with other clients"""
+    capabilities = stac_service.capabilities()
+    assert os.listdir(os.path.join(tmp_cache, "capabilities"))
+    client = marble_client.MarbleClient()
+    service = make_service(client[stac_service._node.id], "stac", stac_service.url)
+    calls = len(responses.calls)
+    assert service.capabilities() == capabilities
+    assert len(responses.calls) == calls
+
+
+def test_client_capabilities(client, responses):
+    nodes = list(client.nodes.values())
+    for i, node in enumerate(nodes):
+        service = make_service(node, "stac", f"https://example.com/{i}/stac/")
+        node._services["stac"] = service
+        if i == 0:
+            responses.get(service.url, status=500)
+        else:
+            responses.get(service.url, json={**STAC_ROOT, "id": node.id})
+    with pytest.warns(UserWarning):
+        capabilities = client.capabilities("stac", max_workers=2)
+    assert {node_id: value["id"] for node_id, value in capabilities.items()} == {node.id: node.id for node in nodes[1:]}
@@ -0,0 +1,129 @@
+import gzip
+import importlib
+import json
+import os
+
+import pytest
+import requests
+import responses as responses_
+
+import marble_client
+from marble_client.cli import main
+
+
+def test_cache_seed(tmp_cache, registry_content, capsys):
+    assert main(["cache", "seed"]) == 0
+    with open(os.path.join(tmp_cache, "registry.cached.json")) as f:
+        assert json.load(f)[marble_client.MarbleClient._registry_cache_key] == registry_content
+    assert marble_client.constants.NODE_REGISTRY_URL in capsys.readouterr().out
+
+
+def test_cache_seed_from_snapshot(tmp_cache, tmp_path, registry_content, responses):
+    responses.replace(
+        responses_.GET, marble_client.constants.NODE_REGISTRY_URL, body=requests.exceptions.ConnectionError()
+    )
+    snapshot = tmp_path / "snapshot.json"
+    snapshot.write_text(json.dumps(registry_content))
+    assert main(["cache", "seed", "--from", str(snapshot)]) == 0
+    assert not responses.calls
+    client = marble_client.MarbleClient(offline=True)
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_cache_seed_from_corrupt_snapshot(tmp_cache, tmp_path, registry_content, capsys):
+    data = gzip.compress(json.dumps(registry_content).encode())
+    snapshot = tmp_path / "snapshot.json.gz"
+    snapshot.write_bytes(data[:10] + b"\xff" * 8 + data[18:])
+    assert main(["cache", "seed", "--from", str(snapshot)]) == 1
+    assert capsys.readouterr().err.startswith("Error: Could not read the cached registry")
+    assert not os.listdir(tmp_cache)
+
+
+def test_cache_seed_registry_unavailable(responses, capsys):
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    assert main(["cache", "seed"]) == 1
+    assert capsys.readouterr().err.startswith("Error:")
+
+
+def test_no_command():
+    with pytest.raises(SystemExit):
+        main([])
+
+
+def test_cache_warm(tmp_cache, registry_content, capsys):
+    assert main(["cache", "warm", "--json"]) == 0
+    cache_fname = os.path.join(tmp_cache, "registry.cached.json")
+    assert json.loads(capsys.readouterr().out) == {marble_client.constants.NODE_REGISTRY_URL: f"file://{cache_fname}"}
+    with open(cache_fname) as f:
+        assert json.load(f)[marble_client.MarbleClient._registry_cache_key] == registry_content
+
+
+@pytest.mark.parametrize("command", [["cache", "warm"], ["cache", "seed"], ["registry", "fetch"]])
+def test_commands_ignore_offline_env(command, tmp_cache, registry_content, responses, monkeypatch, capsys):
+    """Test that the commands that download the registry do so even if offline mode is enabled by default"""
+    monkeypatch.setattr(marble_client.client, "OFFLINE", True)
+    assert main(command) == 0
+    assert len(responses.calls) == 1
+    assert marble_client.constants.NODE_REGISTRY_URL in capsys.readouterr().out
+    with open(os.path.join(tmp_cache, "registry.cached.json")) as f:
+        assert json.load(f)[marble_client.MarbleClient._registry_cache_key] == registry_content
+
+
+@pytest.mark.parametrize("command", [["cache", "warm"], ["cache", "seed"], ["registry", "fetch"]])
+def test_commands_cache_write_error(command, tmp_path, monkeypatch, capsys):
+    """Test that the commands that update the cache fail if the cache cannot be written"""
+    (tmp_path / "file").write_text("")
+    monkeypatch.setenv("MARBLE_CACHE_DIR", str(tmp_path / "file" / "cache"))
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    try:
+        assert main(command) == 1
+    finally:
+        monkeypatch.undo()
+        importlib.reload(marble_client.constants)
+        importlib.reload(marble_client.client)
+    assert capsys.readouterr().err.startswith("Error: Could not write the registry cache")
+
+
+def test_registry_fetch(tmp_path, registry_content, capsys):
+    output = tmp_path / "registry.json"
+    assert main(["registry", "fetch", "--output", str(output), "--json"]) == 0
+    assert json.loads(output.read_text()) == registry_content
+    assert json.loads(capsys.readouterr().out) == {
+        "registry_uris": [marble_client.constants.NODE_REGISTRY_URL],
+        "nodes": len(registry_content),
+        "output": str(output),
+    }
+
+
+@pytest.mark.load_from_cache
+def test_registry_show_offline(registry_content, responses, capsys):
+    assert main(["registry", "show", "--offline", "--json"]) == 0
+    assert not responses.calls
+    assert json.loads(capsys.readouterr().out) == registry_content
+
+
+def test_registry_show(registry_content, capsys):
+    assert main(["registry", "show"]) == 0
+    assert len(capsys.readouterr().out.strip().splitlines()) == len(registry_content)
+
+
+def test_nodes_check(client, responses, capsys):
+    nodes = list(client.nodes.values())
+    for node in nodes:
+        responses.get(node.url)
+    assert main(["nodes", "check", "--concurrency", "2", "--json"]) == 0
+    assert json.loads(capsys.readouterr().out) == {node.id: True for node in nodes}
+
+
+def test_nodes_check_offline_node(client, responses, capsys):
+    online_node, offline_node, *_ = client.nodes.values()
+    responses.get(online_node.url)
+    responses.get(offline_node.url, status=500)
+    assert main(["nodes", "check", online_node.id, offline_node.id, "--json"]) == 1
+    assert json.loads(capsys.readouterr().out) == {online_node.id: True, offline_node.id: False}
+
+
+def test_nodes_check_unknown_node(capsys):
+    assert main(["nodes", "check", "no-such-node"]) == 1
+    assert capsys.readouterr().err.startswith("Error:")
@@ -1,11 +1,20 @@
 import datetime
+import gzip
+import importlib
 import json
 import os
+import sys
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock
 
 import dateutil.parser
 import pytest
 import requests
+import responses as responses_
+import urllib3
 
 import marble_client
 
@@ -162,3 +171,476 @@ def test_contains(client, registry_content):
 def test_not_contains(client, registry_content):
     """Test that __contains__ returns False when a node is not available for the current client"""
     assert "".join(registry_content) not in client
+
+
+def test_stream_load_from_remote_registry(tmp_cache, registry_content):
+    """Test that nodes are constructed lazily and the registry is cached when stream=True"""
+    client = marble_client.MarbleClient(stream=True)
+    first_node_id, *_ = registry_content
+    assert client[first_node_id].id == first_node_id
+    assert len(client._nodes) == 1
+    assert set(client.nodes) == set(registry_content)
+    with open(os.path.join(tmp_cache, "registry.cached.json")) as f:
+        content = json.load(f)
+    assert content.get(client._registry_cache_key) == registry_content
+    assert content.get(client._registry_cache_last_updated_key)
+
+
+def test_stream_cache_written_when_complete(tmp_cache, registry_content):
+    """Test that the cache is not updated until the whole registry has been read when stream=True"""
+    client = marble_client.MarbleClient(stream=True)
+    first_node_id, *_ = registry_content
+    assert first_node_id in client
+    assert not os.path.exists(os.path.join(tmp_cache, "registry.cached.json"))
+
+
+def test_stream_contains(registry_content):
+    client = marble_client.MarbleClient(stream=True)
+    assert all(node_id in client for node_id in registry_content)
+    assert "".join(registry_content) not in client
+
+
+def test_stream_invalid_registry(tmp_cache, responses):
+    """Test that an appropriate error is raised when the registry is invalid and stream=True"""
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, body='{"node": {"name": ')
+    client = marble_client.MarbleClient(stream=True)
+    with pytest.warns(UserWarning, match="Could not parse JSON"), pytest.raises(RuntimeError):
+        client.nodes  # there is no cache to fall back to
+    assert not os.listdir(tmp_cache)
+    # the nodes read before the error are not used as the registry
+    with pytest.raises(RuntimeError):
+        client.nodes
+    with pytest.raises(RuntimeError):
+        "node" in client
+
+
+def test_stream_truncated_registry(tmp_cache, registry_content, responses):
+    """Test that later accesses fail instead of using the nodes read before a streamed registry was cut off"""
+    body = json.dumps(registry_content)
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, body=body[: len(body) - 10])
+    client = marble_client.MarbleClient(stream=True, fallback=False)
+    first_id = next(iter(registry_content))
+    assert client[first_id].id == first_id
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            client.nodes
+    with pytest.raises(RuntimeError):
+        client[first_id]
+    assert client._snapshot is None
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, json=registry_content)
+    client.refresh()
+    assert list(client.nodes) == list(registry_content)
+
+
+def test_stream_truncated_registry_fallback(tmp_cache, registry_content, responses):
+    """Test that the cached registry is used if a streamed registry is cut off and fallback is True"""
+    first_id, second_id, *_ = registry_content
+    cached_registry = {**registry_content, first_id: {**registry_content[first_id], "last_updated": "2030-01-01"}}
+    marble_client.cache.FileCacheBackend().set_registry(marble_client.constants.NODE_REGISTRY_URL, cached_registry)
+    body = json.dumps(registry_content)
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, body=body[: len(body) - 10])
+    client = marble_client.MarbleClient(stream=True)
+    first_node, second_node = client[first_id], client[second_id]
+    with pytest.warns(UserWarning, match="Falling back to cached version"):
+        nodes = client.nodes
+    assert {node_id: node._nodedata for node_id, node in nodes.items()} == cached_registry
+    # nodes that were already read are only kept if the cached registry agrees
+    assert client[first_id] is not first_node
+    assert client[second_id] is second_node
+    assert client.registry_uri == f"file://{os.path.join(tmp_cache, 'registry.cached.json')}"
+
+
+@pytest.mark.parametrize("multiple", [True, False])
+def test_stream_interrupted_fallback(multiple, tmp_cache, registry_content, monkeypatch):
+    """Test that the cached registry is used if the connection is lost while a registry is streamed"""
+    marble_client.MarbleClient()
+    monkeypatch.setattr(
+        marble_client.client._TeeReader, "read", Mock(side_effect=urllib3.exceptions.ProtocolError("disconnected"))
+    )
+    registry_urls = [marble_client.constants.NODE_REGISTRY_URL] * (2 if multiple else 1)
+    with pytest.warns(UserWarning, match="Cannot retrieve registry"):
+        client = marble_client.MarbleClient(stream=True, registry_urls=registry_urls)
+        assert set(client.nodes) == set(registry_content)
+
+
+@pytest.fixture
+def cache_compression(request, monkeypatch):
+    compression = request.param
+    if compression == "zstd":
+        pytest.importorskip("backports.zstd" if sys.version_info < (3, 14) else "compression.zstd")
+    monkeypatch.setenv("MARBLE_CACHE_COMPRESSION", compression)
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    yield compression
+
+
+@pytest.mark.parametrize("cache_compression", ["gzip", "zstd"], indirect=True)
+@pytest.mark.parametrize("stream", [True, False])
+def test_compressed_cache(cache_compression, stream, tmp_cache, registry_content, responses):
+    """Test that the registry cache is compressed and that a compressed cache is detected when it is loaded"""
+    marble_client.MarbleClient(stream=stream).nodes
+    cache_file = os.path.join(tmp_cache, "registry.cached.json")
+    assert marble_client.utils.detect_compression(cache_file) == cache_compression
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient()
+    assert set(client.nodes) == set(registry_content)
+
+
+@pytest.fixture
+def without_zstd(monkeypatch):
+    """Make the zstd module unavailable"""
+    monkeypatch.setitem(sys.modules, "compression.zstd", None)
+    monkeypatch.setitem(sys.modules, "backports.zstd", None)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_compressed_cache_zstd_unavailable(without_zstd, stream, tmp_cache, registry_content, monkeypatch):
+    """Test that the registry is loaded but not cached if zstd compression is set but not available"""
+    monkeypatch.setenv("MARBLE_CACHE_COMPRESSION", "zstd")
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    with pytest.warns(UserWarning, match="Could not write the registry cache"):
+        client = marble_client.MarbleClient(stream=stream)
+        assert set(client.nodes) == set(registry_content)
+    assert not os.listdir(tmp_cache)
+
+
+def test_read_zstd_cache_unavailable(without_zstd, tmp_cache, registry_snapshot, registry_content, responses):
+    """Test that a zstd compressed cache that cannot be decompressed is handled like an unreadable cache"""
+    with open(os.path.join(tmp_cache, "registry.cached.json"), "wb") as f:
+        f.write(b"\x28\xb5\x2f\xfd" + b"\0" * 16)
+    client = marble_client.MarbleClient(offline=True)
+    assert client.registry_uri == f"file://{os.path.realpath(registry_snapshot)}"
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_read_corrupt_gzip_snapshot(tmp_cache, registry_snapshot, registry_content, responses):
+    """Test that a gzip compressed snapshot with corrupt data is handled like an unreadable snapshot"""
+    data = gzip.compress(json.dumps(registry_content).encode())
+    with open(registry_snapshot, "wb") as f:
+        f.write(data[:10] + b"\xff" * 8 + data[18:])
+    with pytest.raises(RuntimeError, match="Could not read the cached registry"):
+        marble_client.MarbleClient(offline=True)
+
+
+def test_invalid_cache_compression(monkeypatch, responses):
+    monkeypatch.setenv("MARBLE_CACHE_COMPRESSION", "lzma")
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    with pytest.raises(ValueError, match="Unsupported compression 'lzma'"):
+        marble_client.MarbleClient()
+    assert not responses.calls
+
+
+@pytest.mark.load_from_cache
+def test_load_from_uncompressed_cache(monkeypatch, registry_content):
+    """Test that an uncompressed cache can still be read when the cache compression is set"""
+    monkeypatch.setenv("MARBLE_CACHE_COMPRESSION", "gzip")
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient()
+    assert set(client.nodes) == set(registry_content)
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_compressed_transfer(stream, registry_content, responses):
+    """Test that the registry can be transferred with gzip compression"""
+    responses.replace(
+        responses_.GET,
+        marble_client.constants.NODE_REGISTRY_URL,
+        body=gzip.compress(json.dumps(registry_content).encode()),
+        headers={"Content-Encoding": "gzip"},
+    )
+    client = marble_client.MarbleClient(stream=stream)
+    assert set(client.nodes) == set(registry_content)
+    assert "gzip" in responses.calls[0].request.headers["Accept-Encoding"]
+
+
+@pytest.fixture
+def private_registry(registry_content, responses):
+    """A second registry containing a new node and a newer version of an existing node"""
+    url = "https://registry.example.com/private_registry.json"
+    first_node_id, *_ = registry_content
+    content = {
+        "PrivateNode": {**next(iter(registry_content.values())), "name": "Private"},
+        first_node_id: {
+            **registry_content[first_node_id],
+            "name": "Overridden",
+            "last_updated": "2999-01-01T00:00:00Z",
+        },
+    }
+    responses.get(url, json=content)
+    yield url, content
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_multiple_registries(private_registry, registry_content, stream):
+    """Test that nodes from multiple registries are merged"""
+    url, content = private_registry
+    client = marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url], stream=stream)
+    assert set(client.nodes) == set(registry_content) | set(content)
+    assert client.registry_uris == [marble_client.constants.NODE_REGISTRY_URL, url]
+    assert client.registry_uri == marble_client.constants.NODE_REGISTRY_URL
+
+
+@pytest.mark.parametrize(
+    ("conflict", "overridden"), [("first", False), ("last", True), ("newest", True)], ids=["first", "last", "newest"]
+)
+def test_multiple_registries_conflict(private_registry, registry_content, conflict, overridden):
+    url, _ = private_registry
+    first_node_id, *_ = registry_content
+    client = marble_client.MarbleClient(
+        registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url], conflict=conflict
+    )
+    assert (client[first_node_id].name == "Overridden") is overridden
+
+
+def test_multiple_registries_conflict_newest_order(private_registry, registry_content):
+    """Test that the newest node is used regardless of the order of the registries"""
+    url, _ = private_registry
+    first_node_id, *_ = registry_content
+    client = marble_client.MarbleClient(
+        registry_urls=[url, marble_client.constants.NODE_REGISTRY_URL], conflict="newest"
+    )
+    assert client[first_node_id].name == "Overridden"
+
+
+def test_multiple_registries_conflict_error(private_registry):
+    url, _ = private_registry
+    with pytest.raises(marble_client.RegistryConflictError):
+        marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url], conflict="error")
+
+
+def test_multiple_registries_cached_separately(private_registry, tmp_cache, registry_content):
+    """Test that each registry is cached in its own file in the cache directory"""
+    url, content = private_registry
+    marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url])
+    cache_files = sorted(os.listdir(tmp_cache))
+    assert len(cache_files) == 2
+    cached = {}
+    for cache_file in cache_files:
+        with open(os.path.join(tmp_cache, cache_file)) as f:
+            cached[cache_file] = json.load(f)[marble_client.MarbleClient._registry_cache_key]
+    assert cached.pop("registry.cached.json") == registry_content
+    assert list(cached.values()) == [content]
+
+
+def test_multiple_registries_fallback(private_registry, responses, registry_content):
+    """Test that each registry falls back to its own cache if it cannot be accessed"""
+    url, content = private_registry
+    marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url])
+    responses.replace(responses_.GET, url, status=500)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url])
+    assert set(client.nodes) == set(registry_content) | set(content)
+    assert client.registry_uris[1].startswith("file://")
+
+
+@pytest.fixture
+def registry_snapshot(tmp_path, monkeypatch, registry_content):
+    snapshot = tmp_path / "registry.snapshot.json"
+    snapshot.write_text(json.dumps(registry_content))
+    monkeypatch.setenv("MARBLE_REGISTRY_SNAPSHOT", str(snapshot))
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    yield str(snapshot)
+
+
+@pytest.mark.load_from_cache
+def test_offline(responses, tmp_cache, registry_content):
+    """Test that the registry is loaded from the cache without accessing the network when offline=True"""
+    client = marble_client.MarbleClient(offline=True)
+    assert not responses.calls
+    assert client.registry_uri == f"file://{os.path.join(tmp_cache, 'registry.cached.json')}"
+    assert set(client.nodes) == set(registry_content)
+
+
+@pytest.mark.load_from_cache
+def test_offline_env(responses, monkeypatch):
+    """Test that the MARBLE_OFFLINE environment variable enables offline mode by default"""
+    monkeypatch.setenv("MARBLE_OFFLINE", "true")
+    importlib.reload(marble_client.constants)
+    importlib.reload(marble_client.client)
+    marble_client.MarbleClient()
+    assert not responses.calls
+
+
+def test_offline_no_cache(responses):
+    """Test that an error is raised in offline mode when there is no cache or registry snapshot"""
+    with pytest.raises(RuntimeError):
+        marble_client.MarbleClient(offline=True)
+    assert not responses.calls
+
+
+def test_offline_snapshot(responses, registry_snapshot, registry_content):
+    """Test that the registry snapshot is used in offline mode when there is no cache"""
+    client = marble_client.MarbleClient(offline=True)
+    assert not responses.calls
+    assert client.registry_uri == f"file://{os.path.realpath(registry_snapshot)}"
+    assert set(client.nodes) == set(registry_content)
+
+
+@pytest.mark.parametrize("conflict", ["first", "error"])
+def test_offline_snapshot_multiple_registries(responses, registry_snapshot, registry_content, conflict):
+    """Test that the registry snapshot is only used for the default registry"""
+    url = "https://registry.example.com/private_registry.json"
+    with pytest.raises(RuntimeError, match="Local registry cache not found"):
+        marble_client.MarbleClient(
+            registry_urls=[marble_client.constants.NODE_REGISTRY_URL, url], offline=True, conflict=conflict
+        )
+    client = marble_client.MarbleClient(registry_urls=[marble_client.constants.NODE_REGISTRY_URL], offline=True)
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_fallback_snapshot(responses, registry_snapshot, registry_content):
+    """Test that the registry snapshot is used when the registry cannot be accessed and there is no cache"""
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning):
+        client = marble_client.MarbleClient()
+    assert client.registry_uri == f"file://{os.path.realpath(registry_snapshot)}"
+    assert set(client.nodes) == set(registry_content)
+
+
+def test_check_nodes(client, responses):
+    """Test that check_nodes reports which nodes are online"""
+    online_node, offline_node, *others = client.nodes.values()
+    responses.get(online_node.url)
+    responses.get(offline_node.url, body=requests.exceptions.ConnectionError())
+    for node in others:
+        responses.get(node.url)
+    assert client.check_nodes(max_workers=2) == {
+        online_node.id: True,
+        offline_node.id: False,
+        **{node.id: True for node in others},
+    }
+    assert client.check_nodes([offline_node.id]) == {offline_node.id: False}
+
+
+def _add_stac_services(client):
+    nodes = list(client.nodes.values())
+    for i, node in enumerate(nodes):
+        service_json = {
+            "name": "stac",
+            "keywords": [],
+            "description": "",
+            "links": [{"rel": "service", "href": f"https://example.com/{i}/stac/"}],
+        }
+        node._services["stac"] = marble_client.MarbleService(service_json, node)
+    return nodes
+
+
+def test_search(client, responses):
+    """Test that search returns the results from all nodes, fastest node first"""
+    slow_node, *nodes = _add_stac_services(client)
+
+    def slow_search(request):
+        time.sleep(0.2)
+        return 200, {}, json.dumps({"features": [{"id": slow_node.id}]})
+
+    responses.add_callback(responses_.POST, slow_node["stac"].url + "search", callback=slow_search)
+    for node in nodes:
+        responses.post(node["stac"].url + "search", json={"features": [{"id": node.id}]})
+    results = list(client.search({"limit": 1}, timeout=5))
+    assert results[-1] == (slow_node.id, {"id": slow_node.id})
+    assert sorted(results) == sorted((node.id, {"id": node.id}) for node in [slow_node, *nodes])
+
+
+def test_search_failed_node(client, responses):
+    """Test that search skips nodes that fail or time out"""
+    failed_node, timeout_node, *nodes = _add_stac_services(client)
+    responses.post(failed_node["stac"].url + "search", status=500)
+    responses.post(timeout_node["stac"].url + "search", body=requests.exceptions.ReadTimeout())
+    for node in nodes:
+        responses.post(node["stac"].url + "search", json={"features": [{"id": node.id}]})
+    with pytest.warns(UserWarning) as record:
+        results = list(client.search({}, timeout=1))
+    assert len(record) == 2
+    assert results == [(node.id, {"id": node.id}) for node in nodes]
+
+
+def _changed_registry(registry_content):
+    """Return a copy of the registry without its first node and with a new node"""
+    first_id, *_ = registry_content
+    new_registry = {node_id: node for node_id, node in registry_content.items() if node_id != first_id}
+    new_registry["NewNode"] = {**registry_content[first_id], "name": "NewNode"}
+    return new_registry
+
+
+def test_refresh(client, responses, registry_content):
+    """Test that refresh replaces the nodes and that previously retrieved nodes are not modified"""
+    first_id, *_ = registry_content
+    old_node = client[first_id]
+    old_view = client.nodes
+    responses.replace(
+        responses_.GET, marble_client.constants.NODE_REGISTRY_URL, json=_changed_registry(registry_content)
+    )
+    client.refresh()
+    assert first_id not in client
+    assert client["NewNode"].name == "NewNode"
+    assert set(client.nodes) == set(_changed_registry(registry_content))
+    assert old_node.id == first_id
+    assert first_id in old_view
+    assert client.registry_uris == [marble_client.constants.NODE_REGISTRY_URL]
+
+
+def test_refresh_streaming_client(responses, registry_content):
+    client = marble_client.MarbleClient(stream=True)
+    responses.replace(
+        responses_.GET, marble_client.constants.NODE_REGISTRY_URL, json=_changed_registry(registry_content)
+    )
+    client.refresh()
+    assert set(client.nodes) == set(_changed_registry(registry_content))
+
+
+def test_refresh_fallback(client, responses, registry_content):
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning):
+        client.refresh()
+    assert set(client.nodes) == set(registry_content)
+
+
+@pytest.mark.jupyterlab_environment
+def test_this_node_after_refresh(client, responses, registry_content, first_url):
+    node = client.this_node
+    assert client.this_node is node
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, json=registry_content)
+    client.refresh()
+    assert client.this_node is not node
+    assert client.this_node.url == first_url
+
+
+def test_refresh_consistent_reads(client, responses, registry_content):
+    """Test that readers in other threads see either the old or the new registry while refreshing"""
+    versions = [set(registry_content), set(_changed_registry(registry_content))]
+    responses.replace(
+        responses_.GET, marble_client.constants.NODE_REGISTRY_URL, json=_changed_registry(registry_content)
+    )
+    stop = threading.Event()
+    seen = []
+
+    def read():
+        while not stop.is_set():
+            view = client.nodes
+            seen.append(set(view))
+            assert all(view[node_id].id == node_id for node_id in view)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        readers = [executor.submit(read) for _ in range(4)]
+        for _ in range(20):
+            client.refresh()
+        stop.set()
+        for reader in readers:
+            reader.result()
+    assert seen and all(nodes in versions for nodes in seen)
+
+
+def test_stream_concurrent_getitem(responses, registry_content):
+    """Test that nodes are constructed once when a streaming client is used from several threads"""
+    client = marble_client.MarbleClient(stream=True)
+    node_ids = list(registry_content)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        nodes = list(executor.map(lambda i: client[node_ids[i % len(node_ids)]], range(64)))
+    assert all(node is client[node.id] for node in nodes)
+    assert set(client.nodes) == set(registry_content)
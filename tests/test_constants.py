@@ -1,6 +1,8 @@
 import importlib
 import os
 
+import pytest
+
 import marble_client.constants
 
 
@@ -29,3 +31,98 @@ def test_cache_fname_settable(monkeypatch):
     monkeypatch.setenv("MARBLE_CACHE_DIR", other_value)
     importlib.reload(marble_client.constants)
     assert marble_client.constants.CACHE_FNAME == os.path.join(other_value, "registry.cached.json")
+
+
+def test_cache_compression_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_CACHE_COMPRESSION", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CACHE_COMPRESSION == "none"
+
+
+def test_cache_compression_settable(monkeypatch):
+    monkeypatch.setenv("MARBLE_CACHE_COMPRESSION", "GZIP")
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CACHE_COMPRESSION == "gzip"
+
+
+def test_node_registry_urls_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_NODE_REGISTRY_URLS", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.NODE_REGISTRY_URLS == [marble_client.constants.NODE_REGISTRY_URL]
+
+
+def test_node_registry_urls_settable(monkeypatch):
+    monkeypatch.setenv("MARBLE_NODE_REGISTRY_URLS", "value1 value2\nvalue3")
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.NODE_REGISTRY_URLS == ["value1", "value2", "value3"]
+
+
+def test_offline_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_OFFLINE", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.OFFLINE is False
+
+
+@pytest.mark.parametrize("value", ["1", "true", "True", "yes"])
+def test_offline_settable(monkeypatch, value):
+    monkeypatch.setenv("MARBLE_OFFLINE", value)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.OFFLINE is True
+
+
+def test_registry_snapshot_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_REGISTRY_SNAPSHOT", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.REGISTRY_SNAPSHOT == os.path.join(
+        os.path.dirname(marble_client.constants.__file__), "data", "registry.snapshot.json"
+    )
+
+
+def test_registry_snapshot_settable(monkeypatch):
+    other_value = "other_value"
+    monkeypatch.setenv("MARBLE_REGISTRY_SNAPSHOT", other_value)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.REGISTRY_SNAPSHOT == other_value
+
+
+def test_capabilities_ttl_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_CAPABILITIES_TTL", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CAPABILITIES_TTL == 3600
+
+
+def test_capabilities_ttl_settable(monkeypatch):
+    monkeypatch.setenv("MARBLE_CAPABILITIES_TTL", "60")
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CAPABILITIES_TTL == 60
+
+
+def test_node_rate_limits_default(monkeypatch):
+    for var in ("MARBLE_NODE_RATE_LIMIT", "MARBLE_NODE_RATE_BURST", "MARBLE_NODE_MAX_CONCURRENCY"):
+        monkeypatch.delenv(var, raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.NODE_RATE_LIMIT is None
+    assert marble_client.constants.NODE_RATE_BURST == 1
+    assert marble_client.constants.NODE_MAX_CONCURRENCY is None
+
+
+def test_node_rate_limits_settable(monkeypatch):
+    monkeypatch.setenv("MARBLE_NODE_RATE_LIMIT", "2.5")
+    monkeypatch.setenv("MARBLE_NODE_RATE_BURST", "5")
+    monkeypatch.setenv("MARBLE_NODE_MAX_CONCURRENCY", "3")
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.NODE_RATE_LIMIT == 2.5
+    assert marble_client.constants.NODE_RATE_BURST == 5
+    assert marble_client.constants.NODE_MAX_CONCURRENCY == 3
+
+
+def test_cache_url_default(monkeypatch):
+    monkeypatch.delenv("MARBLE_CACHE_URL", raising=False)
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CACHE_URL == ""
+
+
+def test_cache_url_settable(monkeypatch):
+    monkeypatch.setenv("MARBLE_CACHE_URL", "redis://localhost:6379/0")
+    importlib.reload(marble_client.constants)
+    assert marble_client.constants.CACHE_URL == "redis://localhost:6379/0"
@@ -0,0 +1,139 @@
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+import responses as responses_
+
+from marble_client.login import login_nodes, login_widget
+
+
+def signin_url(node):
+    return node.url.rstrip("/") + "/magpie/signin"
+
+
+def add_signin(responses, node, status=200, delay=0):
+    def callback(request):
+        time.sleep(delay)
+        if status == 200:
+            return status, {"Set-Cookie": f"{node.id}=cookie"}, '{"detail": "Login successful"}'
+        return status, {}, '{"detail": "Bad credentials"}'
+
+    responses.add_callback(responses_.POST, signin_url(node), callback=callback)
+
+
+@pytest.fixture
+def stdin_credentials(monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda *a, **kw: "test")
+    monkeypatch.setattr("getpass.getpass", lambda *a, **kw: "testpass")
+
+
+def test_login_nodes_concurrent(client, responses):
+    nodes = list(client.nodes.values())
+    for node in nodes:
+        add_signin(responses, node, delay=0.2)
+    session = requests.Session()
+    completed = []
+    start = time.perf_counter()
+    results = login_nodes(nodes, session, "test", "testpass", on_result=lambda node_id, _: completed.append(node_id))
+    assert time.perf_counter() - start < 0.2 * len(nodes)
+    assert results == {node.id: "Login successful" for node in nodes}
+    assert sorted(completed) == sorted(node.id for node in nodes)
+    assert session.cookies.get_dict() == {node.id: "cookie" for node in nodes}
+
+
+def test_login_nodes_errors(client, responses):
+    ok, failed, offline = client.nodes.values()
+    add_signin(responses, ok)
+    add_signin(responses, failed, status=401)
+    responses.post(signin_url(offline), body=requests.exceptions.ConnectionError())
+    results = login_nodes([ok, failed, offline], requests.Session(), "test", "testpass")
+    assert results[ok.id] == "Login successful"
+    assert str(results[failed.id]) == "Bad credentials"
+    assert isinstance(results[offline.id], requests.exceptions.ConnectionError)
+
+
+def test_login_nodes_missing_credentials(client, responses):
+    results = login_nodes(list(client.nodes.values()), requests.Session(), "", "testpass")
+    assert all(str(result) == "Username or email is required" for result in results.values())
+    assert not [call for call in responses.calls if call.request.url.endswith("/magpie/signin")]
+
+
+def test_client_login_stdin(client, responses, stdin_credentials, capsys):
+    nodes = list(client.nodes.values())[:2]
+    for node in nodes:
+        add_signin(responses, node)
+    session = client.login([node.id for node in nodes], input_type="stdin")
+    assert session.cookies.get_dict() == {node.id: "cookie" for node in nodes}
+    assert capsys.readouterr().out.splitlines() == [f"{node.id}: Login successful" for node in nodes]
+
+
+def test_client_login_stdin_session(client, responses, stdin_credentials):
+    node = next(iter(client.nodes.values()))
+    add_signin(responses, node)
+    session = requests.Session()
+    assert client.login([node.id], session=session, input_type="stdin") is session
+    assert session.cookies.get_dict() == {node.id: "cookie"}
+
+
+def test_client_login_requires_nodes(client):
+    """Test that credentials are never sent to every node of the network by default"""
+    with pytest.raises(TypeError):
+        client.login(input_type="stdin")
+
+
+def test_client_login_stdin_failure(client, responses, stdin_credentials, capsys):
+    ok, failed, _ = client.nodes.values()
+    add_signin(responses, ok)
+    add_signin(responses, failed, status=401)
+    with pytest.raises(RuntimeError, match=f"Unable to log in to {failed.id}: Bad credentials"):
+        client.login([ok.id, failed.id], input_type="stdin")
+    assert capsys.readouterr().out.strip() == f"{ok.id}: Login successful"
+
+
+def test_client_login_invalid_input_type(client):
+    with pytest.raises(TypeError):
+        client.login(list(client.nodes), input_type="other")
+
+
+def test_client_login_widget_display(client, capsys):
+    with patch("marble_client.client.check_rich_output_shell", return_value=True):
+        client.login(list(client.nodes))
+    assert capsys.readouterr().out.startswith("VBox")
+
+
+def wait_for_logins(login_button, timeout=5):
+    deadline = time.monotonic() + timeout
+    while login_button.disabled and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_login_widget_background(client, responses, capsys):
+    """Test that clicking login returns immediately and that the status of each node is shown when it completes"""
+    nodes = list(client.nodes.values())
+    add_signin(responses, nodes[0], delay=0.2)
+    add_signin(responses, nodes[1], status=401)
+    session = requests.Session()
+    form = login_widget(nodes, session, selectable=True)
+    node_select, _, username_input, _, password_input, login_button, progress, status = form.children
+    assert node_select.value == ()
+    node_select.value = [nodes[0].id, nodes[1].id]
+    username_input.value = "test"
+    password_input.value = "testpass"
+    start = time.perf_counter()
+    login_button.click()
+    assert time.perf_counter() - start < 0.2
+    assert login_button.disabled
+    wait_for_logins(login_button)
+    assert progress.value == 2
+    labels = {label.value: label.style.text_color for label in status.children}
+    assert labels == {f"{nodes[0].id}: Login successful": "green", f"{nodes[1].id}: Bad credentials": "red"}
+    assert session.cookies.get_dict() == {nodes[0].id: "cookie"}
+
+
+def test_login_widget_no_selection(client, responses, capsys):
+    form = login_widget(list(client.nodes.values()), requests.Session(), selectable=True)
+    node_select, *_, login_button, _, status = form.children
+    login_button.click()
+    assert not login_button.disabled
+    assert [label.value for label in status.children] == ["Select at least one node"]
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import requests
+import responses as responses_
+
+import marble_client
+
+
+@pytest.fixture
+def collector():
+    yield marble_client.InMemoryCollector()
+
+
+@pytest.fixture
+def instrumented_client(collector):
+    yield marble_client.MarbleClient(collectors=[collector])
+
+
+def test_registry_request_recorded(instrumented_client, collector):
+    (record,) = collector.records
+    assert record.operation == "registry"
+    assert record.method == "GET"
+    assert record.url == marble_client.constants.NODE_REGISTRY_URL
+    assert record.status == 200
+    assert record.bytes > 0
+    assert record.duration >= 0
+    assert record.error is None
+
+
+@pytest.mark.load_from_cache
+def test_cache_hit_recorded(collector):
+    with pytest.warns(UserWarning):
+        marble_client.MarbleClient(collectors=[collector])
+    assert [(r.operation, r.status, r.cache) for r in collector.records] == [
+        ("registry", 500, None),
+        ("registry_cache", None, "hit"),
+    ]
+
+
+def test_cache_miss_recorded(collector, responses):
+    responses.replace(responses_.GET, marble_client.constants.NODE_REGISTRY_URL, status=500)
+    with pytest.warns(UserWarning), pytest.raises(RuntimeError):
+        marble_client.MarbleClient(collectors=[collector])
+    assert collector.records[-1].cache == "miss"
+
+
+def test_is_online_recorded(instrumented_client, collector, responses):
+    node = next(iter(instrumented_client.nodes.values()))
+    responses.get(node.url)
+    collector.clear()
+    node.is_online()
+    (record,) = collector.records
+    assert (record.operation, record.node_id, record.url, record.status) == ("is_online", node.id, node.url, 200)
+
+
+def test_error_recorded(instrumented_client, collector, responses):
+    node = next(iter(instrumented_client.nodes.values()))
+    responses.get(node.url, body=requests.exceptions.ConnectionError())
+    collector.clear()
+    assert not node.is_online()
+    (record,) = collector.records
+    assert record.error == "ConnectionError"
+    assert record.status is None
+
+
+def test_stats(instrumented_client, responses):
+    node = next(iter(instrumented_client.nodes.values()))
+    responses.get(node.url, status=500)
+    node.is_online()
+    node.is_online()
+    stats = instrumented_client.stats()
+    assert stats["registry"]["count"] == 1
+    assert stats["registry"]["errors"] == 0
+    assert stats["is_online"]["count"] == 2
+    assert stats["is_online"]["errors"] == 2
+    assert stats["is_online"]["mean_duration"] == stats["is_online"]["total_duration"] / 2
+
+
+def test_shared_recorded(instrumented_client, collector, responses):
+    """Test that callers that reuse the response of a concurrent identical request get a shared record"""
+    node = next(iter(instrumented_client.nodes.values()))
+    collector.clear()
+    barrier = threading.Barrier(4)
+
+    def callback(request):
+        time.sleep(0.2)
+        return 200, {}, b""
+
+    responses.add_callback(responses_.GET, node.url, callback=callback)
+
+    def is_online():
+        barrier.wait()
+        return node.is_online()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(executor.map(lambda _: is_online(), range(4)))
+    assert sorted(record.shared for record in collector.records) == [False, True, True, True]
+    assert all(record.status == 200 for record in collector.records)
+    assert instrumented_client.stats()["is_online"]["shared"] == 3
+
+
+def test_stats_only(responses):
+    client = marble_client.MarbleClient(collectors=[])
+    assert client.stats()["registry"]["count"] == 1
+
+
+def test_not_instrumented(client):
+    """Test that no records are created and no statistics are collected when instrumentation is disabled"""
+    node = next(iter(client.nodes.values()))
+    with patch("marble_client.transport.RequestRecord", side_effect=AssertionError):
+        node.is_online()
+    assert client.stats() == {}
+    assert client.collectors == []
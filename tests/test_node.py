@@ -1,8 +1,12 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, patch
 
 import dateutil.parser
 import pytest
 import requests
+import responses as responses_
 
 import marble_client
 
@@ -22,6 +26,55 @@ def test_is_online_offline(node, responses):
     assert not node.is_online()
 
 
+def slow_callback(status=200, body=b""):
+    def callback(request):
+        time.sleep(0.2)
+        if isinstance(body, Exception):
+            raise body
+        return status, {}, body
+
+    return callback
+
+
+def call_concurrently(func, n=8):
+    barrier = threading.Barrier(n)
+
+    def call():
+        barrier.wait()
+        return func()
+
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        futures = [executor.submit(call) for _ in range(n)]
+    return [future.result() for future in futures]
+
+
+def test_is_online_concurrent_requests_coalesced(node, responses):
+    """Test that concurrent identical requests are sent once and share the response"""
+    responses.add_callback(responses_.GET, node.url, callback=slow_callback())
+    assert call_concurrently(node.is_online) == [True] * 8
+    assert len([call for call in responses.calls if call.request.url.startswith(node.url)]) == 1
+
+
+def test_is_online_concurrent_errors_shared(node, responses):
+    responses.add_callback(responses_.GET, node.url, callback=slow_callback(body=requests.exceptions.ConnectionError()))
+    assert call_concurrently(node.is_online) == [False] * 8
+    assert len([call for call in responses.calls if call.request.url.startswith(node.url)]) == 1
+
+
+def test_is_online_sequential_requests_not_coalesced(node, responses):
+    responses.get(node.url)
+    node.is_online()
+    node.is_online()
+    assert len([call for call in responses.calls if call.request.url.startswith(node.url)]) == 2
+
+
+def test_is_online_coalescing_disabled(node, responses):
+    node._client._transport = marble_client.transport.Transport(coalesce=False)
+    responses.add_callback(responses_.GET, node.url, callback=slow_callback())
+    assert call_concurrently(node.is_online, n=4) == [True] * 4
+    assert len([call for call in responses.calls if call.request.url.startswith(node.url)]) == 4
+
+
 def test_id(node, registry_content):
     assert node.id in registry_content
 
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+
+import marble_client
+from marble_client import nodeview
+from marble_client.nodeview import _parse_version, _version_matcher
+
+
+def make_node(client, node_id, version="2.4.0", affiliation="Aff", location=None, services=()):
+    node_json = {
+        "name": node_id,
+        "version": version,
+        "affiliation": affiliation,
+        "links": [],
+        "services": [{"name": service, "keywords": [], "description": "", "links": []} for service in services],
+    }
+    if location is not None:
+        node_json["location"] = {"longitude": location[0], "latitude": location[1]}
+    return marble_client.MarbleNode(node_id, node_json, client)
+
+
+@pytest.fixture
+def nodes(client):
+    nodes = [
+        make_node(client, "a", "2.3.1", "Aff A", (-79.4, 43.7), ["thredds", "stac"]),
+        make_node(client, "b", "2.4.0", "Aff B", (-73.6, 45.5), ["thredds"]),
+        make_node(client, "c", "2.10", "Aff A", (179.5, -10.0), ["stac", "weaver"]),
+        make_node(client, "d", "unknown", "Aff B", None, ["thredds", "stac"]),
+    ]
+    yield marble_client.NodeView({node.id: node for node in nodes})
+
+
+@pytest.mark.parametrize(
+    ("version", "expected"), [("2.4.1", (2, 4, 1)), ("v2.4", (2, 4)), ("2.4.1-rc1", (2, 4, 1)), ("unknown", None)]
+)
+def test_parse_version(version, expected):
+    assert _parse_version(version) == expected
+
+
+@pytest.mark.parametrize(
+    ("spec", "version", "expected"),
+    [
+        (">=2.4", (2, 4, 0), True),
+        (">=2.4", (2, 3, 9), False),
+        (">2.4", (2, 4, 0), False),
+        ("<3", (2, 10), True),
+        ("2.4", (2, 4, 0), True),
+        ("==2.4.1", (2, 4), False),
+        ("!=2.4", (2, 4, 0), False),
+        (">=2.4, <2.5", (2, 4, 9), True),
+        (">=2.4, <2.5", (2, 5), False),
+    ],
+)
+def test_version_matcher(spec, version, expected):
+    assert _version_matcher(spec)(version) is expected
+
+
+@pytest.mark.parametrize("spec", ["", ">=", "~=2.4", "2.4 or 2.5", ">=2.4,"])
+def test_invalid_version_spec(nodes, spec):
+    with pytest.raises(ValueError):
+        nodes.filter(version=spec)
+
+
+def test_view_is_mapping(nodes):
+    assert list(nodes) == ["a", "b", "c", "d"]
+    assert len(nodes) == 4
+    assert nodes["a"].id == "a"
+    assert "e" not in nodes
+    assert dict(nodes) == {node_id: nodes[node_id] for node_id in "abcd"}
+    assert repr(nodes) == repr(dict(nodes))
+
+
+def test_filter_version(nodes):
+    assert list(nodes.filter(version=">=2.4")) == ["b", "c"]
+    assert list(nodes.filter(version="<2.4")) == ["a"]
+
+
+def test_filter_has_service(nodes):
+    assert list(nodes.filter(has_service="thredds")) == ["a", "b", "d"]
+    assert list(nodes.filter(has_service=["thredds", "stac"])) == ["a", "d"]
+    assert list(nodes.filter(has_service="other")) == []
+
+
+def test_filter_affiliation(nodes):
+    assert list(nodes.filter(affiliation="Aff A")) == ["a", "c"]
+
+
+def test_filter_bbox(nodes):
+    assert list(nodes.filter(bbox=(-80, 40, -70, 50))) == ["a", "b"]
+    assert list(nodes.filter(bbox=(-75, 40, -70, 50))) == ["b"]
+
+
+def test_filter_bbox_antimeridian(nodes):
+    assert list(nodes.filter(bbox=(170, -20, -170, 0))) == ["c"]
+
+
+def test_filter_combined(nodes):
+    view = nodes.filter(version=">=2.4", has_service="thredds")
+    assert list(view) == ["b"]
+    assert list(nodes.filter(has_service="stac").filter(affiliation="Aff A")) == ["a", "c"]
+
+
+def test_filtered_view_is_mapping(nodes):
+    view = nodes.filter(has_service="stac")
+    assert len(view) == 3
+    assert "b" not in view
+    assert view["a"] is nodes["a"]
+    with pytest.raises(KeyError):
+        view["b"]
+    assert list(view.values()) == [nodes["a"], nodes["c"], nodes["d"]]
+
+
+def test_filter_is_lazy(nodes, monkeypatch):
+    """Test that filters are only evaluated once, when the contents of a view are accessed"""
+    calls = []
+    select_services = nodes._columns.select_services
+    monkeypatch.setattr(
+        nodes._columns, "select_services", lambda services: calls.append(1) or select_services(services)
+    )
+    view = nodes.filter(has_service="stac")
+    assert not calls
+    assert len(view) == 3
+    assert list(view) == ["a", "c", "d"]
+    assert len(calls) == 1
+
+
+def test_filtered_view_shared_between_threads(nodes, monkeypatch):
+    """Test that a thread never sees a view whose contents are only partly evaluated by another thread"""
+
+    def slow_frozenset(*args):
+        time.sleep(0.05)
+        return frozenset(*args)
+
+    monkeypatch.setattr(nodeview, "frozenset", slow_frozenset, raising=False)
+    view = nodes.filter(has_service="stac")
+    evaluating = threading.Thread(target=len, args=(view,))
+    evaluating.start()
+    time.sleep(0.01)
+    assert "a" in view
+    assert view["a"] is nodes["a"]
+    evaluating.join()
+
+
+def test_client_nodes_filter(client, registry_content):
+    """Test that filtering client.nodes gives the same result as checking every node"""
+    service = next(service["name"] for node in registry_content.values() for service in node["services"])
+    expected = [
+        node_id
+        for node_id, node in registry_content.items()
+        if any(service_json["name"] == service for service_json in node["services"])
+    ]
+    assert list(client.nodes.filter(has_service=service)) == expected
+    assert client.nodes is client.nodes
@@ -0,0 +1,79 @@
+from unittest.mock import Mock
+
+import pytest
+
+import marble_client
+from marble_client import prefetch
+
+
+@pytest.fixture(autouse=True)
+def reset_prefetch():
+    yield
+    # wait for background requests so that they don't outlive the mocked responses
+    for future in prefetch._futures.values():
+        future.exception()
+    prefetch._futures.clear()
+
+
+def registry_calls(responses):
+    return [call for call in responses.calls if call.request.url == marble_client.constants.NODE_REGISTRY_URL]
+
+
+def hub_calls(responses):
+    return [call for call in responses.calls if "/users/" in call.request.url]
+
+
+def test_not_in_jupyter_env(responses):
+    assert not prefetch.start()
+    marble_client.load_ipython_extension(Mock())
+    assert not prefetch._futures
+    assert prefetch.take_registry() is None
+    assert prefetch.take_session_cookies() is None
+
+
+@pytest.mark.jupyterlab_environment
+def test_prefetched_registry(responses, registry_content, first_url):
+    assert prefetch.start()
+    assert prefetch.start()  # already started
+    prefetch._futures["registry"].result()
+    client = marble_client.MarbleClient()
+    assert "registry" not in prefetch._futures
+    assert len(registry_calls(responses)) == 1
+    assert set(client.nodes) == set(registry_content)
+    assert all(node._client is client for node in client.nodes.values())
+    assert "_nodes_by_hostname" in vars(client._snapshot)  # already built for this_node
+    assert client.this_node.url == first_url
+    assert client.registry_uri == marble_client.constants.NODE_REGISTRY_URL
+    # prefetched values are only used once
+    marble_client.MarbleClient()
+    assert len(registry_calls(responses)) == 2
+
+
+@pytest.mark.jupyterlab_environment
+def test_prefetched_registry_other_options(responses):
+    prefetch.start()
+    prefetch._futures["registry"].result()
+    marble_client.MarbleClient(stream=True).nodes
+    assert len(registry_calls(responses)) == 2
+    assert prefetch.take_registry() is not None
+
+
+@pytest.mark.jupyterlab_environment(cookies={"auth_example": "cookie_example"})
+def test_prefetched_session(responses):
+    marble_client.load_ipython_extension(Mock())
+    client = marble_client.MarbleClient()
+    session = client.this_session()
+    assert session.cookies.get_dict() == {"auth_example": "cookie_example"}
+    assert len(hub_calls(responses)) == 1
+    client.this_session()
+    assert len(hub_calls(responses)) == 2
+
+
+@pytest.mark.jupyterlab_environment(jupyterhub_api_response_status_code=500)
+def test_prefetch_failed(responses):
+    """Test that the cookies are requested again if prefetching them failed"""
+    prefetch.start()
+    assert prefetch._futures["session_cookies"].exception() is not None
+    with pytest.raises(marble_client.JupyterEnvironmentError):
+        marble_client.MarbleClient().this_session()
+    assert len(hub_calls(responses)) == 2
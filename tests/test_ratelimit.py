@@ -0,0 +1,158 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import requests
+
+import marble_client
+from marble_client.ratelimit import NodeLimiter, TokenBucket
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"rate": 0}, {"rate": -1}, {"burst": 0}, {"max_concurrency": 0}], ids=lambda x: str(x)
+)
+def test_invalid_rate_limit(kwargs):
+    with pytest.raises(ValueError):
+        marble_client.RateLimit(**kwargs)
+
+
+def test_rate_limit_unlimited():
+    assert marble_client.RateLimit().unlimited
+    assert not marble_client.RateLimit(rate=1).unlimited
+    assert not marble_client.RateLimit(max_concurrency=1).unlimited
+
+
+def test_token_bucket_burst():
+    """Test that up to `burst` tokens are available immediately and that later tokens are spaced by 1/rate"""
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    assert [bucket.acquire() for _ in range(2)] == [0, 0]
+    assert bucket.acquire() == pytest.approx(0.05, abs=0.01)
+    assert bucket.acquire() == pytest.approx(0.05, abs=0.01)
+    assert time.monotonic() - start >= 0.1
+
+
+def test_node_limiter_max_concurrency():
+    limiter = NodeLimiter(marble_client.RateLimit(max_concurrency=2))
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def work(_):
+        nonlocal active, max_active
+        limiter.acquire()
+        try:
+            with lock:
+                active += 1
+                max_active = max(max_active, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+        finally:
+            limiter.release()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(work, range(12)))
+    assert max_active == 2
+
+
+@pytest.fixture
+def collector():
+    yield marble_client.InMemoryCollector()
+
+
+def request_node(client, node, n, responses):
+    """Send n distinct requests to node concurrently (distinct so that they are not coalesced)"""
+    responses.get(node.url)
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        list(
+            executor.map(
+                lambda i: client._transport.request("GET", f"{node.url}?i={i}", operation="test", node_id=node.id),
+                range(n),
+            )
+        )
+
+
+def test_node_rate_limit(client, collector, responses):
+    """Test that a per-node limit only applies to that node and that queueing delays are recorded"""
+    limited, unlimited, *_ = client.nodes.values()
+    client = marble_client.MarbleClient(
+        collectors=[collector], node_rate_limits={limited.id: marble_client.RateLimit(rate=20, max_concurrency=1)}
+    )
+    collector.clear()
+    request_node(client, client[limited.id], 4, responses)
+    request_node(client, client[unlimited.id], 4, responses)
+    assert [record.queue_delay for record in collector.records if record.node_id == unlimited.id] == [None] * 4
+    delays = sorted(record.queue_delay for record in collector.records if record.node_id == limited.id)
+    assert delays[0] == pytest.approx(0, abs=0.01)
+    assert delays[-1] >= 0.1
+    stats = client.stats()["test"]
+    assert stats["max_queue_delay"] == delays[-1]
+    assert stats["total_queue_delay"] == pytest.approx(sum(delays))
+
+
+def test_default_rate_limit(monkeypatch, collector, responses):
+    """Test that the rate limit applies to all nodes by default"""
+    monkeypatch.setattr(marble_client.client, "NODE_RATE_LIMIT", 10)
+    client = marble_client.MarbleClient(collectors=[collector])
+    assert client._transport.rate_limit == marble_client.RateLimit(rate=10)
+    node = next(iter(client.nodes.values()))
+    collector.clear()
+    request_node(client, node, 2, responses)
+    assert max(record.queue_delay for record in collector.records) >= 0.08
+
+
+def test_registry_requests_not_limited(collector, responses):
+    marble_client.MarbleClient(collectors=[collector], rate_limit=marble_client.RateLimit(rate=1, max_concurrency=1))
+    assert collector.records[0].queue_delay is None
+
+
+def test_streamed_request_limited_until_closed(client, responses):
+    """Test that a streamed request counts towards max_concurrency until its response is closed"""
+    node = next(iter(client.nodes.values()))
+    responses.get(node.url, body=b"data")
+    client = marble_client.MarbleClient(rate_limit=marble_client.RateLimit(max_concurrency=1))
+    first = client._transport.request("GET", node.url, operation="fetch", node_id=node.id, stream=True)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        second = executor.submit(
+            client._transport.request, "GET", node.url, operation="fetch", node_id=node.id, stream=True
+        )
+        time.sleep(0.1)
+        assert not second.done()
+        with first:
+            assert first.content == b"data"
+        second.result(timeout=1).close()
+    first.close()  # closing again does not release the limit twice
+
+
+def test_fetch_downloads_limited(client, responses, tmp_path):
+    """Test that max_concurrency limits the number of files downloaded from a node at the same time"""
+    client = marble_client.MarbleClient(rate_limit=marble_client.RateLimit(max_concurrency=1))
+    node = next(iter(client.nodes.filter(has_service="thredds").values()))
+    url = f"{node['thredds'].url.rstrip('/')}/data.nc"
+    responses.get(url, body=b"data")
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def iter_content(response, chunk_size):
+        nonlocal active, max_active
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        yield response.raw.read()
+
+    with patch.object(requests.Response, "iter_content", iter_content):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(
+                executor.map(
+                    lambda i: client.fetch("data.nc", destination=str(tmp_path / f"data{i}.nc"), hedge_after=10),
+                    range(4),
+                )
+            )
+    assert max_active == 1
@@ -0,0 +1,213 @@
+import os
+import time
+
+import pytest
+import requests
+import responses as responses_
+
+import marble_client
+from marble_client.replicas import CircuitBreaker, NodeHealth
+
+PATH = "fileServer/birdhouse/data.nc"
+
+
+def file_url(node, service="thredds"):
+    return f"{node[service].url.rstrip('/')}/{PATH}"
+
+
+def slow_callback(delay, body=b"data"):
+    def callback(request):
+        time.sleep(delay)
+        return 200, {}, body
+
+    return callback
+
+
+def calls_to(responses, node):
+    return [call for call in responses.calls if call.request.url == file_url(node)]
+
+
+@pytest.fixture
+def ranked_nodes(client):
+    """Return the nodes of the client, ordered from fastest to slowest according to their latency estimates"""
+    nodes = list(client.nodes.values())
+    for i, node in enumerate(nodes):
+        client._health.record_success(node.id, 0.01 * (i + 1))
+    yield nodes
+
+
+def test_circuit_breaker_opens_after_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial request
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_node_health_latency_average():
+    health = NodeHealth(smoothing=0.5)
+    assert health.latency("a") is None
+    health.record_success("a", 1.0)
+    health.record_success("a", 3.0)
+    assert health.latency("a") == 2.0
+
+
+def test_node_health_rank(client):
+    fast, slow, unmeasured = client.nodes.values()
+    health = NodeHealth(failure_threshold=1)
+    health.record_success(fast.id, 0.1)
+    health.record_success(slow.id, 0.5)
+    assert health.rank([slow, fast, unmeasured]) == [unmeasured, fast, slow]
+    health.record_failure(fast.id)
+    assert health.rank([slow, fast, unmeasured]) == [unmeasured, slow]
+
+
+def test_node_health_rank_does_not_reserve_trial(client):
+    """Test that ranking half-open nodes that are not requested does not exclude them from later rankings"""
+    nodes = list(client.nodes.values())
+    health = NodeHealth(failure_threshold=1, reset_timeout=0.05)
+    for node in nodes:
+        health.record_failure(node.id)
+    time.sleep(0.06)
+    assert health.rank(nodes) == health.rank(nodes) == nodes
+    assert all(health.state(node.id) == "half-open" for node in nodes)
+    assert health.allow(nodes[0].id)
+    assert health.rank(nodes) == nodes[1:]
+
+
+def test_is_online_records_latency(node, responses):
+    responses.get(node.url)
+    node.is_online()
+    assert node._client._health.latency(node.id) is not None
+
+
+def test_is_online_records_failure(node, responses):
+    responses.get(node.url, status=500)
+    for _ in range(3):
+        node.is_online()
+    assert node._client._health.state(node.id) == "open"
+
+
+def test_fetch_fastest_node(client, ranked_nodes, responses, tmp_path):
+    fast, *others = ranked_nodes
+    for node in ranked_nodes:
+        responses.get(file_url(node), body=node.id.encode())
+    destination = str(tmp_path / "data.nc")
+    assert client.fetch(PATH, destination=destination) == destination
+    with open(destination, "rb") as f:
+        assert f.read() == fast.id.encode()
+    assert len(calls_to(responses, fast)) == 1
+    assert not any(calls_to(responses, node) for node in others)
+    assert os.listdir(tmp_path) == ["data.nc"]
+
+
+def test_fetch_default_destination(client, ranked_nodes, responses, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    responses.get(file_url(ranked_nodes[0]), body=b"data")
+    assert client.fetch(PATH) == "data.nc"
+    assert (tmp_path / "data.nc").read_bytes() == b"data"
+
+
+def test_fetch_hedged(client, ranked_nodes, responses, tmp_path):
+    """Test that the next best node is requested if the best node is slow and that the fastest response is used"""
+    slow, fast, unused = ranked_nodes
+    started = []
+    slow_response = slow_callback(0.5, b"slow")
+    responses.add_callback(responses_.GET, file_url(slow), callback=lambda r: started.append(1) or slow_response(r))
+    responses.add_callback(responses_.GET, file_url(fast), callback=slow_callback(0, b"fast"))
+    destination = str(tmp_path / "data.nc")
+    start = time.perf_counter()
+    client.fetch(PATH, destination=destination, hedge_after=0.05)
+    assert time.perf_counter() - start < 0.4
+    with open(destination, "rb") as f:
+        assert f.read() == b"fast"
+    assert started
+    assert not calls_to(responses, unused)
+
+
+def test_fetch_not_hedged_when_fast(client, ranked_nodes, responses, tmp_path):
+    best, *others = ranked_nodes
+    responses.add_callback(responses_.GET, file_url(best), callback=slow_callback(0.05))
+    client.fetch(PATH, destination=str(tmp_path / "data.nc"), hedge_after=0.5)
+    assert not any(calls_to(responses, node) for node in others)
+
+
+def test_fetch_failover(client, ranked_nodes, responses, tmp_path):
+    """Test that the next best node is used if a node returns an error"""
+    broken, missing, working = ranked_nodes
+    responses.get(file_url(broken), status=500)
+    responses.get(file_url(missing), status=404)
+    responses.get(file_url(working), body=b"data")
+    destination = str(tmp_path / "data.nc")
+    client.fetch(PATH, destination=destination)
+    with open(destination, "rb") as f:
+        assert f.read() == b"data"
+    # server errors count towards opening the circuit, client errors do not
+    assert client._health._breakers[broken.id]._failures == 1
+    assert client._health._breakers[missing.id]._failures == 0
+
+
+def test_fetch_skips_open_circuit(client, ranked_nodes, responses, tmp_path):
+    broken, working, _ = ranked_nodes
+    for _ in range(client._health.failure_threshold):
+        client._health.record_failure(broken.id)
+    responses.get(file_url(working), body=b"data")
+    client.fetch(PATH, destination=str(tmp_path / "data.nc"))
+    assert not calls_to(responses, broken)
+
+
+def test_fetch_half_open_nodes_not_requested(client, ranked_nodes, responses, tmp_path):
+    """Test that half-open nodes that were ranked but not requested by a fetch are still used by later fetches"""
+    first, second, third = ranked_nodes
+    for node in ranked_nodes:
+        client._health._breaker(node.id).reset_timeout = 0.05
+        for _ in range(client._health.failure_threshold):
+            client._health.record_failure(node.id)
+    time.sleep(0.06)
+    responses.get(file_url(first), body=b"data")
+    client.fetch(PATH, destination=str(tmp_path / "data.nc"))
+    assert client._health.state(first.id) == "closed"
+    assert client._health.state(third.id) == "half-open"
+    responses.get(file_url(first), status=404)
+    responses.get(file_url(second), status=404)
+    responses.get(file_url(third), body=b"data")
+    client.fetch(PATH, destination=str(tmp_path / "data.nc"))
+    assert len(calls_to(responses, third)) == 1
+    assert client._health.state(third.id) == "closed"
+
+
+def test_fetch_all_failed(client, ranked_nodes, responses, tmp_path):
+    for node in ranked_nodes:
+        responses.get(file_url(node), body=requests.exceptions.ConnectionError())
+    with pytest.raises(RuntimeError, match="Could not fetch"):
+        client.fetch(PATH, destination=str(tmp_path / "data.nc"))
+    assert os.listdir(tmp_path) == []
+
+
+def test_fetch_unknown_service(client, tmp_path):
+    with pytest.raises(marble_client.ServiceNotAvailableError):
+        client.fetch(PATH, service="other", destination=str(tmp_path / "data.nc"))
+
+
+def test_fetch_uses_session(client, ranked_nodes, responses, tmp_path):
+    session = requests.Session()
+    session.headers["Authorization"] = "Bearer token"
+    responses.get(file_url(ranked_nodes[0]), body=b"data")
+    client.fetch(PATH, destination=str(tmp_path / "data.nc"), session=session)
+    assert calls_to(responses, ranked_nodes[0])[0].request.headers["Authorization"] == "Bearer token"
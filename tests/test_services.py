@@ -1,3 +1,9 @@
+import pytest
+from responses import matchers
+
+import marble_client
+
+
 def test_name(service, service_json):
     assert service.name == service_json["name"]
 
@@ -20,3 +26,38 @@ def test_doc_url(service, service_json):
 
 def test_repr(service, service_json):
     assert repr(service) == next(link["href"] for link in service_json["links"] if link["rel"] == "service")
+
+
+@pytest.fixture
+def stac_service(node):
+    service_json = {
+        "name": "stac",
+        "keywords": ["catalog"],
+        "description": "",
+        "links": [{"rel": "service", "href": "https://example.com/stac/"}],
+    }
+    yield marble_client.MarbleService(service_json, node)
+
+
+def test_search(stac_service, responses):
+    query = {"collections": ["example"], "limit": 2}
+    features = [{"id": "a"}, {"id": "b"}]
+    responses.post(
+        "https://example.com/stac/search",
+        json={"type": "FeatureCollection", "features": features},
+        match=[matchers.json_params_matcher(query)],
+    )
+    assert stac_service.search(query, timeout=5) == features
+    assert responses.calls[-1].request.req_kwargs["timeout"] == 5
+
+
+def test_search_invalid_results(stac_service, responses):
+    responses.post("https://example.com/stac/search", json={"type": "Collection"})
+    with pytest.raises(RuntimeError):
+        stac_service.search({})
+
+
+def test_search_not_stac(node):
+    service_json = {"name": "thredds", "keywords": [], "description": "", "links": []}
+    with pytest.raises(ValueError):
+        marble_client.MarbleService(service_json, node).search({})